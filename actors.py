@@ -0,0 +1,102 @@
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+HOT_GAMES = 1000  # games whose contention counts are kept
+POST_WORKERS = 4  # threads running the tasks handed over with post()
+
+
+class GameActors:
+    # Runs the work for each game one task at a time, in the order it was
+    # submitted, without a global lock; callers that need Telegram's order
+    # submit from one thread per chat (see lanes.py). A busy game has a mailbox: the thread that finds the game
+    # idle becomes its runner and drains the mailbox, threads arriving meanwhile
+    # only enqueue and return. Different games run in parallel on whichever
+    # threads submitted them, and a task may submit more work for its own game
+    # (it runs right after) without deadlocking.
+
+    def __init__(self, hot_games=HOT_GAMES, workers=POST_WORKERS):
+        self.hot_games = hot_games
+        self.submitted = 0
+        self.contended = 0   # tasks that had to wait behind another one
+        self.max_depth = 0
+        self.failed = 0
+        self._mailboxes = {}  # game_id -> deque of waiting (fn, args)
+        self._contention = Counter()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='actor')
+
+    def submit(self, game_id, fn, *args):
+        # Returns True if the task ran on this thread before returning.
+        if self._enqueue(game_id, fn, args):
+            return False
+        self._drain(game_id, fn, args)
+        return True
+
+    def post(self, game_id, fn, *args):
+        # Like submit, but an idle game's task runs on the actors' own threads,
+        # never the caller's: for threads that serve many games (the engine
+        # pool's result thread, the timer wheel) and must not do one's work.
+        if not self._enqueue(game_id, fn, args):
+            self._executor.submit(self._drain, game_id, fn, args)
+
+    def _enqueue(self, game_id, fn, args):
+        # Queues the task if the game is busy; otherwise marks it busy and
+        # leaves running the task to the caller.
+        with self._lock:
+            self.submitted += 1
+            mailbox = self._mailboxes.get(game_id)
+            if mailbox is not None:
+                mailbox.append((fn, args))
+                self.contended += 1
+                self.max_depth = max(self.max_depth, len(mailbox))
+                self._contention[game_id] += 1
+                if len(self._contention) > 2 * self.hot_games:
+                    self._contention = Counter(dict(self._contention.most_common(self.hot_games)))
+                return True
+            self._mailboxes[game_id] = deque()
+            return False
+
+    def _drain(self, game_id, fn, args):
+        while True:
+            try:
+                fn(*args)
+            except Exception:
+                self.failed += 1
+                logger.exception('task for game %s failed', game_id)
+            with self._lock:
+                mailbox = self._mailboxes[game_id]
+                if not mailbox:
+                    del self._mailboxes[game_id]
+                    return
+                fn, args = mailbox.popleft()
+
+    def busy(self, game_id):
+        with self._lock:
+            return game_id in self._mailboxes
+
+    def forget(self, game_id):
+        with self._lock:
+            self._contention.pop(game_id, None)
+
+    def hot(self, limit=10):
+        # [(game_id, waits)] for the games whose taps most often had to queue.
+        with self._lock:
+            return self._contention.most_common(limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'busy_games': len(self._mailboxes),
+                'queued': sum(len(mailbox) for mailbox in self._mailboxes.values()),
+                'submitted': self.submitted,
+                'contended': self.contended,
+                'max_depth': self.max_depth,
+                'failed': self.failed,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,206 @@
+import argparse
+import gzip
+import io
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Run as a script, the repository directory comes first on sys.path and its
+# chess.py would shadow python-chess; move it to the end.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or '.') != ROOT] + [ROOT]
+
+import chess
+import chess.pgn
+
+import engine
+import history
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.environ.get('CHESS_ARCHIVE', 'games.pgn.gz')
+FLUSH_INTERVAL = 5.0
+OPENING_PLIES = 6     # an opening is the SAN of the first moves
+BLUNDER_CP = 200      # a move losing this much against the engine's best is a blunder
+EVAL_CAP = 1000       # mate scores are clipped to this, so a missed mate counts once
+BATCH_SIZE = 50       # games per task sent to an analysis worker
+TASKS_PER_WORKER = 4  # tasks in flight per worker; bounds memory however long the archive
+
+
+def game_pgn(headers, codes):
+    game = chess.pgn.Game()
+    for name, value in headers.items():
+        game.headers[name] = str(value)
+    node = game
+    for code in codes:
+        node = node.add_variation(history.decode_move(code))
+    return str(game)
+
+
+class Archive:
+    # Finished games are appended as PGN to a gzip file, one gzip member per
+    # batch. Readers see concatenated members as one stream, so the file is
+    # only ever appended to and can be read while the bot is writing it.
+
+    def __init__(self, path=ARCHIVE_PATH, interval=FLUSH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.archived = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='archive', daemon=True)
+        self._thread.start()
+
+    def submit(self, headers, codes):
+        with self._lock:
+            self._queue.append((headers, codes))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            text = ''.join(game_pgn(headers, codes) + '\n\n' for headers, codes in batch)
+            member = gzip.compress(text.encode('utf-8'))
+            try:
+                # One write per member: processes sharing the file (webhook
+                # shards) append whole members and never interleave inside one.
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, member)
+                finally:
+                    os.close(fd)
+            except OSError:
+                with self._lock:
+                    self._queue[:0] = batch
+                raise
+            self.archived += len(batch)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('archiving %s failed', self.path)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+
+def read_games(paths):
+    # Yields the PGN text of one game at a time, from plain or gzipped files.
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as pgn:
+            lines = []
+            has_moves = False
+            for line in pgn:
+                if line.startswith('[Event ') and has_moves:
+                    yield ''.join(lines)
+                    lines = []
+                    has_moves = False
+                elif line.strip() and not line.startswith('['):
+                    has_moves = True
+                lines.append(line)
+            if has_moves:
+                yield ''.join(lines)
+
+
+def _score(board, depth):
+    return max(-EVAL_CAP, min(EVAL_CAP, engine.score(board, depth)))
+
+
+def analyse_game(text, depth=1):
+    # (opening, plies, blunders, result). With depth 0 no engine is used and
+    # blunders are not counted.
+    game = chess.pgn.read_game(io.StringIO(text))
+    board = game.board()
+    opening = []
+    plies = blunders = 0
+    previous = _score(board, depth) if depth else 0
+    for move in game.mainline_moves():
+        if plies < OPENING_PLIES:
+            opening.append(board.san(move))
+        board.push(move)
+        plies += 1
+        if depth:
+            current = _score(board, depth)
+            # previous is the mover's score before the move, -current after it.
+            if previous + current >= BLUNDER_CP:
+                blunders += 1
+            previous = current
+    return ' '.join(opening), plies, blunders, game.headers.get('Result', '*')
+
+
+def _analyse_batch(texts, depth):
+    return [analyse_game(text, depth) for text in texts]
+
+
+def analyse(paths, workers=None, depth=1):
+    # Streams the games through a process pool. Only a bounded number of
+    # batches is ever in flight, and per game only counters are kept.
+    openings = Counter()
+    results = Counter()
+    totals = {'games': 0, 'plies': 0, 'blunders': 0}
+
+    def add(summaries):
+        for opening, plies, blunders, result in summaries:
+            openings[opening] += 1
+            results[result] += 1
+            totals['games'] += 1
+            totals['plies'] += plies
+            totals['blunders'] += blunders
+
+    workers = workers or os.cpu_count() or 1
+    games = read_games(paths)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        while True:
+            batch = list(itertools.islice(games, BATCH_SIZE))
+            if batch:
+                pending.add(pool.submit(_analyse_batch, batch, depth))
+            if len(pending) >= workers * TASKS_PER_WORKER or (not batch and pending):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    add(future.result())
+            if not batch and not pending:
+                break
+    return totals, openings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics over archived games.')
+    parser.add_argument('command', choices=['analyse'])
+    parser.add_argument('paths', nargs='*', default=[ARCHIVE_PATH])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--depth', type=int, default=1, help='engine depth for blunder checks, 0 to skip them')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    started = time.perf_counter()
+    totals, openings, results = analyse(args.paths, args.workers, args.depth)
+    games = totals['games']
+    logger.info('analysed %d games in %.1fs', games, time.perf_counter() - started)
+    print(f"games: {games}")
+    print(f"average length: {totals['plies'] / max(games, 1):.1f} plies")
+    if args.depth:
+        print(f"blunders: {totals['blunders']} ({totals['blunders'] / max(games, 1):.2f} per game)")
+    print('results: ' + ', '.join(f'{result} {count}' for result, count in results.most_common()))
+    print('openings:')
+    for opening, count in openings.most_common(args.top):
+        print(f'  {count:8d}  {opening or "(no moves)"}')
+
+
+if __name__ == '__main__':
+    main()
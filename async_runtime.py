@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+logger = logging.getLogger(__name__)
+
+HANDLER_WORKERS = 64
+# Bot API calls whose result the handlers never use. Under this runtime they
+# are sent from the event loop instead of blocking the handler's thread.
+FIRE_AND_FORGET = ('answer_callback_query', 'delete_message')
+
+
+def _offload(loop, executor, handler):
+    # Handlers without a native coroutine talk to SQLite and the Bot API
+    # synchronously; they are awaited from the event loop but executed on the
+    # worker pool so one slow update can never stall dispatch for the others.
+    @functools.wraps(handler)
+    async def wrapper(update):
+        try:
+            await loop.run_in_executor(executor, handler, update)
+        except Exception:
+            logger.exception('handler %s failed', handler.__name__)
+    return wrapper
+
+
+def _native(async_bot, run, handler):
+    @functools.wraps(handler)
+    async def wrapper(update):
+        try:
+            await handler(async_bot, run, update)
+        except Exception:
+            logger.exception('handler %s failed', handler.__name__)
+    return wrapper
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning('bot API call failed: %s', future.exception())
+
+
+def send_from_loop(bot, async_bot, loop):
+    # A tap then holds a handler thread only while it reads and changes the
+    # game: its callback answer goes out on the loop, and board edits already
+    # go through the edit scheduler's own thread.
+    for name in FIRE_AND_FORGET:
+        method = getattr(async_bot, name)
+
+        def call(*args, _method=method, **kwargs):
+            asyncio.run_coroutine_threadsafe(_method(*args, **kwargs), loop).add_done_callback(_log_failure)
+            return True
+        setattr(bot, name, call)
+
+
+def mirror_handlers(bot, async_bot, loop, executor, native=None):
+    # Registers bot's handlers on async_bot in the same order. A handler found
+    # in `native` is replaced by its coroutine, called as
+    # native[handler](async_bot, run, update) where `run(fn, *args)` awaits fn
+    # on the pool; any other handler runs whole on the pool.
+    native = native or {}
+
+    def run(fn, *args):
+        return loop.run_in_executor(executor, fn, *args)
+
+    def wrap(handler):
+        if handler in native:
+            return _native(async_bot, run, native[handler])
+        return _offload(loop, executor, handler)
+
+    for handler in bot.message_handlers:
+        async_bot.register_message_handler(wrap(handler['function']), **handler['filters'])
+    for handler in bot.callback_query_handlers:
+        async_bot.register_callback_query_handler(wrap(handler['function']), **handler['filters'])
+
+
+async def serve(bot, workers=HANDLER_WORKERS, api_errors=None, native=None):
+    loop = asyncio.get_running_loop()
+    if apihelper.API_URL:
+        # Another Bot API server (CHESS_API_URL) set on the synchronous helper.
+        asyncio_helper.API_URL = apihelper.API_URL
+    if api_errors is not None:
+        asyncio_helper._process_request = api_errors.wrap_async(asyncio_helper._process_request)
+    async_bot = AsyncTeleBot(bot.token)
+    with ThreadPoolExecutor(workers, thread_name_prefix='handler') as executor:
+        mirror_handlers(bot, async_bot, loop, executor, native)
+        send_from_loop(bot, async_bot, loop)
+        try:
+            await async_bot.infinity_polling()
+        finally:
+            await async_bot.close_session()
+
+
+def run(bot, workers=HANDLER_WORKERS, api_errors=None, native=None):
+    asyncio.run(serve(bot, workers, api_errors, native))
@@ -0,0 +1,411 @@
+# Load test for the bot's handlers against a fake Telegram Bot API.
+#
+#   python benchmarks/load_test.py [--games N] [--pgn FILE] [--workers N]
+#                                  [--latency MS] [--rate-limit FRACTION]
+#                                  [--bot-share FRACTION]
+#
+# chess.py is imported under another name with its Bot API pointed at an
+# in-process HTTP server that answers like Telegram: every call waits
+# --latency ms and a --rate-limit fraction of board edits is refused with a
+# 429. Each game is a challenge, a join and then two taps per move, all
+# delivered as real updates through the bot's dispatcher. The moves come from
+# a PGN file or from seeded random games. All games are started before the
+# first move and their taps are interleaved, so every game stays live until
+# its last move. A --bot-share fraction of the games are against the bot
+# instead: the player presses the "mode_bot" button of the /start message and
+# plays white with seeded random moves, each one only after the bot's reply to
+# the previous move is on the board, so the engine pool and the bot-move path
+# run under the same load.
+#
+# Reported: moves/sec, tap-to-edit latency (time from a tap to the first edit
+# of that board after it), bot reply latency (time from the move's
+# second tap to the first edit showing the bot's answer), SQLite rows and transactions per move, and traced
+# Python memory per live game.
+
+import argparse
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Append rather than prepend: the repository's chess.py must not shadow python-chess.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import chess
+import chess.pgn
+from telebot import types
+
+TOKEN = '123456:LOADTEST'
+
+
+class FakeTelegram:
+    # The Bot API methods the bot uses, answered from memory. The markup of
+    # the last message sent to each chat is kept so the players can find the
+    # buttons to press.
+
+    def __init__(self, latency=0.0, rate_limit=0.0, seed=1):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.calls = Counter()
+        self.rate_limited = 0
+        self.on_edit = None
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1)
+        self._markups = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def last_markup(self, chat_id):
+        return self._markups.get(chat_id)
+
+    def answer(self, method, params):
+        with self._lock:
+            self.calls[method] += 1
+            limited = method == 'editMessageText' and self._random.random() < self.rate_limit
+            if limited:
+                self.rate_limited += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if limited:
+            return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                         'parameters': {'retry_after': 1}}
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            if 'reply_markup' in params:
+                self._markups[chat_id] = json.loads(params['reply_markup'])
+            message = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                       'chat': {'id': chat_id, 'type': 'group'}, 'text': params.get('text', '')}
+            return 200, {'ok': True, 'result': message}
+        if method == 'editMessageText':
+            if self.on_edit is not None:
+                self.on_edit(int(params['chat_id']))
+            return 200, {'ok': True, 'result': True}
+        if method == 'getChatMember':
+            user = {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'player'}
+            return 200, {'ok': True, 'result': {'user': user, 'status': 'member'}}
+        return 200, {'ok': True, 'result': True}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _serve(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length', 0))
+                if length:
+                    body = self.rfile.read(length).decode()
+                    params.update({key: values[0] for key, values in parse_qs(body).items()})
+                status, payload = fake.answer(url.path.rsplit('/', 1)[-1], params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def load_bot(api_url):
+    os.environ['CHESS_TOKEN'] = TOKEN
+    os.environ['CHESS_API_URL'] = api_url
+    spec = importlib.util.spec_from_file_location('chessbot', os.path.join(ROOT, 'chess.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['chessbot'] = module
+    spec.loader.exec_module(module)
+    module.setup()
+    module.bot.threaded = False  # handlers run on the driver threads
+    return module
+
+
+def pgn_games(path, count):
+    games = []
+    with open(path) as pgn:
+        while len(games) < count:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            games.append(list(game.mainline_moves()))
+    if not games:
+        raise SystemExit(f'no games in {path}')
+    return [games[i % len(games)] for i in range(count)]
+
+
+def random_games(count, plies, seed):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = chess.Board()
+        moves = []
+        while len(moves) < plies and not board.is_game_over():
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            moves.append(move)
+        games.append(moves)
+    return games
+
+
+def playable(moves):
+    # The board keyboard always promotes to a queen; stop before an underpromotion.
+    for i, move in enumerate(moves):
+        if move.promotion not in (None, chess.QUEEN):
+            return moves[:i]
+    return moves
+
+
+class Player:
+    updates = itertools.count(1)
+
+    def __init__(self, user_id, name):
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': name, 'username': name}
+
+    def say(self, chat_id, text):
+        message = {'message_id': next(self.updates), 'date': int(time.time()), 'from': self.user,
+                   'chat': {'id': chat_id, 'type': 'group'}, 'text': text}
+        return types.Update.de_json({'update_id': next(self.updates), 'message': message})
+
+    def press(self, chat_id, data):
+        message = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'group'}}
+        callback = {'id': str(next(self.updates)), 'from': self.user, 'chat_instance': str(chat_id),
+                    'data': data, 'message': message}
+        return types.Update.de_json({'update_id': next(self.updates), 'callback_query': callback})
+
+
+WAIT = object()
+
+
+class Match:
+    def __init__(self, index, moves):
+        self.chat_id = -1000000 - index
+        self.players = [Player(2 * index + 1, f'white{index}'), Player(2 * index + 2, f'black{index}')]
+        self.moves = playable(moves)
+        self.ply = 0
+        self.grid = None
+
+    def button(self, square):
+        return self.grid[(7 - chess.square_rank(square)) * 8 + chess.square_file(square)]
+
+    def next_turn(self, bot_module):
+        # (player, move) to tap next, WAIT, or None once the game is over.
+        if self.ply >= len(self.moves):
+            return None
+        move = self.moves[self.ply]
+        self.ply += 1
+        return self.players[(self.ply - 1) % 2], move
+
+
+class BotMatch(Match):
+    def __init__(self, index, plies, seed):
+        super().__init__(index, [])
+        self.player = self.players[0]
+        self.plies = plies
+        self.random = random.Random(seed * 1000003 + index)
+        self.game_id = None
+        self.asked = None   # perf_counter time of the move the bot is answering
+
+    def board(self, bot_module):
+        game = bot_module.active_games.get(self.game_id)
+        return game['board'] if game is not None else None
+
+    def next_turn(self, bot_module):
+        board = self.board(bot_module)
+        if board is None:
+            return None
+        if board.ply() < self.ply or self.asked is not None:
+            # The reply is not on the board, or not yet on an edit the player has seen.
+            return WAIT
+        if self.ply >= self.plies or board.is_game_over():
+            return None
+        move = self.random.choice(list(board.legal_moves))
+        if move.promotion:
+            move.promotion = chess.QUEEN
+        self.ply = board.ply() + 2
+        return self.player, move
+
+
+def buttons(markup):
+    return [button['callback_data'] for row in markup['inline_keyboard'] for button in row]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the bot handlers against a fake Telegram Bot API.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--pgn', help='replay the games of this PGN file instead of random ones')
+    parser.add_argument('--plies', type=int, default=60, help='length of the random games')
+    parser.add_argument('--workers', type=int, default=32, help='threads delivering updates')
+    parser.add_argument('--latency', type=float, default=5, help='ms per Bot API call')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fraction of edits answered with 429')
+    parser.add_argument('--bot-share', type=float, default=0.2, help='fraction of the games played against the bot')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='chess-load-'))
+    fake = FakeTelegram(args.latency / 1000, args.rate_limit, args.seed)
+    fake.start()
+    bot_module = load_bot(fake.url)
+    logging.disable(logging.CRITICAL)
+    import callbacks
+    import storage
+
+    bot_games = round(args.games * args.bot_share)
+    pvp_games = args.games - bot_games
+    movelists = pgn_games(args.pgn, pvp_games) if args.pgn and pvp_games else random_games(pvp_games, args.plies, args.seed)
+    matches = [Match(i, moves) for i, moves in enumerate(movelists)]
+    bot_matches = {}
+    for i in range(pvp_games, args.games):
+        match = BotMatch(i, args.plies, args.seed)
+        bot_matches[match.chat_id] = match
+        matches.append(match)
+
+    pending_taps = defaultdict(list)  # chat_id -> start times of taps awaiting an edit
+    latencies = []
+    bot_latencies = []
+    lock = threading.Lock()
+
+    def on_edit(chat_id):
+        now = time.perf_counter()
+        with lock:
+            latencies.extend(now - started for started in pending_taps.pop(chat_id, ()))
+            match = bot_matches.get(chat_id)
+            if match is not None and match.asked is not None:
+                board = match.board(bot_module)
+                if board is None or board.ply() >= match.ply:
+                    bot_latencies.append(now - match.asked)
+                    match.asked = None
+
+    fake.on_edit = on_edit
+
+    def deliver(update):
+        bot_module.bot.process_new_updates([update])
+
+    # Start every game: challenge, then join, or the bot mode button.
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for match in matches:
+        host, guest = match.players
+        if isinstance(match, BotMatch):
+            deliver(host.press(match.chat_id, f'mode_bot_{match.chat_id}'))
+            match.grid = buttons(fake.last_markup(match.chat_id))
+            match.game_id = bot_module.handles.game_for(callbacks.decode(match.grid[0])[2])
+            continue
+        deliver(host.say(match.chat_id, 'تحدي شطرنج'))
+        deliver(guest.press(match.chat_id, buttons(fake.last_markup(match.chat_id))[0]))
+        match.grid = buttons(fake.last_markup(match.chat_id))
+    per_game = (tracemalloc.get_traced_memory()[0] - baseline) / len(matches)
+    tracemalloc.stop()
+
+    rows_before = storage.writer.rows_written
+    batches_before = storage.writer.batches
+
+    # Play: a worker takes a game, plays its next move (two taps) and puts it
+    # back, so all games advance together and one game is never tapped from
+    # two threads at once.
+    ready = queue.Queue()
+    for match in matches:
+        ready.put(match)
+    remaining = [len(matches)]
+    moves_played = [0]
+
+    def tap(match, player, square):
+        with lock:
+            pending_taps[match.chat_id].append(time.perf_counter())
+        deliver(player.press(match.chat_id, match.button(square)))
+
+    def worker():
+        while True:
+            match = ready.get()
+            if match is None:
+                return
+            turn = match.next_turn(bot_module)
+            if turn is WAIT:
+                # The bot is still thinking; let the engine processes have the CPU.
+                time.sleep(0.001)
+                ready.put(match)
+                continue
+            if turn is not None:
+                player, move = turn
+                tap(match, player, move.from_square)
+                if isinstance(match, BotMatch):
+                    with lock:
+                        match.asked = time.perf_counter()
+                tap(match, player, move.to_square)
+                with lock:
+                    moves_played[0] += 1
+                ready.put(match)
+                continue
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in range(args.workers):
+                        ready.put(None)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    while bot_module.edit_scheduler.pending():
+        time.sleep(0.05)
+    drained = time.perf_counter() - started
+    storage.flush()
+
+    moves = moves_played[0]
+    rows = storage.writer.rows_written - rows_before
+    batches = storage.writer.batches - batches_before
+    print(f'{len(matches)} games ({bot_games} against the bot), {moves} moves tapped, {args.workers} workers, '
+          f'{args.latency:g} ms API latency, {args.rate_limit:.0%} edits rate limited')
+    print(f'throughput:     {moves / elapsed:10.1f} moves/s ({elapsed:.1f}s, edits drained after {drained:.1f}s)')
+    print(f'tap-to-edit:    p50 {percentile(latencies, 0.5) * 1000:8.1f} ms   p99 {percentile(latencies, 0.99) * 1000:8.1f} ms'
+          f'   ({len(latencies)} taps)')
+    print(f'bot reply:      p50 {percentile(bot_latencies, 0.5) * 1000:8.1f} ms   p99 {percentile(bot_latencies, 0.99) * 1000:8.1f} ms'
+          f'   ({len(bot_latencies)} replies, engine pool {bot_module.engine_pool.stats()})')
+    print(f'sqlite/move:    {rows / max(moves, 1):10.2f} rows   {batches / max(moves, 1):.3f} transactions')
+    print(f'memory/game:    {per_game / 1024:10.1f} KiB traced after join')
+    print(f'api calls:      {dict(fake.calls)}   429s: {fake.rate_limited}')
+    print(f'edits:          sent {bot_module.edit_scheduler.sent}, coalesced {bot_module.edit_scheduler.coalesced}, '
+          f'errors {bot_module.edit_scheduler.errors}   actors: {bot_module.game_actors.stats()}')
+
+    bot_module.stop_services()
+    fake.close()
+
+
+if __name__ == '__main__':
+    main()
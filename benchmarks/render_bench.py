@@ -0,0 +1,108 @@
+# Micro-benchmark for the board keyboard renderer.
+#
+#   python benchmarks/render_bench.py [games] [plies]
+#
+# Replays random games tap by tap (select a piece, then move it) and renders
+# the keyboard after every tap, once with the original 64-button loop that
+# send_chess_board/update_chess_board used and once with render.BoardRenderer.
+# Both outputs are checked for equality before timing.
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+# Append rather than prepend: the repository's chess.py must not shadow python-chess.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+from telebot import types
+
+from render import BoardRenderer, CAPTURE_DOT, MOVE_DOT, piece_to_emoji
+
+
+def legacy_render(game_id, board, selected, current):
+    markup = types.InlineKeyboardMarkup(row_width=8)
+    possible_moves = []
+    if selected:
+        square = chess.square(selected[1], 7 - selected[0])
+        for move in board.legal_moves:
+            if move.from_square == square:
+                possible_moves.append(move.to_square)
+    for row in range(7, -1, -1):
+        row_buttons = []
+        for col in range(8):
+            square = chess.square(col, row)
+            piece = board.piece_at(square)
+            text = piece_to_emoji(piece, row, col)
+            if selected and square in possible_moves:
+                if piece and piece.color != current:
+                    text = CAPTURE_DOT + text
+                else:
+                    text = MOVE_DOT + text
+            callback = f"move_{game_id}_{7-row}_{col}"
+            row_buttons.append(types.InlineKeyboardButton(text, callback_data=callback))
+        markup.add(*row_buttons)
+    return markup
+
+
+def tap_script(games, plies, seed=1):
+    rng = random.Random(seed)
+    script = []
+    for _ in range(games):
+        game_id = str(uuid.uuid4())
+        board = chess.Board()
+        for _ in range(plies):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            selected = (7 - chess.square_rank(move.from_square), chess.square_file(move.from_square))
+            script.append((game_id, board.copy(stack=False), None))
+            script.append((game_id, board.copy(stack=False), selected))
+            board.push(move)
+    return script
+
+
+def run(render, script):
+    for game_id, board, selected in script:
+        render(game_id, board, selected, board.turn).to_json()
+
+
+def measure(name, render, script):
+    start = time.perf_counter()
+    run(render, script)
+    elapsed = time.perf_counter() - start
+    # Peak traced memory of a second pass; for the renderer this includes its
+    # per-game views and position templates, which stay resident.
+    tracemalloc.start()
+    run(render, script)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_tap = elapsed / len(script) * 1e6
+    print(f"{name:>10}: {per_tap:8.1f} us/tap   peak {peak / 1024:8.1f} KiB")
+    return per_tap
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    script = tap_script(games, plies)
+
+    renderer = BoardRenderer()
+    for game_id, board, selected in script:
+        expected = json.loads(legacy_render(game_id, board, selected, board.turn).to_json())
+        actual = json.loads(renderer.render(game_id, board, selected, board.turn).to_json())
+        assert expected == actual, (board.fen(), selected)
+
+    print(f"{len(script)} taps over {games} games")
+    legacy = measure('legacy', legacy_render, script)
+    current = measure('renderer', BoardRenderer().render, script)
+    print(f"speed-up: {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import io
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import chess
+import chess.polyglot
+from telebot import types
+
+from cache import TTLCache
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow is optional; without it boards are sent as buttons
+    Image = None
+
+TILE = 64
+MARGIN = 20
+SUPERSAMPLE = 4   # sprites are drawn this much larger and scaled down once
+IMAGE_CACHE_SIZE = 1000
+FILE_ID_TTL = 7 * 24 * 60 * 60
+
+SQUARE_COLORS = {
+    # (light square, highlight) -> RGB
+    (True, None): (240, 217, 181), (False, None): (181, 136, 99),
+    (True, 'last'): (205, 210, 106), (False, 'last'): (170, 162, 58),
+    (True, 'selected'): (130, 151, 105), (False, 'selected'): (100, 121, 75),
+}
+FRAME_COLOR = (48, 46, 43)
+LABEL_COLOR = (220, 220, 220)
+MARK_COLOR = (20, 85, 30, 110)
+PIECE_FILL = {chess.WHITE: (248, 248, 248), chess.BLACK: (45, 45, 45)}
+PIECE_OUTLINE = (20, 20, 20)
+
+# Piece silhouettes on a 100x100 grid: (shape, coordinates).
+SHAPES = {
+    chess.PAWN: [('polygon', [(38, 46), (62, 46), (70, 82), (30, 82)]), ('ellipse', (37, 20, 63, 46)),
+                 ('rectangle', (24, 80, 76, 90))],
+    chess.KNIGHT: [('polygon', [(30, 82), (70, 82), (67, 58), (62, 38), (66, 20), (54, 12), (44, 16), (22, 38),
+                                (26, 48), (40, 42), (34, 62)]), ('rectangle', (24, 80, 76, 90))],
+    chess.BISHOP: [('polygon', [(40, 60), (60, 60), (66, 82), (34, 82)]), ('ellipse', (34, 22, 66, 66)),
+                   ('ellipse', (45, 10, 55, 20)), ('rectangle', (24, 80, 76, 90))],
+    chess.ROOK: [('rectangle', (32, 38, 68, 82)), ('rectangle', (26, 28, 74, 40)), ('rectangle', (26, 16, 38, 30)),
+                 ('rectangle', (44, 16, 56, 30)), ('rectangle', (62, 16, 74, 30)), ('rectangle', (24, 80, 76, 90))],
+    chess.QUEEN: [('polygon', [(22, 28), (36, 52), (42, 20), (50, 50), (58, 20), (64, 52), (78, 28), (70, 72),
+                               (30, 72)]), ('rectangle', (30, 68, 70, 82)), ('rectangle', (24, 80, 76, 90))],
+    chess.KING: [('rectangle', (46, 6, 54, 32)), ('rectangle', (38, 13, 62, 21)),
+                 ('polygon', [(28, 34), (72, 34), (64, 72), (36, 72)]), ('rectangle', (30, 68, 70, 82)),
+                 ('rectangle', (24, 80, 76, 90))],
+}
+
+BoardPhoto = namedtuple('BoardPhoto', 'key png keyboard')
+
+# Markup of an edit that only replaces a board photo's text (the game-over
+# notices): Telegram edits a photo's caption, never its message text.
+CAPTION = object()
+
+
+def available():
+    return Image is not None
+
+
+def draw_sprite(piece, size):
+    # Rasterised once per piece: drawn at SUPERSAMPLE times the size, then
+    # scaled down for smooth edges.
+    big = size * SUPERSAMPLE
+    scale = big / 100
+    sprite = Image.new('RGBA', (big, big), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sprite)
+    style = {'fill': PIECE_FILL[piece.color], 'outline': PIECE_OUTLINE, 'width': 3 * SUPERSAMPLE}
+    for shape, coords in SHAPES[piece.piece_type]:
+        if shape == 'polygon':
+            draw.polygon([(x * scale, y * scale) for x, y in coords], **style)
+        else:
+            box = [value * scale for value in coords]
+            getattr(draw, shape)(box, **style)
+    return sprite.resize((size, size), Image.LANCZOS)
+
+
+def load_sprite(path, size):
+    return Image.open(path).convert('RGBA').resize((size, size), Image.LANCZOS)
+
+
+@lru_cache(maxsize=10000)
+def coordinate_keyboard(data):
+    # data: 8 file buttons, 8 rank buttons and cancel, as callbacks.coordinate_grid returns them.
+    markup = types.InlineKeyboardMarkup(row_width=8)
+    markup.add(*[types.InlineKeyboardButton(chess.FILE_NAMES[i], callback_data=data[i]) for i in range(8)])
+    markup.add(*[types.InlineKeyboardButton(chess.RANK_NAMES[i], callback_data=data[8 + i]) for i in range(8)])
+    markup.add(types.InlineKeyboardButton('❌ إلغاء', callback_data=data[16]))
+    return markup
+
+
+class BoardImages:
+    # PNG boards built from cached square tiles (square colour, highlight,
+    # piece and move mark), keyed by Zobrist hash, last move and selection so
+    # a position seen before costs a cache lookup. Telegram's file_id of every
+    # uploaded image is kept too, so repeated images are never uploaded again.
+    # pieces_dir may hold wK.png ... bP.png to replace the drawn sprites.
+    # Move marks come from positions (a positions.PositionCache) when given.
+
+    def __init__(self, tile=TILE, maxsize=IMAGE_CACHE_SIZE, pieces_dir=None, positions=None):
+        self.tile = tile
+        self.positions = positions
+        self.rendered = 0
+        pieces_dir = pieces_dir or os.environ.get('CHESS_PIECES')
+        self._sprites = {}
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                piece = chess.Piece(piece_type, color)
+                path = pieces_dir and os.path.join(pieces_dir, ('w' if color else 'b') + piece.symbol().upper() + '.png')
+                self._sprites[piece.symbol()] = (load_sprite(path, tile) if path and os.path.exists(path)
+                                                 else draw_sprite(piece, tile))
+        self._tiles = {}
+        self._frame = self._draw_frame()
+        self._images = TTLCache(maxsize, ttl=3600)
+        self.file_ids = TTLCache(100000, ttl=FILE_ID_TTL)
+
+    def _draw_frame(self):
+        size = 8 * self.tile + 2 * MARGIN
+        frame = Image.new('RGB', (size, size), FRAME_COLOR)
+        draw = ImageDraw.Draw(frame)
+        font = ImageFont.load_default()
+        for i in range(8):
+            middle = MARGIN + i * self.tile + self.tile // 2
+            for x, y, label in ((middle, MARGIN // 2, chess.FILE_NAMES[i]), (middle, size - MARGIN // 2, chess.FILE_NAMES[i]),
+                                (MARGIN // 2, middle, chess.RANK_NAMES[7 - i]), (size - MARGIN // 2, middle, chess.RANK_NAMES[7 - i])):
+                draw.text((x, y), label, fill=LABEL_COLOR, font=font, anchor='mm')
+        return frame
+
+    def _square_tile(self, light, highlight, symbol, mark):
+        key = (light, highlight, symbol, mark)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = Image.new('RGBA', (self.tile, self.tile), SQUARE_COLORS[light, highlight])
+            if symbol:
+                tile.alpha_composite(self._sprites[symbol])
+            if mark:
+                overlay = Image.new('RGBA', tile.size, (0, 0, 0, 0))
+                draw = ImageDraw.Draw(overlay)
+                if mark == 'capture':
+                    draw.ellipse((2, 2, self.tile - 3, self.tile - 3), outline=MARK_COLOR, width=self.tile // 12)
+                else:
+                    radius = self.tile // 6
+                    middle = self.tile // 2
+                    draw.ellipse((middle - radius, middle - radius, middle + radius, middle + radius), fill=MARK_COLOR)
+                tile.alpha_composite(overlay)
+            tile = self._tiles[key] = tile.convert('RGB')
+        return tile
+
+    def render(self, board, selected=None):
+        # selected is the (row, col) of the chosen piece, as in game['selected'].
+        last = board.move_stack[-1] if board.move_stack else None
+        square = chess.square(selected[1], 7 - selected[0]) if selected else None
+        key = (chess.polyglot.zobrist_hash(board), last, square)
+        png = self._images.get(key)
+        if png is None:
+            png = self._draw(board, last, square)
+            self._images.set(key, png)
+        return key, png
+
+    def _draw(self, board, last, selected):
+        highlights = {}
+        if last is not None:
+            highlights[last.from_square] = highlights[last.to_square] = 'last'
+        marks = {}
+        if selected is not None:
+            highlights[selected] = 'selected'
+            if self.positions is not None:
+                destinations = chess.scan_forward(self.positions.get(board).targets.get(selected, 0))
+            else:
+                destinations = {move.to_square for move in board.legal_moves if move.from_square == selected}
+            for to_square in destinations:
+                marks[to_square] = 'capture' if board.piece_at(to_square) else 'move'
+        image = self._frame.copy()
+        for square in chess.SQUARES:
+            piece = board.piece_at(square)
+            tile = self._square_tile(chess.square_file(square) % 2 != chess.square_rank(square) % 2,
+                                     highlights.get(square), piece.symbol() if piece else None, marks.get(square))
+            image.paste(tile, (MARGIN + chess.square_file(square) * self.tile,
+                               MARGIN + (7 - chess.square_rank(square)) * self.tile))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=3)
+        self.rendered += 1
+        return buffer.getvalue()
+
+    def photo(self, key, png):
+        # What to send for this image: its file_id once Telegram has it.
+        return self.file_ids.get(key) or png
+
+    def remember(self, key, message):
+        if getattr(message, 'photo', None):
+            self.file_ids.set(key, message.photo[-1].file_id)
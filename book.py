@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+logger = logging.getLogger(__name__)
+
+BOOK_PATH = os.environ.get('CHESS_BOOK', 'book.bin')
+SYZYGY_PATH = os.environ.get('CHESS_SYZYGY', 'syzygy')
+TABLEBASE_PIECES = 5
+
+
+class Oracle:
+    # Instant answers for the bot: a Polyglot opening book for the start of the
+    # game and Syzygy tablebases once few pieces are left. Either source may be
+    # missing, in which case it simply never hits.
+
+    def __init__(self, book_path=BOOK_PATH, syzygy_path=SYZYGY_PATH, max_pieces=TABLEBASE_PIECES):
+        self.max_pieces = max_pieces
+        self.book_hits = 0
+        self.book_misses = 0
+        self.tablebase_hits = 0
+        self.tablebase_misses = 0
+        self._lock = threading.Lock()
+        self.book = None
+        self.tablebase = None
+        if book_path and os.path.isfile(book_path):
+            # open_reader memory-maps the file, so lookups are a binary search
+            # over the mapping without reading the book into memory.
+            self.book = chess.polyglot.open_reader(book_path)
+        else:
+            logger.info('no opening book at %s', book_path)
+        if syzygy_path and os.path.isdir(syzygy_path):
+            self.tablebase = chess.syzygy.open_tablebase(syzygy_path)
+        else:
+            logger.info('no syzygy tablebases at %s', syzygy_path)
+
+    def book_move(self, board):
+        if self.book is None:
+            return None
+        try:
+            move = self.book.weighted_choice(board).move
+        except IndexError:
+            self.book_misses += 1
+            return None
+        self.book_hits += 1
+        return move
+
+    def tablebase_move(self, board):
+        if self.tablebase is None:
+            return None
+        if chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+        board = board.copy(stack=False)
+        best_move = None
+        best_key = None
+        try:
+            with self._lock:
+                for move in board.legal_moves:
+                    board.push(move)
+                    if board.is_checkmate():
+                        board.pop()
+                        best_move = move
+                        break
+                    # Probed from the opponent's side: the lower their WDL the
+                    # better. Among equal results prefer the larger DTZ, which
+                    # wins faster and loses slower.
+                    key = (self.tablebase.probe_wdl(board), -self.tablebase.probe_dtz(board))
+                    board.pop()
+                    if best_key is None or key < best_key:
+                        best_key = key
+                        best_move = move
+        except KeyError:
+            self.tablebase_misses += 1
+            return None
+        if best_move is None:
+            self.tablebase_misses += 1
+            return None
+        self.tablebase_hits += 1
+        return best_move
+
+    def probe(self, board):
+        return self.book_move(board) or self.tablebase_move(board)
+
+    def stats(self):
+        return {
+            'book_hits': self.book_hits,
+            'book_misses': self.book_misses,
+            'tablebase_hits': self.tablebase_hits,
+            'tablebase_misses': self.tablebase_misses,
+        }
+
+    def close(self):
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    # Bounded LRU mapping whose entries also expire; the TTL can be chosen per entry.
+
+    def __init__(self, maxsize=10000, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        # Sets key only if it is missing or expired; returns whether it did.
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._data[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class LoadingLRU:
+    # Dict-like LRU that fills misses from `load` (returning None when the key
+    # doesn't exist) and hands entries pushed out by the size bound to `evict`.
+    # Keys for which `pinned` is true are passed over when evicting, so the
+    # cache can exceed maxsize while they stay pinned.
+    # Loads run outside the lock, one per key: concurrent misses for the same
+    # key wait on the first one's future. Keys found missing are remembered for
+    # missing_ttl seconds so stale callbacks don't each query the loader.
+
+    def __init__(self, load, evict=None, maxsize=10000, missing_ttl=5, pinned=None):
+        self.load = load
+        self.evict = evict
+        self.pinned = pinned
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._loading = {}   # key -> Future of the load in progress
+        self._missing = TTLCache(maxsize, ttl=missing_ttl)
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            if self._missing.get(key) is not None:
+                return default
+            self.misses += 1
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+        if not owner:
+            value = future.result()
+            return default if value is None else value
+        try:
+            value = self.load(key)
+        except BaseException as error:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            del self._loading[key]
+            if key in self._data:
+                # Set while it was loading; the newer value wins.
+                value = self._data[key]
+            elif value is None:
+                self._missing.set(key, True)
+            else:
+                self._insert(key, value)
+        future.set_result(value)
+        return default if value is None else value
+
+    def _insert(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        excess = len(self._data) - self.maxsize
+        if excess <= 0:
+            return
+        victims = []
+        for old_key in self._data:
+            if old_key == key or (self.pinned is not None and self.pinned(old_key)):
+                continue
+            victims.append(old_key)
+            if len(victims) == excess:
+                break
+        for old_key in victims:
+            old_value = self._data.pop(old_key)
+            self.evictions += 1
+            if self.evict is not None:
+                self.evict(old_key, old_value)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._missing.pop(key)
+            self._insert(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def resident(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self):
+        with self._lock:
+            return list(self._data.values())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+        }
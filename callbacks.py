@@ -0,0 +1,114 @@
+import base64
+import threading
+from functools import lru_cache
+
+import chess
+
+import storage
+from cache import TTLCache
+
+# Compact callback_data: 6 bytes, base64 encoded to exactly 8 characters.
+#   byte 0     action (high 2 bits) | square 0-63 (low 6 bits)
+#   bytes 1-5  game handle, big-endian
+# The alphabet has no '_', so a payload can never be mistaken for one of the
+# older "<prefix>_..." strings the dispatcher also understands.
+PAYLOAD_LENGTH = 8
+ALTCHARS = b'-.'
+
+MOVE = 0
+JOIN = 1
+COORD = 2  # image boards: square field is a file (0-7), a rank (8-15) or COORD_CANCEL
+
+COORD_CANCEL = 16
+
+HANDLE_CACHE_SIZE = 100000
+HANDLE_CACHE_TTL = 7 * 24 * 60 * 60
+
+# The low HANDLE_BITS of a handle are its row in the handles table. In webhook
+# workers the bits above hold the worker's shard plus one, so the front process
+# can send a tap to the shard that owns its game; they are 0 without shards and
+# in handles made before they were used.
+HANDLE_BITS = 32
+HANDLE_MASK = (1 << HANDLE_BITS) - 1
+
+
+def encode(action, square, handle):
+    raw = bytes(((action << 6) | square,)) + handle.to_bytes(5, 'big')
+    return base64.b64encode(raw, ALTCHARS).decode('ascii')
+
+
+def decode(data):
+    if len(data) != PAYLOAD_LENGTH:
+        return None
+    try:
+        raw = base64.b64decode(data, ALTCHARS, validate=True)
+    except ValueError:
+        return None
+    return raw[0] >> 6, raw[0] & 63, int.from_bytes(raw[1:], 'big')
+
+
+@lru_cache(maxsize=10000)
+def board_grid(handle):
+    # Board taps in button order: top row (rank 8) first, a-file first.
+    return tuple(encode(MOVE, chess.square(col, 7 - row), handle) for row in range(8) for col in range(8))
+
+
+@lru_cache(maxsize=10000)
+def coordinate_grid(handle):
+    return tuple(encode(COORD, value, handle) for value in range(COORD_CANCEL + 1))
+
+
+def handle_shard(handle):
+    # The webhook shard that made a handle, or None if the handle doesn't say.
+    owner = handle >> HANDLE_BITS
+    return owner - 1 if owner else None
+
+
+class HandleRegistry:
+    # Maps game UUIDs to short integer handles. Handles come from an
+    # AUTOINCREMENT column, so they are never reused and a button left on an old
+    # message can't reach a newer game.
+
+    def __init__(self, maxsize=HANDLE_CACHE_SIZE, ttl=HANDLE_CACHE_TTL, shard=None):
+        self._base = 0 if shard is None else (shard + 1) << HANDLE_BITS
+        self._by_game = TTLCache(maxsize, ttl)
+        self._by_handle = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def _remember(self, game_id, handle):
+        self._by_game.set(game_id, handle)
+        self._by_handle.set(handle, game_id)
+
+    def handle_for(self, game_id):
+        handle = self._by_game.get(game_id)
+        if handle is not None:
+            return handle
+        with self._lock:
+            rows = storage.query('SELECT handle FROM handles WHERE game_id = ?', (game_id,))
+            if rows:
+                handle = self._base | rows[0][0]
+            else:
+                with storage.transaction() as c:
+                    c.execute('INSERT INTO handles (game_id) VALUES (?)', (game_id,))
+                    handle = self._base | c.lastrowid
+            self._remember(game_id, handle)
+        return handle
+
+    def game_for(self, handle):
+        game_id = self._by_handle.get(handle)
+        if game_id is not None:
+            return game_id
+        if handle >> HANDLE_BITS and handle & ~HANDLE_MASK != self._base:
+            return None
+        rows = storage.query('SELECT game_id FROM handles WHERE handle = ?', (handle & HANDLE_MASK,))
+        if not rows:
+            return None
+        self._remember(rows[0][0], handle)
+        return rows[0][0]
+
+    def forget(self, game_id):
+        handle = self._by_game.pop(game_id)
+        if handle is not None:
+            self._by_handle.pop(handle)
+        with storage.transaction() as c:
+            c.execute('DELETE FROM handles WHERE game_id = ?', (game_id,))
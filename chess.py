@@ -2,161 +2,316 @@ import telebot
 from telebot import types
 import logging
 import chess
-import random
 import time
-import sqlite3
+import signal
+import sys
 import uuid
 import json
+import os
+
+import board_image
+import callbacks
+import clocks
+import engine
+import history
+import matchmaking
+import metrics
+import ratings
+import storage
+import webhook
+from actors import GameActors
+from archive import Archive
+from book import Oracle
+from engine_pool import EnginePool
+from lanes import Lanes, callback_key, poll_in_lanes
+from leaderboard import Leaderboard
+from matchmaking import Matchmaker
+from positions import PositionCache
+from cache import LoadingLRU, TTLCache
+from ratelimit import ApiErrors, EditScheduler
+from reaper import Reaper
+from render import BoardRenderer
+from timer_wheel import TimerWheel
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-bot = telebot.TeleBot("YOUR_TOKEN")
-
-def init_db():
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS games (
-        game_id TEXT PRIMARY KEY,
-        chat_id INTEGER,
-        mode TEXT,
-        players TEXT,
-        board_fen TEXT,
-        current_turn INTEGER,
-        selected TEXT,
-        message_id INTEGER,
-        last_update REAL
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS leaderboard (
-        user_id INTEGER,
-        username TEXT,
-        points INTEGER DEFAULT 0,
-        PRIMARY KEY (user_id)
-    )''')
-    conn.commit()
-    conn.close()
-
-init_db()
+bot = telebot.TeleBot(os.environ.get("CHESS_TOKEN", "YOUR_TOKEN"))
+
+# Points the bot at another Bot API server, e.g. a local stand-in for testing.
+if os.environ.get('CHESS_API_URL'):
+    telebot.apihelper.API_URL = os.environ['CHESS_API_URL'] + '/bot{0}/{1}'
+
+# Every Bot API call goes through apihelper._make_request, so 429s and other
+# failures are counted there whichever handler made the call.
+api_errors = ApiErrors()
+telebot.apihelper._make_request = api_errors.wrap(telebot.apihelper._make_request)
+
+# 'threaded' keeps the classic bot.polling() loop; 'async' polls from an asyncio
+# event loop, where the game and leaderboard handlers await the Bot API and
+# leave SQLite and the game actors to a thread pool (see async_runtime.py);
+# 'webhook' receives updates over HTTP and splits the chats between worker
+# processes (see webhook.py).
+RUNTIME = os.environ.get('CHESS_RUNTIME', 'threaded')
+
+WEBHOOK_URL = os.environ.get('CHESS_WEBHOOK_URL')  # public URL registered with Telegram, if any
+WEBHOOK_PORT = int(os.environ.get('CHESS_WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.environ.get('CHESS_WEBHOOK_PATH', '/')
+WEBHOOK_SECRET = os.environ.get('CHESS_WEBHOOK_SECRET')
+SHARDS = int(os.environ.get('CHESS_SHARDS', os.cpu_count() or 1))
+
+# Set in webhook workers only. Each shard keeps its chats' games in its own
+# database; the leaderboards and ratings stay in the shared one.
+SHARD = os.environ.get(webhook.SHARD_ENV)
+LEADERBOARD_REFRESH = 30
+
+# Strength of the PvE opponent, one of engine.LEVELS.
+BOT_LEVEL = 'medium'
 
+# 'buttons' sends the board as a 64-button keyboard; 'image' as a PNG with a
+# small keyboard for entering squares (needs Pillow, see board_image.py).
+BOARD_MODE = os.environ.get('CHESS_BOARD_MODE', 'buttons')
+if BOARD_MODE == 'image' and not board_image.available():
+    logger.warning('Pillow is not installed, sending boards as buttons')
+    BOARD_MODE = 'buttons'
+
+@metrics.timed('edit_message_text')
+def edit_board_message(chat_id, message_id, text, markup):
+    if isinstance(markup, board_image.BoardPhoto):
+        media = types.InputMediaPhoto(board_images.photo(markup.key, markup.png), caption=text)
+        board_images.remember(markup.key, bot.edit_message_media(media, chat_id, message_id, reply_markup=markup.keyboard))
+    elif markup is board_image.CAPTION:
+        bot.edit_message_caption(text, chat_id, message_id)
+    else:
+        bot.edit_message_text(text, chat_id, message_id, reply_markup=markup)
+
+
+# Games are hydrated from SQLite the first time a callback references them and
+# the least recently used ones are written back and dropped past this bound.
+# A game its actor is working on is never dropped: the handler would go on
+# changing a dict the cache no longer holds.
+MAX_RESIDENT_GAMES = 10000
 
 waiting_players = {}  # {game_id: {'host': player1, 'mode': 'pvp' or 'bot', 'chat_id': chat_id, 'host_id': user_id}}
-active_games = {}    # {game_id: {'mode': 'pvp' or 'bot', 'players': [p1, p2 or 'bot'], 'player_ids': [id1, id2 or None], 'board': chess.Board(), 'current': chess.WHITE, 'selected': None, 'message_id': None, 'last_update': 0, 'chat_id': chat_id}}
+active_games = LoadingLRU(lambda game_id: load_game(game_id),
+                          lambda game_id, game: storage.save_game(game_row(game_id, game)),
+                          MAX_RESIDENT_GAMES, pinned=lambda game_id: game_actors.busy(game_id))    # {game_id: {'mode': 'pvp' or 'bot', 'players': [p1, p2 or 'bot'], 'player_ids': [id1, id2 or None], 'board': chess.Board(), 'current': chess.WHITE, 'selected': None, 'message_id': None, 'last_update': 0, 'chat_id': chat_id, 'snapshot': (ply, fen), 'mirror': (chat_id, message_id) or None, 'clock': clocks dict or None}}
 
+handles = callbacks.HandleRegistry(shard=None if SHARD is None else int(SHARD))
+# Everything that reads or changes a game (taps, joins, engine replies) runs
+# through its actor, so one game's updates apply in order while other games
+# proceed in parallel. The runtimes submit a chat's taps from one lane thread,
+# in the order Telegram sent them (see lanes.py).
+game_actors = GameActors()
+# Callback ids already handled, so a redelivered update isn't applied twice.
+seen_callbacks = TTLCache(100000, ttl=600)
+# Legal moves and check/mate/stalemate of each position, shared by status
+# text, rendering and move validation across all games.
+positions = PositionCache()
+renderer = BoardRenderer(callback_data=lambda game_id: callbacks.board_grid(handles.handle_for(game_id)), positions=positions)
+board_images = board_image.BoardImages(positions=positions) if BOARD_MODE == 'image' else None
+reaper = Reaper(waiting_players, active_games, game_actors, lambda *args: on_expired(*args))
+matchmaker = Matchmaker(lambda seeker: on_seek_expired(seeker))
+# Flag-fall of every timed game is driven by this one wheel. Its thread only
+# posts the expired games to their actors, which score and archive them on the
+# actors' threads, so a burst of flags doesn't hold up the next tick.
+clock_wheel = TimerWheel(lambda game_id: game_actors.post(game_id, flag_fall, game_id))
 
-MOVE_DOT = '🔵'
-CAPTURE_DOT = '🔴'
-SQUARE_LIGHT = ' '  
-SQUARE_DARK = ' '   
+# The services that open the databases, start threads or open files are built
+# by setup(), not on import: the engine and webhook workers are spawned, and a
+# spawned process imports the main module again.
+edit_scheduler = leaderboard = rating_service = archive = engine_pool = oracle = None
+chat_lanes = None  # polling and async runtimes only; webhook workers have their own
 
-PIECE_TO_EMOJI = {
-    'P': '♙', 'R': '♖', 'N': '♘', 'B': '♗', 'Q': '♕', 'K': '♔',
-    'p': '♟️', 'r': '♜', 'n': '♞', 'b': '♝', 'q': '♛', 'k': '♚'
-}
+def setup():
+    global edit_scheduler, leaderboard, rating_service, archive, engine_pool, oracle
+    if SHARD is None:
+        storage.init_db('chess_games.db')
+    else:
+        storage.init_db(f'chess_games.shard{SHARD}.db', shared_path='chess_games.db')
+    edit_scheduler = EditScheduler(edit_board_message)
+    leaderboard = Leaderboard(refresh=LEADERBOARD_REFRESH if SHARD is not None else None)
+    leaderboard.load()
+    rating_service = ratings.RatingService()
+    archive = Archive()
+    engine_pool = EnginePool() if SHARD is None else EnginePool(max(1, (os.cpu_count() or 1) // SHARDS))
+    oracle = Oracle()
 
-def piece_to_emoji(piece, row, col):
-    if piece is None:
-        return SQUARE_LIGHT if (row + col) % 2 == 0 else SQUARE_DARK
-    return PIECE_TO_EMOJI.get(piece.symbol(), ' ')
+# The games row holds the last snapshot, not the live position; the moves after
+# it are appended to the moves table one by one (see record_move). The current
+# selection is never persisted.
+def game_row(game_id, game):
+    # current_turn comes from the board: the handlers only flip game['current']
+    # once record_move, which may save the row, has returned.
+    snapshot_ply, snapshot_fen = game['snapshot']
+    return (game_id, game['chat_id'], game['mode'], json.dumps(game['players']), snapshot_fen,
+            game['board'].turn, None, game['message_id'], game['last_update'], snapshot_ply,
+            json.dumps(game['mirror']) if game.get('mirror') else None,
+            json.dumps(game['clock']) if game.get('clock') else None, json.dumps(game['player_ids']))
 
+@metrics.timed('save_game')
 def save_game(game_id):
+    storage.save_game(game_row(game_id, active_games[game_id]))
+
+def end_game(game_id, result=None):
+    # result is the PGN result of a game played to the end; those are archived.
+    if result is not None:
+        archive_game(game_id, result)
+    del active_games[game_id]
+    renderer.forget(game_id)
+    engine_pool.cancel(game_id)
+    clock_wheel.cancel(game_id)
+    game_actors.forget(game_id)
+    handles.forget(game_id)
+    storage.delete_game(game_id)
+
+def archive_game(game_id, result):
     game = active_games[game_id]
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
-    c.execute('''INSERT OR REPLACE INTO games (game_id, chat_id, mode, players, board_fen, current_turn, selected, message_id, last_update)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                 (game_id, game['chat_id'], game['mode'], json.dumps(game['players']), game['board'].fen(),
-                  game['current'], json.dumps(game.get('selected')), game['message_id'], game['last_update']))
-    conn.commit()
-    conn.close()
-
-def load_games():
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM games')
-    for row in c.fetchall():
-        game_id, chat_id, mode, players, board_fen, current_turn, selected, message_id, last_update = row
-        active_games[game_id] = {
-            'chat_id': chat_id,
-            'mode': mode,
-            'players': json.loads(players),
-            'player_ids': [None, None] if mode == 'bot' else json.loads(players),  
-            'board': chess.Board(board_fen),
-            'current': bool(current_turn),
-            'selected': json.loads(selected) if selected else None,
-            'message_id': message_id,
-            'last_update': last_update
-        }
-    conn.close()
-
-def update_leaderboard(winner=None, loser=None, is_draw=False, players=None, mode='pvp'):
+    white, black = game['players']
+    headers = {'Event': 'Telegram chess', 'Site': f"chat {game['chat_id']}", 'Date': time.strftime('%Y.%m.%d'),
+               'White': white, 'Black': black, 'Result': result, 'Mode': game['mode']}
+    if game.get('clock'):
+        headers['TimeControl'] = clocks.pgn_time_control(game['clock']['control'])
+    archive.submit(headers, storage.load_moves(game_id))
+
+def on_expired(kind, game_id, chat_id, message_id):
+    # Called by the reaper once the challenge or game is already gone from
+    # memory and its row queued for deletion (a game's in its actor); all
+    # that's left is the message and per-game caches.
+    handles.forget(game_id)
+    if kind == 'game':
+        renderer.forget(game_id)
+        game_actors.forget(game_id)
+        engine_pool.cancel(game_id)
+        clock_wheel.cancel(game_id)
+        if message_id:
+            edit_board_text(chat_id, message_id, "⌛ انتهت اللعبة بسبب عدم النشاط.")
+    elif message_id:
+        edit_scheduler.submit(chat_id, message_id, "⌛ انتهت صلاحية التحدي، لم ينضم أي منافس.")
+
+def edit_board_text(chat_id, message_id, text):
+    # Replaces a board with a final notice and drops its keyboard.
+    edit_scheduler.submit(chat_id, message_id, text, board_image.CAPTION if board_images is not None else None)
+
+@metrics.timed('record_move')
+def record_move(game_id, move):
+    game = active_games[game_id]
+    board = game['board']
+    snapshot = history.needs_snapshot(game, move)
+    board.push(move)
+    ply = history.game_ply(game)
+    storage.append_move(game_id, ply, history.encode_move(board.peek()))
+    if snapshot:
+        game['snapshot'] = (ply, board.fen())
+        save_game(game_id)
+    else:
+        storage.touch_game(game_id, board.turn, game['last_update'], json.dumps(game['clock']) if game.get('clock') else None)
+
+def load_game(game_id):
+    row, moves = storage.load_game(game_id)
+    if row is None:
+        return None
+    game_id, chat_id, mode, players, board_fen, current_turn, selected, message_id, last_update, snapshot_ply, mirror, clock, player_ids = row
+    board = history.replay(board_fen, moves)
+    return {
+        'chat_id': chat_id,
+        'mode': mode,
+        'players': json.loads(players),
+        # Rows saved before the player_ids column only have the usernames.
+        'player_ids': json.loads(player_ids) if player_ids else [None, None] if mode == 'bot' else json.loads(players),
+        'board': board,
+        'current': board.turn,
+        'selected': None,
+        'message_id': message_id,
+        'last_update': last_update,
+        'snapshot': (snapshot_ply or 0, board_fen),
+        'mirror': tuple(json.loads(mirror)) if mirror else None,
+        'clock': json.loads(clock) if clock else None
+    }
+
+def update_leaderboard(winner=None, loser=None, is_draw=False, players=None, mode='pvp', chat_id=None):
     if mode != 'pvp':
         return  
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
     if is_draw and players:
-        for player in players:
-            c.execute('INSERT OR IGNORE INTO leaderboard (user_id, username, points) VALUES (?, ?, 0)', 
-                      (player['id'], player['username']))
-            c.execute('UPDATE leaderboard SET points = points + 1 WHERE user_id = ?', (player['id'],))
+        leaderboard.record(chat_id, [(player['id'], player['username'], 1) for player in players])
+        rating_service.submit((players[0]['id'], players[0]['username']), (players[1]['id'], players[1]['username']), 0.5, chat_id)
     elif winner and loser:
-        c.execute('INSERT OR IGNORE INTO leaderboard (user_id, username, points) VALUES (?, ?, 0)', 
-                  (winner['id'], winner['username']))
-        c.execute('UPDATE leaderboard SET points = points + 3 WHERE user_id = ?', (winner['id'],))
-        c.execute('INSERT OR IGNORE INTO leaderboard (user_id, username, points) VALUES (?, ?, 0)', 
-                  (loser['id'], loser['username']))
-    conn.commit()
-    conn.close()
+        leaderboard.record(chat_id, [(winner['id'], winner['username'], 3), (loser['id'], loser['username'], 0)])
+        rating_service.submit((winner['id'], winner['username']), (loser['id'], loser['username']), 1, chat_id)
 
 
+# Membership is cached so board taps don't each cost a get_chat_member round-trip.
+# Positive answers are trusted for minutes, negative ones only for seconds so a
+# user who has just subscribed isn't kept waiting.
+SUBSCRIBED_TTL = 300
+NOT_SUBSCRIBED_TTL = 10
+subscription_cache = TTLCache(maxsize=50000)
+
+@metrics.timed('check_subscription')
 def check_subscription(user_id):
+    subscribed = subscription_cache.get(user_id)
+    if subscribed is not None:
+        return subscribed
     try:
-        member = bot.get_chat_member('@SYR_SB', user_id)
-        return member.status in ['member', 'administrator', 'creator']
+        status = bot.get_chat_member('@SYR_SB', user_id).status
     except:
-        return False
+        status = None
+    return remember_subscription(user_id, status)
+
+def remember_subscription(user_id, status):
+    subscribed = status in ['member', 'administrator', 'creator']
+    subscription_cache.set(user_id, subscribed, SUBSCRIBED_TTL if subscribed else NOT_SUBSCRIBED_TTL)
+    return subscribed
+
+def top_text():
+    leaders = leaderboard.top(5)
+    if not leaders:
+        return "🏆 قائمة الشطرنج فارغة!"
+    text = "🏆 توب الشطرنج (أفضل 5 لاعبين):\n"
+    for i, (username, points) in enumerate(leaders, 1):
+        text += f"{i}. {username}: {points} نقاط\n"
+    return text
+
+def chat_top_text(chat_id):
+    leaders = leaderboard.chat_top(chat_id, 5)
+    if not leaders:
+        return "🏆 لا توجد نقاط في هذه المجموعة بعد!"
+    text = "🏆 توب المجموعة (أفضل 5 لاعبين):\n"
+    for i, (username, points) in enumerate(leaders, 1):
+        text += f"{i}. {username}: {points} نقاط\n"
+    return text
+
+def points_text(user_id, user):
+    result = leaderboard.rank(user_id)
+    if result is None:
+        return f"@{user} ليس لديك نقاط بعد! العب مباريات PVP لتجميع النقاط."
+    points, rank = result
+    text = f"@{user} نقاطك في الشطرنج: {points} نقاط\n🏅 ترتيبك: #{rank}"
+    rating = ratings.get_rating(user_id)
+    if rating is not None:
+        text += f"\n📈 تصنيفك (Elo): {round(rating[0])}"
+    return text
 
 @bot.message_handler(func=lambda message: message.text.lower() == "توب الشطرنج")
 def show_leaderboard(message):
     if not check_subscription(message.from_user.id):
         bot.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
         return
-    
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
-    c.execute('SELECT username, points FROM leaderboard ORDER BY points DESC LIMIT 5')
-    leaders = c.fetchall()
-    conn.close()
-    
-    if not leaders:
-        bot.reply_to(message, "🏆 قائمة الشطرنج فارغة!")
+    bot.reply_to(message, top_text())
+
+@bot.message_handler(func=lambda message: message.text.lower() == "توب المجموعة")
+def show_chat_leaderboard(message):
+    if not check_subscription(message.from_user.id):
+        bot.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
         return
-    
-    text = "🏆 توب الشطرنج (أفضل 5 لاعبين):\n"
-    for i, (username, points) in enumerate(leaders, 1):
-        text += f"{i}. {username}: {points} نقاط\n"
-    bot.reply_to(message, text)
+    bot.reply_to(message, chat_top_text(message.chat.id))
 
 @bot.message_handler(func=lambda message: message.text.lower() == "نقاطي الشطرنج")
 def my_chess_points(message):
-    user_id = message.from_user.id
-    user = message.from_user.username or message.from_user.first_name
-    
-    if not check_subscription(user_id):
+    if not check_subscription(message.from_user.id):
         bot.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
         return
-    
-    conn = sqlite3.connect('chess_games.db')
-    c = conn.cursor()
-    c.execute('SELECT points FROM leaderboard WHERE user_id = ?', (user_id,))
-    result = c.fetchone()
-    conn.close()
-    
-    if result is None:
-        bot.reply_to(message, f"@{user} ليس لديك نقاط بعد! العب مباريات PVP لتجميع النقاط.")
-        return
-    
-    points = result[0]
-    bot.reply_to(message, f"@{user} نقاطك في الشطرنج: {points} نقاط")
+    bot.reply_to(message, points_text(message.from_user.id, message.from_user.username or message.from_user.first_name))
 
 @bot.message_handler(commands=['start', 'chess'])
 def start_chess(message):
@@ -177,10 +332,12 @@ def start_chess(message):
         "♟️ مرحبا بك في بوت الشطرنج! من خلالي يمكنك اللعب ضد أصدقائك في المجموعة. الشطرنج بشكل كامل وجميل!\n\n"
         "🔥 **مميزات البوت**:\n"
         "- 🎮 اكتب تحدي شطرنج لبدء تحدي مع لاعب آخر.\n"
+        "- ⏱ اكتب تحدي شطرنج خاطف أو تحدي شطرنج سريع للعب بوقت محدد.\n"
+        "- 🌍 اكتب بحث عن خصم في الخاص للعب ضد لاعب بمستوى قريب من أي مكان.\n"
         "- 🏆 اكتب توب الشطرنج لعرض قائمة أفضل 5 لاعبين.\n"
         "- 📊 اكتب نقاطي الشطرنج لعرض نقاطك الشخصية.\n"
         "- 🤖 جرب اللعب ضد البوت للتدريب.\n"
-        "- 📝 ملاحظة: اللعب ضد البوت مستوى سهل جدًا وتجريبي للبوت فقط.\n\n"
+        "- 📝 ملاحظة: اللعب ضد البوت للتدريب فقط ولا يمنح نقاط.\n\n"
         "اختر أدناه أو ابدأ اللعب:"
     )
     
@@ -190,7 +347,15 @@ def start_chess(message):
     markup.add(btn_add_to_group, btn_bot)
     bot.send_message(chat_id, welcome_message, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: message.text.lower() == "تحدي شطرنج")
+# Challenge commands and the time control (see clocks.py) they start the game with.
+CHALLENGE_COMMANDS = {
+    "تحدي شطرنج": None,
+    "تحدي شطرنج خاطف": 'blitz',
+    "تحدي شطرنج سريع": 'rapid',
+}
+TIME_CONTROL_NAMES = {'blitz': "خاطف 3+2", 'rapid': "سريع 10+5"}
+
+@bot.message_handler(func=lambda message: message.text.lower() in CHALLENGE_COMMANDS)
 def chess_challenge(message):
     chat_id = message.chat.id
     user_id = message.from_user.id
@@ -200,19 +365,79 @@ def chess_challenge(message):
         bot.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
         return
     
+    control = CHALLENGE_COMMANDS[message.text.lower()]
     game_id = str(uuid.uuid4())
-    waiting_players[game_id] = {'host': user, 'host_id': user_id, 'mode': 'pvp', 'chat_id': chat_id}
+    waiting_players[game_id] = {'host': user, 'host_id': user_id, 'mode': 'pvp', 'chat_id': chat_id, 'created': time.time(),
+                                'clock': control}
     markup = types.InlineKeyboardMarkup()
-    btn_join = types.InlineKeyboardButton("🎮 قبول التحدي!", callback_data=f"join_{game_id}")
+    btn_join = types.InlineKeyboardButton("🎮 قبول التحدي!", callback_data=callbacks.encode(callbacks.JOIN, 0, handles.handle_for(game_id)))
     markup.add(btn_join)
-    bot.send_message(chat_id, f"⚔ {user} يرغب بتحدي في لعبة شطرنج! هل من منافس؟", reply_markup=markup)
+    text = f"⚔ {user} يرغب بتحدي في لعبة شطرنج! هل من منافس؟"
+    if control:
+        text += f"\n⏱ الوقت: {TIME_CONTROL_NAMES[control]}"
+    msg = bot.send_message(chat_id, text, reply_markup=markup)
+    waiting_players[game_id]['message_id'] = msg.message_id
+
+@bot.message_handler(func=lambda message: message.chat.type == 'private' and message.text.lower() == matchmaking.SEEK_COMMAND)
+def seek_opponent(message):
+    user_id = message.from_user.id
+    user = message.from_user.username or message.from_user.first_name
+    
+    if not check_subscription(user_id):
+        bot.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
+        return
+    
+    if matchmaker.waiting(user_id):
+        bot.reply_to(message, "⏳ أنت في قائمة الانتظار بالفعل!")
+        return
+    
+    rating = ratings.get_rating(user_id)
+    rating = rating[0] if rating is not None else ratings.INITIAL_RATING
+    opponent = matchmaker.seek(user_id, user, message.chat.id, rating)
+    if opponent is None:
+        bot.reply_to(message, f"🔎 جارٍ البحث عن خصم بتصنيف قريب من {round(rating)}...\nاكتب \"إلغاء البحث\" للإلغاء.")
+        return
+    start_matched_game(opponent, {'user_id': user_id, 'username': user, 'chat_id': message.chat.id})
+
+@bot.message_handler(func=lambda message: message.chat.type == 'private' and message.text.lower() == matchmaking.CANCEL_COMMAND)
+def cancel_seek(message):
+    if matchmaker.cancel(message.from_user.id):
+        bot.reply_to(message, "✔️ تم إلغاء البحث عن خصم.")
+    else:
+        bot.reply_to(message, "❌ لست في قائمة الانتظار!")
+
+def start_matched_game(white, black):
+    # The player who waited longer gets white. The game lives in white's
+    # private chat and is mirrored into black's.
+    game_id = str(uuid.uuid4())
+    active_games[game_id] = {
+        'chat_id': white['chat_id'],
+        'mode': 'pvp',
+        'players': [white['username'], black['username']],
+        'player_ids': [white['user_id'], black['user_id']],
+        'board': chess.Board(),
+        'current': chess.WHITE,
+        'selected': None,
+        'message_id': None,
+        'last_update': time.time(),
+        'snapshot': (0, chess.STARTING_FEN),
+        'mirror': (black['chat_id'], None)
+    }
+    bot.send_message(white['chat_id'], f"🎯 تم العثور على خصم: {black['username']}! أنت تلعب بالأبيض.")
+    bot.send_message(black['chat_id'], f"🎯 تم العثور على خصم: {white['username']}! أنت تلعب بالأسود.")
+    msg = send_chess_board(game_id)
+    active_games[game_id]['message_id'] = msg.message_id
+    save_game(game_id)
+
+def on_seek_expired(seeker):
+    bot.send_message(seeker['chat_id'], "⌛ لم يتم العثور على خصم، اكتب \"بحث عن خصم\" للمحاولة مجدداً.")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('check_sub_'))
 def check_sub_callback(call):
     data = call.data.split('_')
     chat_id = int(data[2])
     user_id = int(data[3])
     
+    subscription_cache.pop(user_id)
     if check_subscription(user_id):
         bot.answer_callback_query(call.id, "✔️ تم التحقق!")
         bot.delete_message(chat_id, call.message.message_id)
@@ -224,7 +449,6 @@ def check_sub_callback(call):
     else:
         bot.answer_callback_query(call.id, "❌ لم تشترك بعد!", show_alert=True)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('mode_'))
 def choose_mode(call):
     data = call.data.split('_')
     mode = data[1]
@@ -238,20 +462,10 @@ def choose_mode(call):
     
     game_id = str(uuid.uuid4())
     if mode == 'pvp':
-        waiting_players[game_id] = {'host': user, 'host_id': user_id, 'mode': 'pvp', 'chat_id': chat_id}
+        waiting_players[game_id] = {'host': user, 'host_id': user_id, 'mode': 'pvp', 'chat_id': chat_id, 'created': time.time()}
         show_join_button(game_id, user, chat_id)
     elif mode == 'bot':
-        active_games[game_id] = {
-            'chat_id': chat_id,
-            'mode': 'bot',
-            'players': [user, 'bot'],
-            'player_ids': [user_id, None],
-            'board': chess.Board(),
-            'current': chess.WHITE,
-            'selected': None,
-            'message_id': None,
-            'last_update': 0
-        }
+        active_games[game_id] = new_bot_game(chat_id, user, user_id)
         msg = send_chess_board(game_id, call)
         active_games[game_id]['message_id'] = msg.message_id
         save_game(game_id)
@@ -259,15 +473,31 @@ def choose_mode(call):
     
     bot.answer_callback_query(call.id, f"✔ تم اختيار وضع {mode.upper()}")
 
-def show_join_button(game_id, host, chat_id):
+def new_bot_game(chat_id, user, user_id):
+    return {
+        'chat_id': chat_id,
+        'mode': 'bot',
+        'players': [user, 'bot'],
+        'player_ids': [user_id, None],
+        'board': chess.Board(),
+        'current': chess.WHITE,
+        'selected': None,
+        'message_id': None,
+        'last_update': time.time(),
+        'snapshot': (0, chess.STARTING_FEN)
+    }
+
+def join_markup(game_id):
     markup = types.InlineKeyboardMarkup()
-    btn_join = types.InlineKeyboardButton("🎮 انضم للعبة!", callback_data=f"join_{game_id}")
+    btn_join = types.InlineKeyboardButton("🎮 انضم للعبة!", callback_data=callbacks.encode(callbacks.JOIN, 0, handles.handle_for(game_id)))
     markup.add(btn_join)
-    bot.send_message(chat_id, f"⚔ {host} يبحث عن خصم في وضع PVP!", reply_markup=markup)
+    return markup
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('join_'))
-def join_game(call):
-    game_id = call.data.split('_')[1]
+def show_join_button(game_id, host, chat_id):
+    msg = bot.send_message(chat_id, f"⚔ {host} يبحث عن خصم في وضع PVP!", reply_markup=join_markup(game_id))
+    waiting_players[game_id]['message_id'] = msg.message_id
+
+def join_game(call, game_id):
     user_id = call.from_user.id
     challenger = call.from_user.username or call.from_user.first_name
     
@@ -284,53 +514,55 @@ def join_game(call):
         return
         
     chat_id = waiting_players[game_id]['chat_id']
-    active_games[game_id] = {
-        'chat_id': chat_id,
+    control = waiting_players[game_id].get('clock')
+    active_games[game_id] = new_pvp_game(waiting_players.pop(game_id), challenger, user_id)
+    bot.delete_message(chat_id, call.message.message_id)
+    msg = send_chess_board(game_id, call)
+    active_games[game_id]['message_id'] = msg.message_id
+    save_game(game_id)
+    if control:
+        clock_wheel.schedule(game_id, clocks.deadline(active_games[game_id]['clock'], chess.WHITE))
+
+def new_pvp_game(challenge, challenger, user_id):
+    control = challenge.get('clock')
+    return {
+        'chat_id': challenge['chat_id'],
         'mode': 'pvp',
-        'players': [waiting_players[game_id]['host'], challenger],
-        'player_ids': [waiting_players[game_id]['host_id'], user_id],
+        'players': [challenge['host'], challenger],
+        'player_ids': [challenge['host_id'], user_id],
         'board': chess.Board(),
         'current': chess.WHITE,
         'selected': None,
         'message_id': None,
-        'last_update': 0
+        'last_update': time.time(),
+        'snapshot': (0, chess.STARTING_FEN),
+        'clock': clocks.new_clock(control) if control else None
     }
-    del waiting_players[game_id]
-    bot.delete_message(chat_id, call.message.message_id)
-    msg = send_chess_board(game_id, call)
-    active_games[game_id]['message_id'] = msg.message_id
-    save_game(game_id)
 
-def send_chess_board(game_id, call=None):
+def clock_status(game):
+    clock = game.get('clock')
+    if not clock:
+        return ""
+    white = clocks.format_time(clocks.remaining(clock, chess.WHITE, game['current']))
+    black = clocks.format_time(clocks.remaining(clock, chess.BLACK, game['current']))
+    return f"⏱ الأبيض: {white} | الأسود: {black}\n"
+
+@metrics.timed('render')
+def board_markup(game_id, game):
+    if board_images is None:
+        return renderer.render(game_id, game['board'], game.get('selected'), game['current'])
+    key, png = board_images.render(game['board'], game.get('selected'))
+    keyboard = board_image.coordinate_keyboard(callbacks.coordinate_grid(handles.handle_for(game_id)))
+    return board_image.BoardPhoto(key, png, keyboard)
+
+def board_message(game_id):
+    # Status text and markup of a new board message; a game that is already
+    # over is scored and ended here.
     game = active_games[game_id]
     chat_id = game['chat_id']
     board = game['board']
-    selected = game.get('selected')
-    markup = types.InlineKeyboardMarkup(row_width=8)
-    
-    possible_moves = []
-    if selected:
-        square = chess.square(selected[1], 7 - selected[0])
-        for move in board.legal_moves:
-            if move.from_square == square:
-                possible_moves.append(move.to_square)
-    
-    for row in range(7, -1, -1):
-        row_buttons = []
-        for col in range(8):
-            square = chess.square(col, row)
-            piece = board.piece_at(square)
-            text = piece_to_emoji(piece, row, col)
-            
-            if selected and square in possible_moves:
-                if piece and piece.color != game['current']:
-                    text = CAPTURE_DOT + text
-                else:
-                    text = MOVE_DOT + text
-            
-            callback = f"move_{game_id}_{7-row}_{col}"
-            row_buttons.append(types.InlineKeyboardButton(text, callback_data=callback))
-        markup.add(*row_buttons)
+    markup = board_markup(game_id, game)
+    analysis = positions.get(board)
     
     if game['mode'] == 'pvp':
         p1, p2 = game['players']
@@ -338,39 +570,46 @@ def send_chess_board(game_id, call=None):
         p1, p2 = game['players'][0], 'البوت'
     
     current_player = p1 if game['current'] == chess.WHITE else p2
-    status = f"🎮 اللاعبون:\nالأبيض: {p1}\nالأسود: {p2}\n\nالدور لـ: {current_player}\n\n"
+    status = f"🎮 اللاعبون:\nالأبيض: {p1}\nالأسود: {p2}\n\nالدور لـ: {current_player}\n"
+    status += clock_status(game) + "\n"
     
-    if board.is_check():
+    if analysis.check:
         status += "🚨 كش!"
-    if board.is_checkmate():
+    if analysis.checkmate:
         if game['mode'] == 'pvp':
             winner = {'id': game['player_ids'][1] if game['current'] == chess.WHITE else game['player_ids'][0], 
                       'username': p2 if game['current'] == chess.WHITE else p1}
             loser = {'id': game['player_ids'][0] if game['current'] == chess.WHITE else game['player_ids'][1], 
                      'username': p1 if game['current'] == chess.WHITE else p2}
-            update_leaderboard(winner, loser, mode=game['mode'])
+            update_leaderboard(winner, loser, mode=game['mode'], chat_id=chat_id)
         status += f"🏆 كش مات! الفائز: {p2 if game['current'] == chess.WHITE else p1}"
-        del active_games[game_id]
-        conn = sqlite3.connect('chess_games.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
-        conn.commit()
-        conn.close()
-    elif board.is_stalemate():
+        end_game(game_id, '0-1' if game['current'] == chess.WHITE else '1-0')
+    elif analysis.stalemate:
         status += "🤝 تعادل!"
         if game['mode'] == 'pvp':
             players = [
                 {'id': game['player_ids'][0], 'username': game['players'][0]},
                 {'id': game['player_ids'][1], 'username': game['players'][1]}
             ]
-            update_leaderboard(is_draw=True, players=players, mode=game['mode'])
-        del active_games[game_id]
-        conn = sqlite3.connect('chess_games.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
-        conn.commit()
-        conn.close()
-    
+            update_leaderboard(is_draw=True, players=players, mode=game['mode'], chat_id=chat_id)
+        end_game(game_id, '1/2-1/2')
+    return status, markup
+
+def send_chess_board(game_id, call=None):
+    game = active_games[game_id]
+    status, markup = board_message(game_id)
+    msg = send_board_message(game['chat_id'], status, markup)
+    if game.get('mirror'):
+        # Matchmade games show the board in both players' private chats.
+        mirror_chat = game['mirror'][0]
+        game['mirror'] = (mirror_chat, send_board_message(mirror_chat, status, markup).message_id)
+    return msg
+
+def send_board_message(chat_id, status, markup):
+    if isinstance(markup, board_image.BoardPhoto):
+        msg = bot.send_photo(chat_id, board_images.photo(markup.key, markup.png), caption=status, reply_markup=markup.keyboard)
+        board_images.remember(markup.key, msg)
+        return msg
     return bot.send_message(chat_id, status, reply_markup=markup)
 
 def update_chess_board(game_id, call=None):
@@ -379,31 +618,8 @@ def update_chess_board(game_id, call=None):
     board = game['board']
     message_id = game['message_id']
     selected = game.get('selected')
-    markup = types.InlineKeyboardMarkup(row_width=8)
-    
-    possible_moves = []
-    if selected:
-        square = chess.square(selected[1], 7 - selected[0])
-        for move in board.legal_moves:
-            if move.from_square == square:
-                possible_moves.append(move.to_square)
-    
-    for row in range(7, -1, -1):
-        row_buttons = []
-        for col in range(8):
-            square = chess.square(col, row)
-            piece = board.piece_at(square)
-            text = piece_to_emoji(piece, row, col)
-            
-            if selected and square in possible_moves:
-                if piece and piece.color != game['current']:
-                    text = CAPTURE_DOT + text
-                else:
-                    text = MOVE_DOT + text
-            
-            callback = f"move_{game_id}_{7-row}_{col}"
-            row_buttons.append(types.InlineKeyboardButton(text, callback_data=callback))
-        markup.add(*row_buttons)
+    markup = board_markup(game_id, game)
+    analysis = positions.get(board)
     
     if game['mode'] == 'pvp':
         p1, p2 = game['players']
@@ -411,61 +627,66 @@ def update_chess_board(game_id, call=None):
         p1, p2 = game['players'][0], 'البوت'
     
     current_player = p1 if game['current'] == chess.WHITE else p2
-    status = f"🎮 اللاعبون:\nالأبيض: {p1}\nالأسود: {p2}\n\nالدور لـ: {current_player}\n\n"
+    status = f"🎮 اللاعبون:\nالأبيض: {p1}\nالأسود: {p2}\n\nالدور لـ: {current_player}\n"
+    status += clock_status(game) + "\n"
     
-    if board.is_check():
+    if analysis.check:
         status += "🚨 كش!"
-    if board.is_checkmate():
+    if analysis.checkmate:
         if game['mode'] == 'pvp':
             winner = {'id': game['player_ids'][1] if game['current'] == chess.WHITE else game['player_ids'][0], 
                       'username': p2 if game['current'] == chess.WHITE else p1}
             loser = {'id': game['player_ids'][0] if game['current'] == chess.WHITE else game['player_ids'][1], 
                      'username': p1 if game['current'] == chess.WHITE else p2}
-            update_leaderboard(winner, loser, mode=game['mode'])
+            update_leaderboard(winner, loser, mode=game['mode'], chat_id=chat_id)
         status += f"🏆 كش مات! الفائز: {p2 if game['current'] == chess.WHITE else p1}"
-        del active_games[game_id]
-        conn = sqlite3.connect('chess_games.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
-        conn.commit()
-        conn.close()
-        return
-    elif board.is_stalemate():
+        end_game(game_id, '0-1' if game['current'] == chess.WHITE else '1-0')
+        return
+    elif analysis.stalemate:
         status += "🤝 تعادل!"
         if game['mode'] == 'pvp':
             players = [
                 {'id': game['player_ids'][0], 'username': game['players'][0]},
                 {'id': game['player_ids'][1], 'username': game['players'][1]}
             ]
-            update_leaderboard(is_draw=True, players=players, mode=game['mode'])
-        del active_games[game_id]
-        conn = sqlite3.connect('chess_games.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
-        conn.commit()
-        conn.close()
+            update_leaderboard(is_draw=True, players=players, mode=game['mode'], chat_id=chat_id)
+        end_game(game_id, '1/2-1/2')
         return
     
-    current_time = time.time()
-    if current_time - game['last_update'] < 0.5:
-        time.sleep(0.5 - (current_time - game['last_update']))
     game['last_update'] = time.time()
-    
-    try:
-        bot.edit_message_text(status, chat_id, message_id, reply_markup=markup)
-    except telebot.apihelper.ApiTelegramException as e:
-        if e.error_code == 400 and 'not modified' in e.description.lower():
-            pass
-        else:
-            raise
-    save_game(game_id)
+    edit_scheduler.submit(chat_id, message_id, status, markup)
+    if game.get('mirror'):
+        edit_scheduler.submit(*game['mirror'], status, markup)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('move_'))
-def handle_move(call):
-    data = call.data.split('_')
-    game_id = data[1]
-    row = int(data[2])
-    col = int(data[3])
+def request_bot_move(game_id):
+    # Book and tablebase moves are answered on the spot. Otherwise the search
+    # runs in the engine process pool, whose callback only posts the reply to
+    # the game's actor; apply_bot_move changes the board on an actor thread.
+    game = active_games[game_id]
+    ply = history.game_ply(game)
+    move = oracle.probe(game['board'])
+    if move is not None:
+        game_actors.submit(game_id, apply_bot_move, game_id, ply, move.uci())
+        return
+    started = time.perf_counter()
+    def on_done(uci):
+        metrics.observe('engine_move', time.perf_counter() - started)
+        game_actors.post(game_id, apply_bot_move, game_id, ply, uci)
+    if not engine_pool.submit(game_id, game['board'], BOT_LEVEL, on_done):
+        # Pool saturated: answer inline with the cheapest level instead of queueing.
+        with metrics.span('engine_move_inline'):
+            move = engine.choose_move(game['board'], 'easy')
+        game_actors.submit(game_id, apply_bot_move, game_id, ply, move.uci() if move else None)
+
+def apply_bot_move(game_id, ply, uci):
+    game = active_games.get(game_id)
+    if game is None or uci is None or history.game_ply(game) != ply:
+        return
+    record_move(game_id, chess.Move.from_uci(uci))
+    game['current'] = chess.WHITE
+    update_chess_board(game_id)
+
+def handle_move(call, game_id, row, col):
     user_id = call.from_user.id
     user = call.from_user.username or call.from_user.first_name
 
@@ -480,6 +701,12 @@ def handle_move(call):
     game = active_games[game_id]
     board = game['board']
 
+    # The wheel may not have ticked yet; a flag that has fallen still loses.
+    if game.get('clock') and clocks.remaining(game['clock'], game['current'], game['current']) <= 0:
+        bot.answer_callback_query(call.id, "⌛ انتهى الوقت!", show_alert=True)
+        flag_fall(game_id)
+        return
+
     if game['mode'] == 'pvp':
         player_index = 0 if user == game['players'][0] else 1 if user == game['players'][1] else -1
         if player_index == -1:
@@ -516,27 +743,130 @@ def handle_move(call):
     if board.piece_at(from_square).piece_type == chess.PAWN and (chess.square_rank(to_square) == 7 or chess.square_rank(to_square) == 0):
         move.promotion = chess.QUEEN
 
-    if move in board.legal_moves:
-        board.push(move)
+    if positions.is_legal(board, move):
+        if game.get('clock'):
+            clocks.press(game['clock'], game['current'])
+        record_move(game_id, move)
         game.pop('selected', None)
         game['current'] = not game['current']
         
-        if board.is_game_over():
+        if positions.game_over_reason(board) is not None:
             update_chess_board(game_id, call)
             return
         
-        if game['mode'] == 'bot' and game['current'] == chess.BLACK:
-            legal_moves = list(board.legal_moves)
-            bot_move = random.choice(legal_moves)
-            board.push(bot_move)
-            game['current'] = chess.WHITE
-        
+        if game.get('clock'):
+            clock_wheel.schedule(game_id, clocks.deadline(game['clock'], game['current']))
         update_chess_board(game_id, call)
+        if game['mode'] == 'bot' and game['current'] == chess.BLACK:
+            request_bot_move(game_id)
     else:
         bot.answer_callback_query(call.id, "❌ حركة غير صالحة!", show_alert=True)
         game.pop('selected', None)
         update_chess_board(game_id, call)
 
+def flag_fall(game_id):
+    # Runs in the game's actor when its timer fires. The side to move has run
+    # out of time and loses, unless the opponent has no mating material left.
+    game = active_games.get(game_id)
+    if game is None or not game.get('clock'):
+        return
+    clock = game['clock']
+    if clocks.remaining(clock, game['current'], game['current']) > 0:
+        clock_wheel.schedule(game_id, clocks.deadline(clock, game['current']))
+        return
+    players = game['players']
+    player_ids = game['player_ids']
+    loser = 0 if game['current'] == chess.WHITE else 1
+    winner = 1 - loser
+    if game['board'].has_insufficient_material(not game['current']):
+        text = f"⌛ انتهى وقت {players[loser]}، ولا يملك {players[winner]} ما يكفي للفوز.\n🤝 تعادل!"
+        update_leaderboard(is_draw=True, players=[{'id': player_ids[0], 'username': players[0]},
+                                                  {'id': player_ids[1], 'username': players[1]}],
+                           mode=game['mode'], chat_id=game['chat_id'])
+        result = '1/2-1/2'
+    else:
+        text = f"⌛ انتهى وقت {players[loser]}!\n🏆 الفائز: {players[winner]}"
+        update_leaderboard({'id': player_ids[winner], 'username': players[winner]},
+                           {'id': player_ids[loser], 'username': players[loser]}, mode=game['mode'], chat_id=game['chat_id'])
+        result = '0-1' if loser == 0 else '1-0'
+    edit_board_text(game['chat_id'], game['message_id'], text)
+    if game.get('mirror'):
+        edit_board_text(*game['mirror'], text)
+    end_game(game_id, result)
+
+# Buttons sent before compact payloads were introduced still carry the old
+# "join_<uuid>" and "move_<uuid>_<row>_<col>" strings.
+def legacy_join(call):
+    game_id = call.data.split('_')[1]
+    game_actors.submit(game_id, join_game, call, game_id)
+
+def legacy_move(call):
+    data = call.data.split('_')
+    game_actors.submit(data[1], handle_move, call, data[1], int(data[2]), int(data[3]))
+
+def board_tap(call, game_id, square):
+    handle_move(call, game_id, 7 - chess.square_rank(square), chess.square_file(square))
+
+def coordinate_tap(call, game_id, value):
+    # Image boards take a square as two taps, file then rank; the pending files
+    # are kept per user in game['entries'] so an onlooker's taps can't
+    # interfere with the mover's.
+    game = active_games.get(game_id)
+    if game is None:
+        bot.answer_callback_query(call.id, "❌ اللعبة انتهت!", show_alert=True)
+        return
+    user_id = call.from_user.id
+    if value == callbacks.COORD_CANCEL:
+        if user_id in game['player_ids']:
+            game.get('entries', {}).pop(user_id, None)
+            if game.get('selected'):
+                game['selected'] = None
+                update_chess_board(game_id, call)
+        bot.answer_callback_query(call.id)
+        return
+    if value < 8:
+        game.setdefault('entries', {})[user_id] = value
+        bot.answer_callback_query(call.id, f"العمود {chess.FILE_NAMES[value]}، اختر الصف")
+        return
+    file = game.get('entries', {}).pop(user_id, None)
+    if file is None:
+        bot.answer_callback_query(call.id, "❌ اختر العمود أولاً!", show_alert=True)
+        return
+    handle_move(call, game_id, 7 - (value - 8), file)
+
+CALLBACK_PREFIXES = {
+    'check': check_sub_callback,
+    'mode': choose_mode,
+    'join': legacy_join,
+    'move': legacy_move,
+}
+CALLBACK_ACTIONS = {
+    callbacks.MOVE: board_tap,
+    callbacks.JOIN: lambda call, game_id, square: join_game(call, game_id),
+    callbacks.COORD: coordinate_tap,
+}
+
+@bot.callback_query_handler(func=lambda call: True)
+def on_callback(call):
+    if seen_callbacks.add(call.id, True):
+        dispatch_callback(call)
+
+def dispatch_callback(call):
+    prefix, sep, _ = call.data.partition('_')
+    handler = CALLBACK_PREFIXES.get(prefix) if sep else None
+    if handler is not None:
+        handler(call)
+        return
+    payload = callbacks.decode(call.data)
+    if payload is None or payload[0] not in CALLBACK_ACTIONS:
+        return
+    action, square, handle = payload
+    game_id = handles.game_for(handle)
+    if game_id is None:
+        bot.answer_callback_query(call.id, "❌ اللعبة انتهت!", show_alert=True)
+        return
+    game_actors.submit(game_id, CALLBACK_ACTIONS[action], call, game_id, square)
+
 @bot.message_handler(commands=['help'])
 def help_command(message):
     if not check_subscription(message.from_user.id):
@@ -547,8 +877,11 @@ def help_command(message):
 **الأوامر والتعليمات:**
 - /chess: بدء لعبة جديدة
 - اكتب "تحدي شطرنج" لتحدي لاعب في المجموعة
+- اكتب "تحدي شطرنج خاطف" (3 دقائق + 2 ثانية لكل نقلة) أو "تحدي شطرنج سريع" (10 دقائق + 5 ثوانٍ) لتحدٍّ بوقت محدد، ومن ينفد وقته يخسر
+- اكتب "بحث عن خصم" في الخاص للعب ضد لاعب بتصنيف قريب، و"إلغاء البحث" للإلغاء
 - اكتب "توب الشطرنج" لعرض أفضل 5 لاعبين بناءً على النقاط
-- اكتب "نقاطي الشطرنج" لعرض نقاطك الشخصية
+- اكتب "توب المجموعة" لعرض أفضل 5 لاعبين في هذه المجموعة
+- اكتب "نقاطي الشطرنج" لعرض نقاطك الشخصية وترتيبك
 - /help: عرض هذا الدليل
 
 **نظام النقاط (في وضع لاعب ضد لاعب فقط):**
@@ -571,6 +904,239 @@ def help_command(message):
 """
     bot.reply_to(message, help_text)
 
+# Handlers of the async runtime (see async_runtime.py), registered there in
+# place of the synchronous ones in ASYNC_HANDLERS. The Bot API calls whose
+# result they need are awaited on the event loop through `api`, the
+# AsyncTeleBot; SQLite, rendering and the game actors are awaited through
+# `run`, which calls a function on the handler pool.
+async def check_subscription_async(api, user_id):
+    subscribed = subscription_cache.get(user_id)
+    if subscribed is not None:
+        return subscribed
+    try:
+        status = (await api.get_chat_member('@SYR_SB', user_id)).status
+    except Exception:
+        status = None
+    return remember_subscription(user_id, status)
+
+async def reply_if_subscribed_async(api, run, message, text, *args):
+    if not await check_subscription_async(api, message.from_user.id):
+        await api.reply_to(message, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!")
+        return
+    await api.reply_to(message, await run(text, *args))
+
+async def show_leaderboard_async(api, run, message):
+    await reply_if_subscribed_async(api, run, message, top_text)
+
+async def show_chat_leaderboard_async(api, run, message):
+    await reply_if_subscribed_async(api, run, message, chat_top_text, message.chat.id)
+
+async def my_chess_points_async(api, run, message):
+    await reply_if_subscribed_async(api, run, message, points_text, message.from_user.id,
+                                    message.from_user.username or message.from_user.first_name)
+
+async def send_chess_board_async(api, run, game_id, game):
+    status, markup = await run(board_message, game_id)
+    if isinstance(markup, board_image.BoardPhoto):
+        msg = await api.send_photo(game['chat_id'], board_images.photo(markup.key, markup.png), caption=status,
+                                   reply_markup=markup.keyboard)
+        board_images.remember(markup.key, msg)
+    else:
+        msg = await api.send_message(game['chat_id'], status, reply_markup=markup)
+    game['message_id'] = msg.message_id
+    await run(save_game, game_id)
+
+async def choose_mode_async(api, run, call):
+    data = call.data.split('_')
+    mode = data[1]
+    chat_id = int(data[2])
+    user_id = call.from_user.id
+    user = call.from_user.username or call.from_user.first_name
+
+    if not await check_subscription_async(api, user_id):
+        await api.answer_callback_query(call.id, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!", show_alert=True)
+        return
+
+    game_id = str(uuid.uuid4())
+    if mode == 'pvp':
+        waiting_players[game_id] = {'host': user, 'host_id': user_id, 'mode': 'pvp', 'chat_id': chat_id, 'created': time.time()}
+        markup = await run(join_markup, game_id)
+        msg = await api.send_message(chat_id, f"⚔ {user} يبحث عن خصم في وضع PVP!", reply_markup=markup)
+        waiting_players[game_id]['message_id'] = msg.message_id
+    elif mode == 'bot':
+        game = active_games[game_id] = new_bot_game(chat_id, user, user_id)
+        await send_chess_board_async(api, run, game_id, game)
+        await api.delete_message(chat_id, call.message.message_id)
+
+    await api.answer_callback_query(call.id, f"✔ تم اختيار وضع {mode.upper()}")
+
+async def join_game_async(api, run, call, game_id):
+    # Joins are not sent to the game's actor: nothing is awaited between
+    # finding the challenge and taking it, so two joiners can't both get it.
+    user_id = call.from_user.id
+    challenger = call.from_user.username or call.from_user.first_name
+
+    if not await check_subscription_async(api, user_id):
+        await api.answer_callback_query(call.id, "⚠️ يرجى الاشتراك في @SYR_SB أولاً!", show_alert=True)
+        return
+
+    challenge = waiting_players.get(game_id)
+    if challenge is None:
+        await api.answer_callback_query(call.id, "❌ اللعبة لم تعد متاحة!", show_alert=True)
+        return
+
+    if challenger == challenge['host']:
+        await api.answer_callback_query(call.id, "❌ لا يمكنك لعب نفسك!", show_alert=True)
+        return
+
+    game = active_games[game_id] = new_pvp_game(waiting_players.pop(game_id), challenger, user_id)
+    await api.delete_message(challenge['chat_id'], call.message.message_id)
+    await send_chess_board_async(api, run, game_id, game)
+    if game['clock']:
+        clock_wheel.schedule(game_id, clocks.deadline(game['clock'], chess.WHITE))
+
+async def on_callback_async(api, run, call):
+    if not seen_callbacks.add(call.id, True):
+        return
+    prefix, sep, _ = call.data.partition('_')
+    if sep and prefix == 'mode':
+        await choose_mode_async(api, run, call)
+        return
+    payload = None if sep and prefix in CALLBACK_PREFIXES else callbacks.decode(call.data)
+    if payload is not None and payload[0] == callbacks.JOIN:
+        game_id = await run(handles.game_for, payload[2])
+        if game_id is None:
+            await api.answer_callback_query(call.id, "❌ اللعبة انتهت!", show_alert=True)
+            return
+        await join_game_async(api, run, call, game_id)
+        return
+    # Board taps go to their chat's lane before anything is awaited, so they
+    # reach the game's actor in the order they arrived. A tap answers through
+    # the loop and edits through the edit scheduler; only a player whose
+    # subscription has dropped out of the cache waits for Telegram on the lane.
+    if payload is not None:
+        chat_lanes.put(callback_key(call), dispatch_callback, call)
+        return
+    await run(dispatch_callback, call)
+
+ASYNC_HANDLERS = {
+    show_leaderboard: show_leaderboard_async,
+    show_chat_leaderboard: show_chat_leaderboard_async,
+    my_chess_points: my_chess_points_async,
+    on_callback: on_callback_async,
+}
+
+
+def register_metrics():
+    metrics.gauge('active_games', 'Games resident in memory.', lambda: active_games.stats()['size'])
+    metrics.gauge('waiting_players', 'Open challenges.', lambda: len(waiting_players))
+    metrics.gauge('running_clocks', 'Timed games whose clock is running.', lambda: len(clock_wheel))
+    metrics.counter('clock_timers_fired', 'Clock timers that fired.', lambda: clock_wheel.fired)
+    metrics.gauge('matchmaking_queue', 'Players waiting for a matchmade opponent.', lambda: len(matchmaker))
+    metrics.counter('matchmaking_pairs', 'Matchmade games started.', lambda: matchmaker.matched)
+    metrics.counter('matchmaking_timeouts', 'Players dropped from matchmaking unpaired.', lambda: matchmaker.timed_out)
+    metrics.counter('games_loaded', 'Games hydrated from SQLite.', lambda: active_games.misses)
+    metrics.gauge('subscription_cache_hit_rate', 'Share of subscription checks answered from cache.',
+                  lambda: subscription_cache.stats()['hit_rate'])
+    metrics.gauge('games_cache_hit_rate', 'Share of game lookups answered from memory.',
+                  lambda: active_games.hits / max(active_games.hits + active_games.misses, 1))
+    metrics.gauge('edit_queue', 'Board edits waiting to be sent.', edit_scheduler.pending)
+    metrics.counter('edits_sent', 'Board edits sent.', lambda: edit_scheduler.sent)
+    metrics.counter('edits_coalesced', 'Board edits superseded before being sent.', lambda: edit_scheduler.coalesced)
+    metrics.counter('api_rate_limited', 'Bot API calls answered with 429.', lambda: api_errors.rate_limited)
+    metrics.counter('api_errors', 'Bot API calls that failed otherwise.', lambda: api_errors.errors)
+    metrics.counter('handler_errors', 'Updates whose handler raised.', lambda: game_actors.failed)
+    metrics.counter('game_contention', 'Taps that waited behind another update of the same game.',
+                    lambda: game_actors.contended)
+    metrics.labeled('hot_game_waits', 'Updates that waited behind another one, for the most contended games.',
+                    'game', game_actors.hot)
+    metrics.gauge('position_cache_hit_rate', 'Share of position analyses answered from cache.',
+                  lambda: positions.stats()['hit_rate'])
+    metrics.gauge('engine_queue', 'Engine searches pending.', engine_pool.queue_depth)
+    metrics.counter('engine_rejected', 'Engine searches refused because the pool was full.', lambda: engine_pool.rejected)
+    for name, help in (('book_hits', 'Bot moves taken from the opening book.'),
+                       ('book_misses', 'Positions the opening book had no move for.'),
+                       ('tablebase_hits', 'Bot moves taken from the endgame tablebases.'),
+                       ('tablebase_misses', 'Endgame positions the tablebases could not answer.')):
+        metrics.counter(name, help, lambda name=name: oracle.stats()[name])
+    metrics.counter('storage_batches', 'Write-behind transactions committed.', lambda: storage.writer.batches)
+    metrics.counter('storage_rows', 'Rows written by the write-behind queue.', lambda: storage.writer.rows_written)
+
+def start_metrics(offset=0):
+    # In webhook mode the front uses CHESS_METRICS_PORT and shard N the port N + 1 above it.
+    if metrics.ENABLED:
+        register_metrics()
+        metrics.serve(metrics.PORT + offset)
+
+def start_services():
+    # Nothing is loaded up front; only bot games interrupted while the engine
+    # was thinking are hydrated so their reply can be resumed.
+    for (game_id,) in storage.query("SELECT game_id FROM games WHERE mode = 'bot' AND current_turn = 0"):
+        request_bot_move(game_id)
+    # Clocks kept running while the bot was down; flags that fell meanwhile
+    # fire on the first tick.
+    for game_id, clock, current_turn in storage.query("SELECT game_id, clock, current_turn FROM games WHERE clock IS NOT NULL"):
+        clock_wheel.schedule(game_id, clocks.deadline(json.loads(clock), bool(current_turn)))
+    clock_wheel.start()
+    reaper.start()
+    matchmaker.start()
+
+def stop_services():
+    metrics.close()
+    matchmaker.close()
+    clock_wheel.close()
+    reaper.close()
+    rating_service.close()
+    archive.close()
+    engine_pool.close()
+    if chat_lanes is not None:
+        chat_lanes.close()
+    game_actors.close()
+    oracle.close()
+    edit_scheduler.close()
+    storage.close()
+
+def run_shard(updates):
+    # Entry point of a webhook worker process.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    setup()
+    start_metrics(int(SHARD) + 1)
+    start_services()
+    try:
+        webhook.consume(bot, updates)
+    finally:
+        stop_services()
+
+def main():
+    global chat_lanes
+    # SIGTERM normally skips atexit; turn it into a clean exit so the write-behind
+    # queue is flushed before the process goes away.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    setup()
+    start_metrics()
+
+    if RUNTIME == 'webhook':
+        # This process only routes updates; the games live in the workers.
+        if WEBHOOK_URL:
+            bot.remove_webhook()
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        try:
+            webhook.run(run_shard, SHARDS, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET)
+        finally:
+            stop_services()
+        return
+
+    chat_lanes = Lanes()
+    start_services()
+    try:
+        if RUNTIME == 'async':
+            import async_runtime
+            async_runtime.run(bot, api_errors=api_errors, native=ASYNC_HANDLERS)
+        else:
+            poll_in_lanes(bot, chat_lanes)
+            bot.polling()
+    finally:
+        stop_services()
 
-load_games()
-bot.polling()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,55 @@
+import math
+import time
+
+import chess
+
+# name -> (seconds per player, increment per move)
+TIME_CONTROLS = {
+    'blitz': (3 * 60, 2),
+    'rapid': (10 * 60, 5),
+}
+
+# A clock is a JSON-friendly dict stored with the game:
+# {'control': name, 'remaining': [white, black], 'started': time the side to
+# move started thinking}. Only the side to move is running, so its time left
+# is remaining minus the time since 'started'.
+
+
+def new_clock(control, now=None):
+    base, _ = TIME_CONTROLS[control]
+    return {'control': control, 'remaining': [base, base], 'started': time.time() if now is None else now}
+
+
+def _index(color):
+    return 0 if color == chess.WHITE else 1
+
+
+def remaining(clock, color, turn, now=None):
+    left = clock['remaining'][_index(color)]
+    if color == turn:
+        left -= (time.time() if now is None else now) - clock['started']
+    return max(left, 0)
+
+
+def press(clock, color, now=None):
+    # color has just moved: charge its thinking time, add the increment and
+    # start the opponent's clock.
+    now = time.time() if now is None else now
+    i = _index(color)
+    clock['remaining'][i] -= now - clock['started']
+    clock['remaining'][i] += TIME_CONTROLS[clock['control']][1]
+    clock['started'] = now
+
+
+def deadline(clock, turn):
+    return clock['started'] + clock['remaining'][_index(turn)]
+
+
+def pgn_time_control(control):
+    base, increment = TIME_CONTROLS[control]
+    return f'{base}+{increment}'
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(math.ceil(seconds), 60)
+    return f'{minutes}:{seconds:02d}'
@@ -0,0 +1,285 @@
+import threading
+import time
+
+import chess
+import chess.polyglot
+
+# Difficulty -> (maximum depth, seconds per move). The time is a hard limit:
+# the search is abandoned mid-iteration once it runs out.
+LEVELS = {
+    'easy': (1, 0.2),
+    'medium': (3, 1.0),
+    'hard': (5, 2.5),
+}
+DEFAULT_LEVEL = 'medium'
+
+TT_SIZE = 500000
+CHECK_EVERY = 64    # nodes between clock checks
+MAX_PLY = 64
+
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000
+INFINITY = 10 ** 9
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+# Piece-square tables from white's point of view, a8 first (as printed).
+PST = [
+    None,
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0],
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0],
+    [-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20],
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20],
+]
+
+# Shared by every search: positions recur across games, so a hit found while
+# thinking for one game is just as valid for another.
+_tt = {}
+_tt_lock = threading.Lock()
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board):
+    score = 0
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    for piece_type in range(chess.PAWN, chess.KING + 1):
+        value = PIECE_VALUES[piece_type]
+        table = PST[piece_type]
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        for square in chess.scan_forward(pieces & white):
+            score += value + table[square ^ 56]
+        for square in chess.scan_forward(pieces & black):
+            score -= value + table[square]
+    return score if board.turn == chess.WHITE else -score
+
+
+def _to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root.
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class Search:
+    def __init__(self, board, deadline, tt=_tt, tt_size=TT_SIZE):
+        self.board = board
+        self.deadline = deadline
+        self.tt = tt
+        self.tt_size = tt_size
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.root_move = None
+
+    def tick(self):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def capture_score(self, move):
+        board = self.board
+        victim = board.piece_type_at(move.to_square) or chess.PAWN  # en passant
+        attacker = board.piece_type_at(move.from_square)
+        return victim * 10 - attacker
+
+    def ordered_moves(self, ply, tt_move):
+        board = self.board
+        killers = self.killers[min(ply, MAX_PLY)]
+        scored = []
+        for move in board.legal_moves:
+            if move == tt_move:
+                score = 1000000
+            elif board.is_capture(move):
+                score = 100000 + self.capture_score(move)
+            elif move.promotion:
+                score = 90000 + move.promotion
+            elif move == killers[0] or move == killers[1]:
+                score = 80000
+            else:
+                score = 0
+            scored.append((score, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    def quiescence(self, alpha, beta, ply):
+        self.tick()
+        board = self.board
+        if board.is_check() and ply < MAX_PLY:
+            # No standing pat in check: every evasion is searched, which is
+            # also what lets a depth-1 search see a mate.
+            moves = self.ordered_moves(ply, None)
+            if not moves:
+                return -MATE_SCORE + ply
+        else:
+            stand_pat = evaluate(board)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = sorted(board.generate_legal_captures(), key=self.capture_score, reverse=True)
+        for move in moves:
+            board.push(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            board.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.tick()
+        board = self.board
+        if ply > 0 and (board.halfmove_clock >= 100 or board.is_repetition(2)):
+            return 0
+
+        key = chess.polyglot.zobrist_hash(board)
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, entry_score, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                entry_score = _from_tt(entry_score, ply)
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER and entry_score >= beta:
+                    return entry_score
+                if flag == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        moves = self.ordered_moves(ply, tt_move)
+        if not moves:
+            return -MATE_SCORE + ply if board.is_check() else 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            board.push(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not board.is_capture(move) and ply <= MAX_PLY:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        with _tt_lock:
+            if len(self.tt) >= self.tt_size:
+                self.tt.clear()
+            self.tt[key] = (depth, flag, _to_tt(best_score, ply), best_move)
+        if ply == 0:
+            self.root_move = best_move
+        return best_score
+
+
+def choose_move(board, level=DEFAULT_LEVEL, max_depth=None, time_limit=None):
+    depth_limit, seconds = LEVELS[level]
+    max_depth = max_depth or depth_limit
+    time_limit = time_limit or seconds
+    deadline = time.perf_counter() + time_limit
+
+    search = Search(board.copy(), deadline)
+    moves = search.ordered_moves(0, None)
+    if not moves:
+        return None
+    best = moves[0]
+    if len(moves) == 1:
+        return best
+    for depth in range(1, max_depth + 1):
+        try:
+            score = search.negamax(depth, -INFINITY, INFINITY, 0)
+        except SearchTimeout:
+            break
+        best = search.root_move or best
+        if abs(score) > MATE_BOUND:
+            break
+    return best
+
+
+def score(board, depth=1, time_limit=1.0):
+    # Centipawns from the side to move's point of view at the deepest depth
+    # completed within the time limit; used to judge moves after the fact.
+    search = Search(board.copy(), time.perf_counter() + time_limit)
+    result = evaluate(board)
+    for current in range(1, depth + 1):
+        try:
+            result = search.negamax(current, -INFINITY, INFINITY, 0)
+        except SearchTimeout:
+            break
+    return result
@@ -0,0 +1,118 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+
+import engine
+
+logger = logging.getLogger(__name__)
+
+WORKERS = os.cpu_count() or 2
+MAX_PENDING = 256
+LATENCY_SAMPLES = 1000
+
+
+def search(fen, moves, level):
+    # Runs in a worker process. The move stack is replayed rather than sending
+    # only the current FEN so repetition draws are still seen by the search.
+    board = chess.Board(fen)
+    for uci in moves:
+        board.push_uci(uci)
+    move = engine.choose_move(board, level)
+    return move.uci() if move else None
+
+
+class EnginePool:
+    # Runs engine searches in worker processes. The workers are spawned rather
+    # than forked: by the time the first search is submitted the bot's threads
+    # are running and may hold locks a forked child would inherit held.
+    # on_done(uci) is called on the executor's manager thread, which collects
+    # every search's result, so it must only hand the move over: the bot posts
+    # it to the game's actor (GameActors.post), which applies it on one of its
+    # own threads.
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._futures = {}  # game_id -> future of the search that still matters
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, game_id, board, level, on_done):
+        root = board.root()
+        moves = [move.uci() for move in board.move_stack]
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                self.rejected += 1
+                return False
+            previous = self._futures.pop(game_id, None)
+            if previous is not None:
+                previous.cancel()
+            future = self._executor.submit(search, root.fen(), moves, level)
+            self._futures[game_id] = future
+            self.submitted += 1
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._finish(game_id, f, started, on_done))
+        return True
+
+    def cancel(self, game_id):
+        # A search already running in a worker can't be interrupted, but its
+        # result is dropped once the game no longer owns it.
+        with self._lock:
+            future = self._futures.pop(game_id, None)
+            if future is None:
+                return False
+            self.cancelled += 1
+        future.cancel()
+        return True
+
+    def _finish(self, game_id, future, started, on_done):
+        with self._lock:
+            if self._futures.get(game_id) is not future:
+                return
+            del self._futures[game_id]
+        if future.cancelled():
+            return
+        self._latencies.append(time.perf_counter() - started)
+        try:
+            uci = future.result()
+        except Exception:
+            self.failed += 1
+            logger.exception('engine search for game %s failed', game_id)
+            return
+        self.completed += 1
+        try:
+            on_done(uci)
+        except Exception:
+            logger.exception('applying engine move for game %s failed', game_id)
+
+    def queue_depth(self):
+        return len(self._futures)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            'queue_depth': self.queue_depth(),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'latency_p50': percentile(0.50),
+            'latency_p99': percentile(0.99),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
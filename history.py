@@ -0,0 +1,35 @@
+import chess
+
+# A game is stored as a FEN snapshot plus the moves played after it. A new
+# snapshot is only taken on a zeroing move (capture or pawn move): no position
+# before such a move can occur again, so replaying from the snapshot still
+# gives python-chess everything it needs for repetition and fifty-move draws.
+SNAPSHOT_EVERY = 20
+
+
+def encode_move(move):
+    # 16 bits: from square (6) | to square (6) | promotion piece type (3).
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code):
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+
+def replay(fen, codes):
+    board = chess.Board(fen)
+    for code in codes:
+        board.push(decode_move(code))
+    return board
+
+
+def game_ply(game):
+    # Derived from the FEN move counters, not the move stack: a snapshot keeps
+    # the live board's stack, and a reloaded board only holds the moves after
+    # the snapshot, yet both must give the same ply.
+    return game['board'].ply()
+
+
+def needs_snapshot(game, move, board=None):
+    board = board or game['board']
+    return board.is_zeroing(move) and game_ply(game) + 1 - game['snapshot'][0] >= SNAPSHOT_EVERY
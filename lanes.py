@@ -0,0 +1,69 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+LANES = 32  # ordered handler threads
+
+
+class Lanes:
+    # Runs tasks one at a time per key, in the order they were put, on a fixed
+    # set of threads: a key always maps to the same lane, while the other keys
+    # proceed on the other lanes. Updates keyed by chat are thus handled in the
+    # order Telegram sent them, and a game's taps reach its actor in that order.
+
+    def __init__(self, lanes=LANES, name='lane'):
+        self._queues = [queue.Queue() for _ in range(lanes)]
+        self._threads = [threading.Thread(target=self._run, args=(lane,), name=f'{name}-{i}', daemon=True)
+                         for i, lane in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, key, fn, *args):
+        self._queues[hash(key) % len(self._queues)].put((fn, args))
+
+    def _run(self, lane):
+        while True:
+            task = lane.get()
+            if task is None:
+                return
+            fn, args = task
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception('lane task %s failed', getattr(fn, '__name__', fn))
+
+    def close(self):
+        for lane in self._queues:
+            lane.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def callback_key(call):
+    return call.message.chat.id if call.message else call.from_user.id
+
+
+def chat_key(update):
+    # Lane key of a polled update, its chat as in webhook.routing_key.
+    if update.callback_query is not None:
+        return callback_key(update.callback_query)
+    for message in (update.message, update.edited_message, update.my_chat_member, update.chat_member):
+        if message is not None:
+            return message.chat.id
+    return update.update_id
+
+
+def poll_in_lanes(bot, lanes):
+    # Makes bot.polling() hand each update to its chat's lane instead of
+    # telebot's worker pool, whose threads would race two taps on one game.
+    bot.threaded = False
+    process = bot.process_new_updates
+
+    def dispatch(updates):
+        for update in updates:
+            # Acknowledged now: the next getUpdates must not fetch it again.
+            bot.last_update_id = max(bot.last_update_id, update.update_id)
+            lanes.put(chat_key(update), process, [update])
+    bot.process_new_updates = dispatch
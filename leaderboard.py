@@ -0,0 +1,136 @@
+import threading
+import time
+
+import storage
+from cache import TTLCache
+
+TOP_N = 50
+CHAT_TOPS = 10000
+
+UPSERT_SQL = '''INSERT INTO leaderboard (user_id, username, points) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET points = points + excluded.points, username = excluded.username'''
+UPSERT_CHAT_SQL = '''INSERT INTO chat_leaderboard (chat_id, user_id, username, points) VALUES (?, ?, ?, ?)
+                     ON CONFLICT (chat_id, user_id) DO UPDATE SET points = points + excluded.points, username = excluded.username'''
+
+
+class PointCounts:
+    # Fenwick tree over point values: how many players hold each score, so the
+    # number of players ahead of a score is an O(log max_points) prefix sum.
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.total = 0
+        self._tree = [0] * (size + 1)
+
+    def add(self, points, count=1):
+        if points >= self.size:
+            self._grow(points)
+        self.total += count
+        i = points + 1
+        while i <= self.size:
+            self._tree[i] += count
+            i += i & -i
+
+    def _grow(self, points):
+        counts = [self.at_most(p) - self.at_most(p - 1) for p in range(self.size)]
+        size = self.size
+        while size <= points:
+            size *= 2
+        self.__init__(size)
+        for p, count in enumerate(counts):
+            if count:
+                self.add(p, count)
+
+    def at_most(self, points):
+        if points < 0:
+            return 0
+        i = min(points, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def above(self, points):
+        return self.total - self.at_most(points)
+
+
+class Leaderboard:
+    def __init__(self, top_n=TOP_N, refresh=None):
+        # refresh: reload the in-memory view at most this many seconds old, for
+        # when other processes also write the leaderboard (webhook shards).
+        self.top_n = top_n
+        self.refresh = refresh
+        self._loaded = 0
+        self.counts = PointCounts()
+        self._top = []  # [(points, user_id, username)] best first
+        self._chat_tops = TTLCache(CHAT_TOPS, ttl=3600)
+        self._lock = threading.Lock()
+
+    def load(self):
+        # Reads the points index only: one row per distinct score plus the top N.
+        with self._lock:
+            self.counts = PointCounts()
+            for points, count in storage.query('SELECT points, COUNT(*) FROM leaderboard GROUP BY points'):
+                self.counts.add(points, count)
+            self._top = [(points, user_id, username) for user_id, username, points in storage.query(
+                'SELECT user_id, username, points FROM leaderboard ORDER BY points DESC, user_id LIMIT ?', (self.top_n,))]
+            self._loaded = time.monotonic()
+
+    def _reload_if_stale(self):
+        if self.refresh is not None and time.monotonic() - self._loaded > self.refresh:
+            self.load()
+
+    def record(self, chat_id, results):
+        # results: [(user_id, username, points_gained)], applied in one transaction.
+        with self._lock:
+            changes = []
+            with storage.transaction() as c:
+                for user_id, username, gained in results:
+                    row = c.execute('SELECT points FROM leaderboard WHERE user_id = ?', (user_id,)).fetchone()
+                    c.execute(UPSERT_SQL, (user_id, username, gained))
+                    if chat_id is not None:
+                        c.execute(UPSERT_CHAT_SQL, (chat_id, user_id, username, gained))
+                    changes.append((user_id, username, row[0] if row else None, gained))
+            # Only touch the in-memory view once the transaction has committed.
+            for user_id, username, old, gained in changes:
+                if old is not None:
+                    self.counts.add(old, -1)
+                points = (old or 0) + gained
+                self.counts.add(points)
+                self._update_top(self._top, self.top_n, user_id, username, points)
+            if chat_id is not None:
+                self._chat_tops.pop(chat_id)
+
+    @staticmethod
+    def _update_top(top, limit, user_id, username, points):
+        # Points never decrease, so a player can only enter or move up the list.
+        top[:] = [entry for entry in top if entry[1] != user_id]
+        if len(top) < limit or (-points, user_id) < (-top[-1][0], top[-1][1]):
+            top.append((points, user_id, username))
+            top.sort(key=lambda entry: (-entry[0], entry[1]))
+            del top[limit:]
+
+    def top(self, limit=5):
+        self._reload_if_stale()
+        with self._lock:
+            return [(username, points) for points, _, username in self._top[:limit]]
+
+    def chat_top(self, chat_id, limit=5):
+        leaders = self._chat_tops.get(chat_id)
+        if leaders is None:
+            leaders = storage.query(
+                'SELECT username, points FROM chat_leaderboard WHERE chat_id = ? ORDER BY points DESC, user_id LIMIT ?',
+                (chat_id, self.top_n))
+            self._chat_tops.set(chat_id, leaders)
+        return leaders[:limit]
+
+    def rank(self, user_id):
+        # (points, rank) where rank is 1 + the number of players with more points.
+        rows = storage.query('SELECT points FROM leaderboard WHERE user_id = ?', (user_id,))
+        if not rows:
+            return None
+        points = rows[0][0]
+        self._reload_if_stale()
+        with self._lock:
+            return points, self.counts.above(points) + 1
@@ -0,0 +1,128 @@
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BUCKET_WIDTH = 100   # rating points per bucket
+MAX_GAP = 2          # buckets either side searched for an opponent
+SEEK_TTL = 2 * 60    # an unpaired seeker is dropped after this many seconds
+SWEEP_INTERVAL = 5
+
+# Private-chat commands, also read by the webhook front to route them.
+SEEK_COMMAND = "بحث عن خصم"
+CANCEL_COMMAND = "إلغاء البحث"
+
+
+class Matchmaker:
+    # Global queue of players looking for a PvP opponent in any chat. Seekers
+    # sit in rating buckets, each a FIFO; the sorted list of non-empty buckets
+    # is searched with bisect for the closest one, so pairing a newcomer costs
+    # O(log n) and picks the longest-waiting player of that bucket.
+    # on_timeout(seeker) is called for seekers dropped after the TTL.
+
+    def __init__(self, on_timeout, bucket_width=BUCKET_WIDTH, max_gap=MAX_GAP, ttl=SEEK_TTL,
+                 interval=SWEEP_INTERVAL, clock=time.time):
+        self.on_timeout = on_timeout
+        self.bucket_width = bucket_width
+        self.max_gap = max_gap
+        self.ttl = ttl
+        self.interval = interval
+        self.clock = clock
+        self.matched = 0
+        self.timed_out = 0
+        self._buckets = {}            # bucket -> OrderedDict(user_id -> seeker)
+        self._keys = []               # sorted non-empty buckets
+        self._seekers = OrderedDict()  # user_id -> seeker, oldest first
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._seekers)
+
+    def waiting(self, user_id):
+        return user_id in self._seekers
+
+    def seek(self, user_id, username, chat_id, rating):
+        # Returns the opponent's seeker dict if one was paired, else queues the
+        # player and returns None.
+        bucket = int(rating // self.bucket_width)
+        with self._lock:
+            opponent = self._closest(bucket)
+            if opponent is not None:
+                self._remove(opponent)
+                self.matched += 1
+                return opponent
+            seeker = {'user_id': user_id, 'username': username, 'chat_id': chat_id, 'rating': rating,
+                      'bucket': bucket, 'joined': self.clock()}
+            queue = self._buckets.get(bucket)
+            if queue is None:
+                queue = self._buckets[bucket] = OrderedDict()
+                bisect.insort(self._keys, bucket)
+            queue[user_id] = seeker
+            self._seekers[user_id] = seeker
+            return None
+
+    def _closest(self, bucket):
+        i = bisect.bisect_left(self._keys, bucket)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self._keys) and abs(self._keys[j] - bucket) <= self.max_gap:
+                candidate = next(iter(self._buckets[self._keys[j]].values()))
+                if best is None or (abs(candidate['bucket'] - bucket), candidate['joined']) < \
+                        (abs(best['bucket'] - bucket), best['joined']):
+                    best = candidate
+        return best
+
+    def _remove(self, seeker):
+        del self._seekers[seeker['user_id']]
+        queue = self._buckets[seeker['bucket']]
+        del queue[seeker['user_id']]
+        if not queue:
+            del self._buckets[seeker['bucket']]
+            self._keys.pop(bisect.bisect_left(self._keys, seeker['bucket']))
+
+    def cancel(self, user_id):
+        with self._lock:
+            seeker = self._seekers.get(user_id)
+            if seeker is None:
+                return False
+            self._remove(seeker)
+            return True
+
+    def sweep(self):
+        cutoff = self.clock() - self.ttl
+        expired = []
+        with self._lock:
+            while self._seekers:
+                seeker = next(iter(self._seekers.values()))
+                if seeker['joined'] >= cutoff:
+                    break
+                self._remove(seeker)
+                expired.append(seeker)
+        self.timed_out += len(expired)
+        for seeker in expired:
+            try:
+                self.on_timeout(seeker)
+            except Exception:
+                logger.exception('notifying seeker %s failed', seeker['user_id'])
+        return len(expired)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('matchmaking sweep failed')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='matchmaker', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
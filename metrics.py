@@ -0,0 +1,190 @@
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Timing is only collected when a metrics port is configured; otherwise
+# timed() returns the function unchanged and span() a shared no-op context.
+PORT = int(os.environ.get('CHESS_METRICS_PORT', 0))
+ENABLED = PORT > 0
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005   # seconds between stack samples
+MAX_PROFILE_SECONDS = 60
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+_spans = {}         # name -> Histogram
+_gauges = {}        # name -> (help, type, fn)
+_spans_lock = threading.Lock()
+_server = None
+
+
+def _histogram(name):
+    histogram = _spans.get(name)
+    if histogram is None:
+        with _spans_lock:
+            histogram = _spans.setdefault(name, Histogram())
+    return histogram
+
+
+def observe(name, seconds):
+    if ENABLED:
+        _histogram(name).observe(seconds)
+
+
+@contextmanager
+def _timing(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _histogram(name).observe(time.perf_counter() - started)
+
+
+def span(name):
+    return _timing(name) if ENABLED else _NOOP
+
+
+def timed(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        histogram = _histogram(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def gauge(name, help, fn):
+    # fn() is only called when /metrics is scraped.
+    _gauges[name] = (help, 'gauge', fn)
+
+
+def counter(name, help, fn):
+    _gauges[name] = (help, 'counter', fn)
+
+
+def labeled(name, help, label, fn):
+    # A gauge with one sample per item: fn() returns [(label value, value)].
+    _gauges[name] = (help, 'gauge', fn, label)
+
+
+def render():
+    lines = ['# HELP chess_span_seconds Time spent in instrumented code paths.',
+             '# TYPE chess_span_seconds histogram']
+    for name, histogram in sorted(_spans.items()):
+        counts, total = histogram.snapshot()
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'chess_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'chess_span_seconds_sum{{span="{name}"}} {total}')
+        lines.append(f'chess_span_seconds_count{{span="{name}"}} {cumulative}')
+    for name, (help, kind, fn, *label) in sorted(_gauges.items()):
+        try:
+            if label:
+                samples = [(f'{{{label[0]}="{key}"}}', float(value)) for key, value in fn()]
+            else:
+                samples = [('', float(fn()))]
+        except Exception:
+            continue
+        lines.append(f'# HELP chess_{name} {help}')
+        lines.append(f'# TYPE chess_{name} {kind}')
+        lines.extend(f'chess_{name}{labels} {value}' for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def profile(seconds, interval=PROFILE_INTERVAL):
+    # Samples every other thread's stack for `seconds` and returns them in the
+    # collapsed "thread;outer;...;inner count" format flame graph tools read.
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            body = render()
+            content_type = 'text/plain; version=0.0.4'
+        elif url.path == '/profile':
+            # /profile?seconds=N turns the sampler on for N seconds.
+            seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+            body = profile(min(seconds, MAX_PROFILE_SECONDS))
+            content_type = 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=PORT, host='127.0.0.1'):
+    global _server
+    _server = ThreadingHTTPServer((host, port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+
+
+def close():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import chess
+
+CACHE_SIZE = 20000
+
+# targets maps each movable piece's square to a bitboard of its legal
+# destinations; reason is the chess.Termination the position itself ends the
+# game with (checkmate, stalemate, insufficient material) or None.
+Analysis = namedtuple('Analysis', 'targets check checkmate stalemate reason')
+
+
+def position_key(board):
+    # Everything legal moves depend on, as exact integers. It identifies the
+    # same positions as a Zobrist hash but is built in a fraction of the time
+    # and can't collide.
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.turn, board.castling_rights, board.ep_square)
+
+
+def analyse(board):
+    targets = {}
+    for move in board.generate_legal_moves():
+        targets[move.from_square] = targets.get(move.from_square, 0) | chess.BB_SQUARES[move.to_square]
+    check = board.is_check()
+    checkmate = check and not targets
+    stalemate = not check and not targets
+    if checkmate:
+        reason = chess.Termination.CHECKMATE
+    elif stalemate:
+        reason = chess.Termination.STALEMATE
+    elif board.is_insufficient_material():
+        reason = chess.Termination.INSUFFICIENT_MATERIAL
+    else:
+        reason = None
+    return Analysis(targets, check, checkmate, stalemate, reason)
+
+
+class PositionCache:
+    # Bounded LRU of position analyses shared by all games, so a position
+    # (every opening line, say) has its legal moves generated once however
+    # many games and taps reach it.
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, board):
+        key = position_key(board)
+        with self._lock:
+            analysis = self._data.get(key)
+            if analysis is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return analysis
+            self.misses += 1
+        analysis = analyse(board)
+        with self._lock:
+            self._data[key] = analysis
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return analysis
+
+    def is_legal(self, board, move):
+        # Answered from the cached targets (promotions count as legal to any
+        # piece, which is all the board keyboards ask for). A miss is checked
+        # by python-chess, which also accepts castling tapped as king then
+        # rook (e1h1).
+        if self.get(board).targets.get(move.from_square, 0) & chess.BB_SQUARES[move.to_square]:
+            return True
+        return board.is_legal(move)
+
+    def game_over_reason(self, board):
+        # The move-history rules can't be cached with the position.
+        reason = self.get(board).reason
+        if reason is None and board.is_seventyfive_moves():
+            reason = chess.Termination.SEVENTYFIVE_MOVES
+        elif reason is None and board.is_fivefold_repetition():
+            reason = chess.Termination.FIVEFOLD_REPETITION
+        return reason
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,195 @@
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+CHAT_INTERVAL = 0.5   # seconds between edits in the same chat
+GLOBAL_RATE = 30      # edits per second across all chats
+MAX_BACKOFF = 60
+
+
+def _not_modified(error):
+    return error.error_code == 400 and 'not modified' in error.description.lower()
+
+
+class ApiErrors:
+    # Bot API failures of every call, not only board edits. wrap() goes around
+    # the function telebot sends each request through, so send_message,
+    # answer_callback_query, send_photo and get_chat_member are counted too.
+    # The async helper raises its own ApiTelegramException class, hence the
+    # error_code lookup.
+
+    def __init__(self):
+        self.rate_limited = 0
+        self.errors = 0
+
+    def record(self, error):
+        code = getattr(error, 'error_code', None)
+        if code == 429:
+            self.rate_limited += 1
+        elif code is None or not _not_modified(error):
+            self.errors += 1
+
+    def wrap(self, request):
+        @functools.wraps(request)
+        def counted(*args, **kwargs):
+            try:
+                return request(*args, **kwargs)
+            except Exception as e:
+                self.record(e)
+                raise
+        return counted
+
+    def wrap_async(self, request):
+        @functools.wraps(request)
+        async def counted(*args, **kwargs):
+            try:
+                return await request(*args, **kwargs)
+            except Exception as e:
+                self.record(e)
+                raise
+        return counted
+
+
+class EditScheduler:
+    # Queues message edits and sends them from a background thread within the
+    # per-chat and global budgets. Only the newest pending edit for a message is
+    # kept, so a burst of taps on one board results in a single edit.
+
+    def __init__(self, send, chat_interval=CHAT_INTERVAL, global_rate=GLOBAL_RATE, workers=8, clock=time.monotonic):
+        self.send = send
+        self.chat_interval = chat_interval
+        self.global_rate = global_rate
+        self.clock = clock
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._pending = {}      # (chat_id, message_id) -> (text, reply_markup)
+        self._inflight = set()
+        self._scheduled = set()
+        self._heap = []         # (due, seq, key)
+        self._seq = itertools.count()
+        self._chat_ready = {}   # chat_id -> earliest time of the next edit
+        self._backoff = {}      # chat_id -> consecutive 429s
+        self._tokens = float(global_rate)
+        self._refilled = clock()
+        self._closing = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='edit-sender')
+        self._thread = threading.Thread(target=self._run, name='edit-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, chat_id, message_id, text, reply_markup=None):
+        key = (chat_id, message_id)
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (text, reply_markup)
+            self._schedule(key, self._chat_ready.get(chat_id, 0))
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _schedule(self, key, due):
+        if key in self._scheduled or key in self._inflight:
+            return
+        self._scheduled.add(key)
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+
+    def _global_wait(self, now):
+        self._tokens = min(self.global_rate, self._tokens + (now - self._refilled) * self.global_rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.global_rate
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if self._closing and not self._inflight:
+                        return None
+                    self._cond.wait()
+                    continue
+                now = self.clock()
+                delay = max(self._heap[0][0] - now, self._global_wait(now))
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, key = heapq.heappop(self._heap)
+                self._scheduled.discard(key)
+                chat_id = key[0]
+                ready = self._chat_ready.get(chat_id, 0)
+                if ready > now:
+                    self._schedule(key, ready)
+                    continue
+                payload = self._pending.pop(key, None)
+                if payload is None:
+                    continue
+                self._tokens -= 1
+                self._chat_ready[chat_id] = now + self.chat_interval
+                self._inflight.add(key)
+                if len(self._chat_ready) > 10000:
+                    self._chat_ready = {c: t for c, t in self._chat_ready.items() if t > now}
+                return key, payload
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            self._executor.submit(self._deliver, *item)
+
+    def _deliver(self, key, payload):
+        chat_id, message_id = key
+        try:
+            self.send(chat_id, message_id, *payload)
+            self.sent += 1
+            self._backoff.pop(chat_id, None)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                self._retry_later(key, payload, e)
+            elif _not_modified(e):
+                pass
+            else:
+                self.errors += 1
+                logger.warning('edit of message %s in chat %s failed: %s', message_id, chat_id, e)
+        except Exception:
+            self.errors += 1
+            logger.exception('edit of message %s in chat %s failed', message_id, chat_id)
+        finally:
+            with self._cond:
+                self._inflight.discard(key)
+                if key in self._pending:
+                    self._schedule(key, self._chat_ready.get(chat_id, 0))
+                self._cond.notify()
+
+    def _retry_later(self, key, payload, error):
+        chat_id = key[0]
+        self.rate_limited += 1
+        attempts = self._backoff.get(chat_id, 0) + 1
+        self._backoff[chat_id] = attempts
+        retry_after = (error.result_json or {}).get('parameters', {}).get('retry_after')
+        if retry_after is None:
+            retry_after = min(2 ** attempts, MAX_BACKOFF)
+        with self._cond:
+            self._chat_ready[chat_id] = self.clock() + retry_after
+            # A newer board state may have arrived meanwhile; that one wins.
+            self._pending.setdefault(key, payload)
+
+    def close(self, timeout=10):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
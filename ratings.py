@@ -0,0 +1,147 @@
+import argparse
+import logging
+import threading
+import time
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATING = 1500.0
+PROVISIONAL_GAMES = 30
+K_PROVISIONAL = 40
+K_ESTABLISHED = 20
+FLUSH_INTERVAL = 0.5
+RECOMPUTE_BATCH = 50000
+
+RESULT_SQL = 'INSERT INTO results (player_a, player_b, score, chat_id, played_at) VALUES (?, ?, ?, ?, ?)'
+UPSERT_RATING_SQL = '''INSERT INTO ratings (user_id, username, rating, games) VALUES (?, ?, ?, ?)
+                       ON CONFLICT (user_id) DO UPDATE SET username = COALESCE(excluded.username, username),
+                       rating = excluded.rating, games = excluded.games'''
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def k_factor(games):
+    return K_PROVISIONAL if games < PROVISIONAL_GAMES else K_ESTABLISHED
+
+
+def rate(a, b, score):
+    # Elo update for one game. a and b are (rating, games); score is a's result
+    # (1 win, 0.5 draw, 0 loss). Returns the new (rating, games) pairs.
+    expected = expected_score(a[0], b[0])
+    new_a = (a[0] + k_factor(a[1]) * (score - expected), a[1] + 1)
+    new_b = (b[0] + k_factor(b[1]) * ((1 - score) - (1 - expected)), b[1] + 1)
+    return new_a, new_b
+
+
+class RatingService:
+    # Results are queued by the game handlers and applied by a background
+    # thread: every batch logs its results and writes the affected ratings in
+    # one transaction.
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.applied = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ratings', daemon=True)
+        self._thread.start()
+
+    def submit(self, player_a, player_b, score, chat_id=None):
+        # Players are (user_id, username) pairs.
+        with self._lock:
+            self._queue.append((player_a, player_b, score, chat_id, time.time()))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            user_ids = list({player[0] for a, b, _, _, _ in batch for player in (a, b)})
+            names = {}
+            try:
+                with storage.transaction(immediate=True) as c:
+                    current = {}
+                    for start in range(0, len(user_ids), 500):
+                        chunk = user_ids[start:start + 500]
+                        placeholders = ','.join('?' * len(chunk))
+                        for user_id, rating, games in c.execute(
+                                f'SELECT user_id, rating, games FROM ratings WHERE user_id IN ({placeholders})', chunk):
+                            current[user_id] = (rating, games)
+                    for (a_id, a_name), (b_id, b_name), score, chat_id, played_at in batch:
+                        a = current.get(a_id, (INITIAL_RATING, 0))
+                        b = current.get(b_id, (INITIAL_RATING, 0))
+                        current[a_id], current[b_id] = rate(a, b, score)
+                        names[a_id] = a_name
+                        names[b_id] = b_name
+                    c.executemany(RESULT_SQL, [(a[0], b[0], score, chat_id, played_at)
+                                               for a, b, score, chat_id, played_at in batch])
+                    c.executemany(UPSERT_RATING_SQL, [(user_id, names[user_id], rating, games)
+                                                      for user_id, (rating, games) in current.items()])
+            except Exception:
+                with self._lock:
+                    self._queue[:0] = batch
+                raise
+            self.applied += len(batch)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('applying rating batch failed')
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+
+def get_rating(user_id):
+    rows = storage.query('SELECT rating, games FROM ratings WHERE user_id = ?', (user_id,))
+    return rows[0] if rows else None
+
+
+def recompute():
+    # Replays the whole results log in order and rewrites every rating. The log
+    # is streamed; only one (rating, games) pair per player is held in memory.
+    current = {}
+    count = 0
+    with storage.pool.connection() as conn:
+        cursor = conn.execute('SELECT player_a, player_b, score FROM results ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(RECOMPUTE_BATCH)
+            if not rows:
+                break
+            for a_id, b_id, score in rows:
+                a = current.get(a_id, (INITIAL_RATING, 0))
+                b = current.get(b_id, (INITIAL_RATING, 0))
+                current[a_id], current[b_id] = rate(a, b, score)
+            count += len(rows)
+    with storage.transaction(immediate=True) as c:
+        c.execute('UPDATE ratings SET rating = ?, games = 0', (INITIAL_RATING,))
+        c.executemany(UPSERT_RATING_SQL, [(user_id, None, rating, games) for user_id, (rating, games) in current.items()])
+    return count, len(current)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline maintenance of player ratings.')
+    parser.add_argument('command', choices=['recompute'])
+    parser.add_argument('--db', default=storage.DB_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    storage.init_db(args.db)
+    started = time.perf_counter()
+    games, players = recompute()
+    logger.info('recomputed %d players from %d results in %.1fs', players, games, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+CHALLENGE_TTL = 10 * 60      # an unanswered challenge expires after this many seconds
+GAME_TTL = 24 * 60 * 60      # a game with no move for this long is abandoned
+SWEEP_INTERVAL = 60
+BATCH_SIZE = 500
+
+STALE_GAMES_SQL = '''SELECT game_id, chat_id, message_id FROM games
+                     WHERE last_update < ? AND game_id > ? ORDER BY game_id LIMIT ?'''
+
+
+class Reaper:
+    # Periodically expires stale challenges in waiting_players and idle games in
+    # active_games/the games table. on_expired(kind, game_id, chat_id, message_id)
+    # is called for each one ('challenge' or 'game') so the caller can update
+    # the Telegram message and drop any per-game state it keeps.
+    # A game is expired by a task posted to its actor, which checks again that
+    # it is idle and deletes it through the write-behind queue: a move applied
+    # meanwhile keeps it, and a save queued before the delete can't bring back
+    # its row.
+
+    def __init__(self, waiting_players, active_games, game_actors, on_expired, challenge_ttl=CHALLENGE_TTL,
+                 game_ttl=GAME_TTL, interval=SWEEP_INTERVAL, batch_size=BATCH_SIZE, clock=time.time):
+        self.waiting_players = waiting_players
+        self.active_games = active_games
+        self.game_actors = game_actors
+        self.on_expired = on_expired
+        self.challenge_ttl = challenge_ttl
+        self.game_ttl = game_ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self.challenges_reaped = 0
+        self.games_reaped = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _expire(self, kind, game_id, chat_id, message_id):
+        try:
+            self.on_expired(kind, game_id, chat_id, message_id)
+        except Exception:
+            logger.exception('expiring %s %s failed', kind, game_id)
+
+    def sweep_challenges(self, now):
+        cutoff = now - self.challenge_ttl
+        reaped = 0
+        for game_id, entry in list(self.waiting_players.items()):
+            if entry.get('created', 0) >= cutoff:
+                continue
+            if self.waiting_players.pop(game_id, None) is None:
+                continue
+            self._expire('challenge', game_id, entry['chat_id'], entry.get('message_id'))
+            reaped += 1
+        return reaped
+
+    def sweep_games(self, now):
+        # Returns the number of games handed to their actors for expiry.
+        cutoff = now - self.game_ttl
+        posted = 0
+        after = ''
+        storage.flush()
+        while True:
+            rows = storage.query(STALE_GAMES_SQL, (cutoff, after, self.batch_size))
+            for game_id, chat_id, message_id in rows:
+                game = self.active_games.resident(game_id)
+                if game is not None and game['last_update'] >= cutoff:
+                    continue
+                self.game_actors.post(game_id, self.expire_game, game_id, chat_id, message_id, cutoff)
+                posted += 1
+            if len(rows) < self.batch_size:
+                return posted
+            after = rows[-1][0]
+
+    def expire_game(self, game_id, chat_id, message_id, cutoff):
+        # Runs in the game's actor.
+        game = self.active_games.resident(game_id)
+        if game is not None and game['last_update'] >= cutoff:
+            return
+        self.active_games.pop(game_id)
+        storage.delete_game(game_id)
+        self.games_reaped += 1
+        self._expire('game', game_id, chat_id, message_id)
+
+    def sweep(self):
+        now = self.clock()
+        challenges = self.sweep_challenges(now)
+        games = self.sweep_games(now)
+        self.challenges_reaped += challenges
+        if challenges or games:
+            logger.info('reaper reclaimed %d challenges and is expiring %d games', challenges, games)
+        return {'challenges': challenges, 'games': games}
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('reaper sweep failed')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='reaper', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
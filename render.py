@@ -0,0 +1,179 @@
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import chess
+from telebot import types
+
+MOVE_DOT = '🔵'
+CAPTURE_DOT = '🔴'
+SQUARE_LIGHT = ' '
+SQUARE_DARK = ' '
+
+PIECE_TO_EMOJI = {
+    'P': '♙', 'R': '♖', 'N': '♘', 'B': '♗', 'Q': '♕', 'K': '♔',
+    'p': '♟️', 'r': '♜', 'n': '♞', 'b': '♝', 'q': '♛', 'k': '♚'
+}
+
+# Buttons are laid out top row first: display index i = row * 8 + col, where
+# row 0 is the eighth rank, matching the row/col pair in move_ callbacks.
+DISPLAY_SQUARES = tuple(chess.square(col, 7 - row) for row in range(8) for col in range(8))
+SQUARE_TO_DISPLAY = {square: i for i, square in enumerate(DISPLAY_SQUARES)}
+
+
+def piece_to_emoji(piece, row, col):
+    if piece is None:
+        return SQUARE_LIGHT if (row + col) % 2 == 0 else SQUARE_DARK
+    return PIECE_TO_EMOJI.get(piece.symbol(), ' ')
+
+
+EMPTY_TEXTS = tuple(piece_to_emoji(None, chess.square_rank(square), chess.square_file(square)) for square in DISPLAY_SQUARES)
+
+
+def position_key(board):
+    # The piece bitboards identify a placement exactly and are far cheaper to
+    # read than board.board_fen(); black's pieces are whatever isn't white.
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE])
+
+
+@lru_cache(maxsize=20000)
+def position_template(key):
+    texts = list(EMPTY_TEXTS)
+    white = key[6]
+    for piece_type, bitboard in enumerate(key[:6], chess.PAWN):
+        symbol = chess.piece_symbol(piece_type)
+        for square in chess.scan_forward(bitboard):
+            texts[SQUARE_TO_DISPLAY[square]] = PIECE_TO_EMOJI[symbol.upper() if white & chess.BB_SQUARES[square] else symbol]
+    return tuple(texts)
+
+
+@lru_cache(maxsize=10000)
+def callback_grid(game_id):
+    return tuple(f"move_{game_id}_{row}_{col}" for row in range(8) for col in range(8))
+
+
+class BoardMarkup(types.InlineKeyboardMarkup):
+    # Keeps the JSON of every row next to its buttons so rows that didn't
+    # change between renders aren't serialised again.
+
+    def __init__(self, rows, rows_json):
+        super().__init__(inline_keyboard=rows, row_width=8)
+        self.rows_json = rows_json
+
+    def to_json(self):
+        return '{"inline_keyboard": [' + ', '.join(self.rows_json) + ']}'
+
+
+class _View:
+    __slots__ = ('placement', 'texts', 'rows', 'rows_json', 'key', 'markup')
+
+    def __init__(self):
+        self.placement = None
+        self.texts = None
+        self.rows = [None] * 8
+        self.rows_json = [None] * 8
+        self.key = None
+        self.markup = None
+
+
+def _row_json(row):
+    return json.dumps([button.to_dict() for button in row])
+
+
+class BoardRenderer:
+    # callback_data(game_id) returns the 64 callback strings in button order;
+    # it is called on every render, so it should be cached by the caller.
+    # With a positions.PositionCache the move highlights come from its cached
+    # legal moves instead of being generated on each render.
+
+    def __init__(self, maxsize=10000, callback_data=callback_grid, positions=None):
+        self.maxsize = maxsize
+        self.callback_data = callback_data
+        self.positions = positions
+        self.renders = 0
+        self.reused = 0
+        self.rows_rebuilt = 0
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _view(self, game_id):
+        with self._lock:
+            view = self._views.get(game_id)
+            if view is None:
+                view = self._views[game_id] = _View()
+                if len(self._views) > self.maxsize:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(game_id)
+            return view
+
+    def forget(self, game_id):
+        with self._lock:
+            self._views.pop(game_id, None)
+
+    def highlights(self, board, selected, current):
+        marks = {}
+        if not selected:
+            return marks
+        from_square = chess.square(selected[1], 7 - selected[0])
+        if self.positions is not None:
+            destinations = chess.scan_forward(self.positions.get(board).targets.get(from_square, 0))
+        else:
+            destinations = {move.to_square for move in board.generate_legal_moves(from_mask=chess.BB_SQUARES[from_square])}
+        for to_square in destinations:
+            piece = board.piece_at(to_square)
+            marks[SQUARE_TO_DISPLAY[to_square]] = CAPTURE_DOT if piece and piece.color != current else MOVE_DOT
+        return marks
+
+    def render(self, game_id, board, selected=None, current=chess.WHITE):
+        self.renders += 1
+        placement = position_key(board)
+        key = (placement, tuple(selected) if selected else None, current)
+        view = self._view(game_id)
+        if view.key == key:
+            self.reused += 1
+            return view.markup
+
+        if view.placement != placement:
+            self._update_base(game_id, view, placement)
+
+        marks = self.highlights(board, selected, current)
+        rows = list(view.rows)
+        rows_json = list(view.rows_json)
+        if marks:
+            callbacks = self.callback_data(game_id)
+            for row in {i // 8 for i in marks}:
+                start = row * 8
+                buttons = list(rows[row])
+                for i in range(start, start + 8):
+                    if i in marks:
+                        buttons[i - start] = types.InlineKeyboardButton(marks[i] + view.texts[i], callback_data=callbacks[i])
+                rows[row] = buttons
+                rows_json[row] = _row_json(buttons)
+
+        view.key = key
+        view.markup = BoardMarkup(rows, rows_json)
+        return view.markup
+
+    def _update_base(self, game_id, view, placement):
+        texts = position_template(placement)
+        old = view.texts
+        callbacks = self.callback_data(game_id)
+        for row in range(8):
+            start = row * 8
+            if old is not None and old[start:start + 8] == texts[start:start + 8]:
+                continue
+            previous = view.rows[row]
+            buttons = []
+            for i in range(start, start + 8):
+                if old is not None and old[i] == texts[i]:
+                    buttons.append(previous[i - start])
+                else:
+                    buttons.append(types.InlineKeyboardButton(texts[i], callback_data=callbacks[i]))
+            view.rows[row] = buttons
+            view.rows_json[row] = _row_json(buttons)
+            self.rows_rebuilt += 1
+        view.placement = placement
+        view.texts = texts
@@ -0,0 +1,349 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'chess_games.db'
+POOL_SIZE = 4
+FLUSH_INTERVAL = 0.05  # seconds between write-behind batches
+
+# Statements are kept as constants so every pooled connection reuses the same
+# compiled statement from its sqlite3 statement cache.
+# Column order of a games row, as game rows are built and unpacked in chess.py.
+GAME_COLUMNS = ('game_id', 'chat_id', 'mode', 'players', 'board_fen', 'current_turn', 'selected', 'message_id',
+                'last_update', 'snapshot_ply', 'mirror', 'clock', 'player_ids')
+SNAPSHOT_PLY = GAME_COLUMNS.index('snapshot_ply')
+SAVE_GAME_SQL = f'''INSERT OR REPLACE INTO games ({', '.join(GAME_COLUMNS)})
+                   VALUES ({', '.join('?' * len(GAME_COLUMNS))})'''
+TOUCH_GAME_SQL = 'UPDATE games SET current_turn = ?, last_update = ?, clock = ? WHERE game_id = ?'
+DELETE_GAME_SQL = 'DELETE FROM games WHERE game_id = ?'
+LOAD_GAME_SQL = f'''SELECT {', '.join(GAME_COLUMNS)}
+                   FROM games WHERE game_id = ?'''
+APPEND_MOVE_SQL = 'INSERT OR REPLACE INTO moves (game_id, ply, move) VALUES (?, ?, ?)'
+LOAD_MOVES_SQL = 'SELECT move FROM moves WHERE game_id = ? AND ply > ? ORDER BY ply'
+DELETE_MOVES_SQL = 'DELETE FROM moves WHERE game_id = ?'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS games (
+        game_id TEXT PRIMARY KEY,
+        chat_id INTEGER,
+        mode TEXT,
+        players TEXT,
+        board_fen TEXT,
+        current_turn INTEGER,
+        selected TEXT,
+        message_id INTEGER,
+        last_update REAL,
+        snapshot_ply INTEGER DEFAULT 0,
+        mirror TEXT,
+        clock TEXT,
+        player_ids TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS games_last_update ON games (last_update)',
+    # Bot games waiting for the engine, resumed at startup (chess.start_services).
+    "CREATE INDEX IF NOT EXISTS games_bot_to_move ON games (game_id) WHERE mode = 'bot' AND current_turn = 0",
+    '''CREATE TABLE IF NOT EXISTS moves (
+        game_id TEXT,
+        ply INTEGER,
+        move INTEGER,
+        PRIMARY KEY (game_id, ply)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS handles (
+        handle INTEGER PRIMARY KEY AUTOINCREMENT,
+        game_id TEXT UNIQUE
+    )''',
+]
+
+# Per-player tables. When the games live in a shard database (webhook mode, see
+# webhook.py) these are kept in one database attached to every shard as
+# "shared"; the queries don't name the schema, SQLite finds them there.
+SHARED_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS {schema}leaderboard (
+        user_id INTEGER,
+        username TEXT,
+        points INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS {schema}leaderboard_points ON leaderboard (points DESC)',
+    '''CREATE TABLE IF NOT EXISTS {schema}chat_leaderboard (
+        chat_id INTEGER,
+        user_id INTEGER,
+        username TEXT,
+        points INTEGER DEFAULT 0,
+        PRIMARY KEY (chat_id, user_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS {schema}chat_leaderboard_points ON chat_leaderboard (chat_id, points DESC)',
+    '''CREATE TABLE IF NOT EXISTS {schema}ratings (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        rating REAL,
+        games INTEGER DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS {schema}results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        player_a INTEGER,
+        player_b INTEGER,
+        score REAL,
+        chat_id INTEGER,
+        played_at REAL
+    )''',
+]
+
+# Columns added after the first release, for databases created before them.
+MIGRATIONS = [
+    ('games', 'snapshot_ply', 'INTEGER DEFAULT 0'),
+    ('games', 'mirror', 'TEXT'),
+    ('games', 'clock', 'TEXT'),
+    ('games', 'player_ids', 'TEXT'),
+]
+
+# Indexes on migrated columns, created once the columns exist.
+INDEXES = [
+    # Timed games, whose clocks are rescheduled at startup (chess.start_services).
+    'CREATE INDEX IF NOT EXISTS games_clocked ON games (game_id) WHERE clock IS NOT NULL',
+]
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, shared_path=None):
+        self.path = path
+        self.shared_path = shared_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA busy_timeout=30000')
+        if self.shared_path:
+            conn.execute('ATTACH DATABASE ? AS shared', (self.shared_path,))
+            conn.execute('PRAGMA shared.journal_mode=WAL')
+            conn.execute('PRAGMA shared.synchronous=NORMAL')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+class WriteBehindQueue:
+    # Pending writes, flushed together in one transaction per batch:
+    # - full game rows keyed by game_id; a later save or delete of the same game
+    #   replaces the earlier one, so a burst of taps costs a single row write
+    # - per-move touches of current_turn/last_update/clock, coalesced the same way
+    # - appended moves, which are never coalesced
+
+    def __init__(self, pool, interval=FLUSH_INTERVAL):
+        self.pool = pool
+        self.interval = interval
+        self.batches = 0
+        self.rows_written = 0
+        self._rows = {}
+        self._touches = {}
+        self._moves = []
+        self._writing = set()  # games in the batch being committed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='storage-writer', daemon=True)
+        self._thread.start()
+
+    def save(self, row):
+        with self._lock:
+            self._rows[row[0]] = row
+            self._touches.pop(row[0], None)
+
+    def delete(self, game_id):
+        with self._lock:
+            self._rows[game_id] = None
+            self._touches.pop(game_id, None)
+
+    def touch(self, game_id, current_turn, last_update, clock=None):
+        with self._lock:
+            self._touches[game_id] = (current_turn, last_update, clock, game_id)
+
+    def append_move(self, game_id, ply, code):
+        with self._lock:
+            self._moves.append((game_id, ply, code))
+
+    def has_pending(self, game_id):
+        with self._lock:
+            return (game_id in self._rows or game_id in self._touches or game_id in self._writing
+                    or any(move[0] == game_id for move in self._moves))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, {}
+                touches, self._touches = self._touches, {}
+                moves, self._moves = self._moves, []
+                self._writing = set(rows) | set(touches) | {move[0] for move in moves}
+            if not (rows or touches or moves):
+                return
+            saves = [row for row in rows.values() if row is not None]
+            deletes = [(game_id,) for game_id, row in rows.items() if row is None]
+            try:
+                with self.pool.connection() as conn:
+                    with conn:
+                        if saves:
+                            conn.executemany(SAVE_GAME_SQL, saves)
+                        if touches:
+                            conn.executemany(TOUCH_GAME_SQL, list(touches.values()))
+                        if moves:
+                            conn.executemany(APPEND_MOVE_SQL, moves)
+                        if deletes:
+                            conn.executemany(DELETE_GAME_SQL, deletes)
+                            conn.executemany(DELETE_MOVES_SQL, deletes)
+            except sqlite3.Error:
+                logger.exception('write-behind flush failed, requeueing %d rows and %d moves', len(rows) + len(touches), len(moves))
+                with self._lock:
+                    for game_id, row in rows.items():
+                        self._rows.setdefault(game_id, row)
+                    for game_id, touch in touches.items():
+                        self._touches.setdefault(game_id, touch)
+                    self._moves[:0] = moves
+                    self._writing = set()
+                raise
+            with self._lock:
+                self._writing = set()
+            self.batches += 1
+            self.rows_written += len(saves) + len(touches) + len(moves) + len(deletes)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+
+pool = None
+writer = None
+
+
+def init_db(path=DB_PATH, pool_size=POOL_SIZE, flush_interval=FLUSH_INTERVAL, shared_path=None):
+    global pool, writer
+    pool = ConnectionPool(path, pool_size, shared_path)
+    with pool.connection() as conn:
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for statement in SHARED_SCHEMA:
+                conn.execute(statement.format(schema='shared.' if shared_path else ''))
+            for table, column, definition in MIGRATIONS:
+                columns = [info[1] for info in conn.execute(f'PRAGMA table_info({table})')]
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            for statement in INDEXES:
+                conn.execute(statement)
+    writer = WriteBehindQueue(pool, flush_interval)
+    atexit.register(close)
+
+
+@contextmanager
+def transaction(immediate=False):
+    # immediate takes the write lock up front, for read-modify-write
+    # transactions that other processes may run against the same database.
+    with pool.connection() as conn:
+        with conn:
+            if immediate:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn.cursor()
+
+
+def query(sql, params=()):
+    with pool.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def save_game(row):
+    writer.save(row)
+
+
+def delete_game(game_id):
+    writer.delete(game_id)
+
+
+def touch_game(game_id, current_turn, last_update, clock=None):
+    writer.touch(game_id, current_turn, last_update, clock)
+
+
+def append_move(game_id, ply, code):
+    writer.append_move(game_id, ply, code)
+
+
+def load_game(game_id):
+    # Returns the games row and the encoded moves played after its snapshot.
+    if writer.has_pending(game_id):
+        writer.flush()
+    rows = query(LOAD_GAME_SQL, (game_id,))
+    if not rows:
+        return None, []
+    row = rows[0]
+    return row, load_moves(game_id, row[SNAPSHOT_PLY] or 0)
+
+
+def load_moves(game_id, after=0):
+    # Encoded moves played after ply `after`, oldest first.
+    if writer.has_pending(game_id):
+        writer.flush()
+    return [code for (code,) in query(LOAD_MOVES_SQL, (game_id, after))]
+
+
+def flush():
+    writer.flush()
+
+
+def close():
+    global writer
+    if writer is not None:
+        writer.close()
+        writer = None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,32 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+# The repository's chess.py must not shadow python-chess: drop the repository
+# from the front of sys.path (python -m pytest puts it there) and append it.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or '.') != ROOT]
+sys.path.append(ROOT)
+
+
+@pytest.fixture(scope='session')
+def chessbot(tmp_path_factory):
+    # chess.py imported as "chessbot", with its databases in a scratch directory.
+    # No handler that talks to Telegram is called through it.
+    os.chdir(tmp_path_factory.mktemp('bot'))
+    os.environ.setdefault('CHESS_TOKEN', '123456:TEST')
+    spec = importlib.util.spec_from_file_location('chessbot', os.path.join(ROOT, 'chess.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['chessbot'] = module
+    spec.loader.exec_module(module)
+    module.setup()
+    yield module
+    module.stop_services()
+
+
+@pytest.fixture(scope='session')
+def storage(chessbot):
+    import storage
+    return storage
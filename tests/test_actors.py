@@ -0,0 +1,128 @@
+import threading
+import types
+
+import metrics
+from actors import GameActors
+from lanes import Lanes, poll_in_lanes
+
+
+def test_idle_game_runs_on_the_submitting_thread():
+    actors = GameActors(workers=1)
+    threads = []
+    assert actors.submit('g', lambda: threads.append(threading.current_thread()))
+    assert threads == [threading.current_thread()]
+    assert not actors.busy('g')
+    actors.close()
+
+
+def test_busy_game_queues_in_submission_order():
+    actors = GameActors(workers=1)
+    order = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def first():
+        started.set()
+        release.wait()
+        order.append(1)
+
+    runner = threading.Thread(target=actors.submit, args=('g', first))
+    runner.start()
+    started.wait()
+    assert actors.busy('g')
+    for i in range(2, 6):
+        assert not actors.submit('g', order.append, i)
+    assert actors.submit('other', order.append, 'other')
+    release.set()
+    runner.join()
+
+    assert order == ['other', 1, 2, 3, 4, 5]
+    assert actors.contended == 4 and actors.max_depth == 4
+    assert actors.hot() == [('g', 4)]
+    actors.forget('g')
+    assert actors.hot() == []
+    actors.close()
+
+
+def test_task_can_submit_to_its_own_game():
+    actors = GameActors(workers=1)
+    order = []
+
+    def outer():
+        actors.submit('g', order.append, 'inner')
+        order.append('outer')
+
+    actors.submit('g', outer)
+    assert order == ['outer', 'inner']
+    actors.close()
+
+
+def test_post_never_runs_on_the_caller():
+    actors = GameActors(workers=1)
+    done = threading.Event()
+    threads = []
+
+    def task():
+        threads.append(threading.current_thread())
+        done.set()
+
+    actors.post('g', task)
+    assert done.wait(5)
+    assert threads[0] is not threading.current_thread()
+    actors.close()
+
+
+def test_failed_task_does_not_stop_the_mailbox():
+    actors = GameActors(workers=1)
+    order = []
+
+    def fail():
+        actors.submit('g', order.append, 'after')
+        raise RuntimeError('boom')
+
+    actors.submit('g', fail)
+    assert order == ['after'] and actors.failed == 1
+    assert not actors.busy('g')
+    actors.close()
+
+
+def test_hot_games_are_exported(monkeypatch):
+    monkeypatch.setattr(metrics, '_gauges', {})
+    metrics.labeled('hot_game_waits', 'Waits.', 'game', lambda: [('a', 3), ('b', 1)])
+    lines = metrics.render().splitlines()
+    assert 'chess_hot_game_waits{game="a"} 3.0' in lines
+    assert 'chess_hot_game_waits{game="b"} 1.0' in lines
+
+
+def test_lanes_keep_each_keys_order():
+    lanes = Lanes(4)
+    seen = {key: [] for key in range(10)}
+    for i in range(200):
+        lanes.put(i % 10, seen[i % 10].append, i)
+    lanes.close()
+    assert all(values == list(range(key, 200, 10)) for key, values in seen.items())
+
+
+def test_polled_updates_are_acknowledged_and_handed_to_lanes():
+    handled = []
+
+    class Bot:
+        threaded = True
+        last_update_id = 0
+
+        def process_new_updates(self, updates):
+            handled.extend(update.update_id for update in updates)
+
+    def update(update_id, chat_id):
+        message = types.SimpleNamespace(chat=types.SimpleNamespace(id=chat_id))
+        return types.SimpleNamespace(update_id=update_id, callback_query=None, message=message, edited_message=None,
+                                     my_chat_member=None, chat_member=None)
+
+    bot = Bot()
+    lanes = Lanes(2)
+    poll_in_lanes(bot, lanes)
+    bot.process_new_updates([update(5, 1), update(6, 1), update(7, 2)])
+    assert bot.last_update_id == 7 and not bot.threaded
+    lanes.close()
+    assert sorted(handled) == [5, 6, 7]
+    assert handled.index(5) < handled.index(6)
@@ -0,0 +1,129 @@
+import asyncio
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+import async_runtime
+
+
+class FakeApi:
+    # Stands in for the AsyncTeleBot; every call yields to the loop once.
+
+    def __init__(self):
+        self.calls = []
+        self.message_id = 100
+
+    async def _call(self, *call):
+        self.calls.append(call)
+        await asyncio.sleep(0)
+        self.message_id += 1
+        return types.SimpleNamespace(message_id=self.message_id)
+
+    async def get_chat_member(self, chat, user_id):
+        await asyncio.sleep(0)
+        return types.SimpleNamespace(status='member')
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        return await self._call('send_message', chat_id, text)
+
+    async def reply_to(self, message, text):
+        return await self._call('reply_to', text)
+
+    async def delete_message(self, chat_id, message_id):
+        return await self._call('delete_message', chat_id, message_id)
+
+    async def answer_callback_query(self, callback_id, text=None, show_alert=None):
+        return await self._call('answer_callback_query', text)
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
+
+
+def callback(user_id, name, data, message_id=1):
+    return types.SimpleNamespace(id=f'{user_id}-{data}', data=data, message=types.SimpleNamespace(message_id=message_id),
+                                 from_user=types.SimpleNamespace(id=user_id, username=name, first_name=name))
+
+
+def test_native_handlers_replace_the_synchronous_ones():
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    ran = []
+
+    @bot.message_handler(commands=['a'])
+    def first(message):
+        ran.append(('sync', message))
+
+    @bot.message_handler(commands=['b'])
+    def second(message):
+        ran.append(('sync', message))
+
+    async def second_async(api, run, message):
+        ran.append(('native', await run(str.upper, message)))
+
+    async def main():
+        async_bot = AsyncTeleBot('123456:TEST')
+        with ThreadPoolExecutor(1) as executor:
+            async_runtime.mirror_handlers(bot, async_bot, asyncio.get_running_loop(), executor, {second: second_async})
+            handlers = [handler['function'] for handler in async_bot.message_handlers]
+            for handler, message in zip(handlers, ['x', 'y']):
+                await handler(message)
+        return handlers
+
+    handlers = asyncio.run(main())
+    assert [handler.__name__ for handler in handlers] == ['first', 'second_async']
+    assert ran == [('sync', 'x'), ('native', 'Y')]
+
+
+def test_serve_uses_the_configured_api_url(monkeypatch):
+    url = 'http://127.0.0.1:8081/bot{0}/{1}'
+    monkeypatch.setattr(apihelper, 'API_URL', url)
+    monkeypatch.setattr(asyncio_helper, 'API_URL', asyncio_helper.API_URL)
+
+    async def nothing(*args, **kwargs):
+        pass
+    monkeypatch.setattr(AsyncTeleBot, 'infinity_polling', nothing)
+    monkeypatch.setattr(AsyncTeleBot, 'close_session', nothing)
+
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    asyncio.run(async_runtime.serve(bot, workers=1))
+    assert asyncio_helper.API_URL == url
+
+
+def test_bot_game_is_sent_from_the_loop(chessbot, storage):
+    api = FakeApi()
+    asyncio.run(chessbot.choose_mode_async(api, run_inline, callback(7, 'solo', 'mode_bot_-50', message_id=3)))
+
+    assert [call[0] for call in api.calls] == ['send_message', 'delete_message', 'answer_callback_query']
+    (game_id, game), = [(game_id, game) for game_id, game in chessbot.active_games.items() if game['chat_id'] == -50]
+    assert game['message_id'] == 101 and game['player_ids'] == [7, None]
+    storage.flush()
+    assert storage.query('SELECT message_id FROM games WHERE game_id = ?', (game_id,)) == [(101,)]
+    chessbot.end_game(game_id)
+
+
+def test_only_one_joiner_gets_the_challenge(chessbot):
+    api = FakeApi()
+    game_id = 'async-join'
+    chessbot.waiting_players[game_id] = {'host': 'host', 'host_id': 1, 'mode': 'pvp', 'chat_id': -60, 'created': 0}
+
+    async def main():
+        await asyncio.gather(chessbot.join_game_async(api, run_inline, callback(2, 'first', 'a'), game_id),
+                             chessbot.join_game_async(api, run_inline, callback(3, 'second', 'b'), game_id))
+    asyncio.run(main())
+
+    game = chessbot.active_games.resident(game_id)
+    assert game['player_ids'] == [1, 2] and game['message_id'] is not None
+    assert ('answer_callback_query', "❌ اللعبة لم تعد متاحة!") in api.calls
+    assert game_id not in chessbot.waiting_players
+    chessbot.end_game(game_id)
+
+
+def test_leaderboard_reply_is_awaited(chessbot):
+    api = FakeApi()
+    message = types.SimpleNamespace(chat=types.SimpleNamespace(id=-70),
+                                    from_user=types.SimpleNamespace(id=8, username='someone', first_name='someone'))
+    asyncio.run(chessbot.my_chess_points_async(api, run_inline, message))
+    assert api.calls == [('reply_to', chessbot.points_text(8, 'someone'))]
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from cache import LoadingLRU, TTLCache
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=1)
+    assert cache.get('a') == 1
+    now[0] = 5
+    assert cache.get('b') is None
+    cache.set('c', 3)
+    cache.set('d', 4)
+    assert cache.get('a') is None
+    assert cache.add('c', 30) is False
+    assert cache.add('e', 5) is True
+
+
+def test_concurrent_misses_load_once():
+    loads = []
+    release = threading.Event()
+
+    def load(key):
+        loads.append(key)
+        release.wait(5)
+        return {'key': key}
+
+    lru = LoadingLRU(load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lru.get('game'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert loads == ['game']
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_lookups_do_not_wait_behind_a_load():
+    release = threading.Event()
+    lru = LoadingLRU(lambda key: release.wait(5) and {'key': key})
+    lru['resident'] = {'key': 'resident'}
+    loader = threading.Thread(target=lru.get, args=('slow',))
+    loader.start()
+    time.sleep(0.05)
+    started = time.perf_counter()
+    assert lru.get('resident') == {'key': 'resident'}
+    assert time.perf_counter() - started < 1
+    release.set()
+    loader.join()
+
+
+def test_missing_keys_are_remembered():
+    loads = []
+    lru = LoadingLRU(lambda key: loads.append(key), missing_ttl=60)
+    assert lru.get('gone') is None
+    assert 'gone' not in lru
+    assert loads == ['gone']
+    lru['gone'] = {'key': 'gone'}
+    assert lru.get('gone') == {'key': 'gone'}
+
+
+def test_load_errors_reach_every_waiter():
+    release = threading.Event()
+
+    def load(key):
+        release.wait(5)
+        raise RuntimeError('db down')
+
+    lru = LoadingLRU(load)
+    errors = []
+
+    def get():
+        try:
+            lru.get('game')
+        except RuntimeError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    with pytest.raises(RuntimeError):
+        lru.get('game')
+
+
+def test_evicts_least_recently_used():
+    evicted = []
+    lru = LoadingLRU(lambda key: None, lambda key, value: evicted.append(key), maxsize=2)
+    lru['a'] = 1
+    lru['b'] = 2
+    lru.get('a')
+    lru['c'] = 3
+    assert evicted == ['b']
+
+
+def test_pinned_keys_are_not_evicted():
+    evicted = []
+    busy = {'a'}
+    lru = LoadingLRU(lambda key: None, lambda key, value: evicted.append(key), maxsize=2,
+                     pinned=lambda key: key in busy)
+    lru['a'] = 1
+    lru['b'] = 2
+    lru['c'] = 3
+    assert evicted == ['b']
+    busy.add('c')
+    lru['d'] = 4
+    assert evicted == ['b']
+    assert len(lru) == 3
+    busy.clear()
+    lru['e'] = 5
+    assert evicted == ['b', 'a', 'c']
+    assert lru.keys() == ['d', 'e']
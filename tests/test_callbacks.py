@@ -0,0 +1,45 @@
+import chess
+import pytest
+
+import callbacks
+
+
+@pytest.mark.parametrize('action', [callbacks.MOVE, callbacks.JOIN, callbacks.COORD])
+@pytest.mark.parametrize('square', [0, 7, 36, 63])
+@pytest.mark.parametrize('handle', [1, 255, 2 ** 20 + 3, 2 ** 40 - 1])
+def test_round_trip(action, square, handle):
+    data = callbacks.encode(action, square, handle)
+    assert len(data) == callbacks.PAYLOAD_LENGTH
+    assert '_' not in data
+    assert callbacks.decode(data) == (action, square, handle)
+
+
+@pytest.mark.parametrize('data', ['mode_bot_-100', 'join_abc', 'check_sub_1_2', 'abc', 'a*cdefgh', ''])
+def test_other_data_is_not_a_payload(data):
+    assert callbacks.decode(data) is None
+
+
+def test_board_grid_order():
+    grid = callbacks.board_grid(42)
+    assert len(grid) == 64
+    assert callbacks.decode(grid[0]) == (callbacks.MOVE, chess.A8, 42)
+    assert callbacks.decode(grid[7]) == (callbacks.MOVE, chess.H8, 42)
+    assert callbacks.decode(grid[63]) == (callbacks.MOVE, chess.H1, 42)
+
+
+def test_coordinate_grid():
+    grid = callbacks.coordinate_grid(42)
+    assert [callbacks.decode(data)[:2] for data in grid] == \
+        [(callbacks.COORD, value) for value in range(callbacks.COORD_CANCEL + 1)]
+
+
+def test_handles_are_stable_and_never_reused(storage):
+    registry = callbacks.HandleRegistry()
+    first = registry.handle_for('handle-game-1')
+    assert registry.handle_for('handle-game-1') == first
+    assert registry.game_for(first) == 'handle-game-1'
+    registry.forget('handle-game-1')
+    assert registry.game_for(first) is None
+    second = registry.handle_for('handle-game-2')
+    assert second > first
+    assert callbacks.HandleRegistry().game_for(second) == 'handle-game-2'
@@ -0,0 +1,51 @@
+import threading
+
+import chess
+
+import clocks
+
+
+def test_new_clock():
+    clock = clocks.new_clock('blitz', now=100)
+    assert clock == {'control': 'blitz', 'remaining': [180, 180], 'started': 100}
+
+
+def test_only_the_side_to_move_runs():
+    clock = clocks.new_clock('blitz', now=100)
+    assert clocks.remaining(clock, chess.WHITE, chess.WHITE, now=130) == 150
+    assert clocks.remaining(clock, chess.BLACK, chess.WHITE, now=130) == 180
+    assert clocks.remaining(clock, chess.WHITE, chess.WHITE, now=1000) == 0
+
+
+def test_press_charges_time_and_adds_the_increment():
+    clock = clocks.new_clock('rapid', now=0)
+    clocks.press(clock, chess.WHITE, now=20)
+    assert clock['remaining'] == [585, 600]
+    assert clock['started'] == 20
+    assert clocks.deadline(clock, chess.BLACK) == 620
+    clocks.press(clock, chess.BLACK, now=50)
+    assert clock['remaining'] == [585, 575]
+    assert clocks.deadline(clock, chess.WHITE) == 635
+    assert clocks.remaining(clock, chess.WHITE, chess.WHITE, now=635) == 0
+
+
+def test_formatting():
+    assert clocks.pgn_time_control('blitz') == '180+2'
+    assert clocks.pgn_time_control('rapid') == '600+5'
+    assert clocks.format_time(180) == '3:00'
+    assert clocks.format_time(59.1) == '1:00'
+    assert clocks.format_time(0) == '0:00'
+
+
+def test_expired_timers_run_off_the_wheel_thread(chessbot, monkeypatch):
+    done = threading.Event()
+    threads = []
+
+    def flag_fall(game_id):
+        threads.append((game_id, threading.current_thread()))
+        done.set()
+
+    monkeypatch.setattr(chessbot, 'flag_fall', flag_fall)
+    chessbot.clock_wheel.on_expire('flagged')
+    assert done.wait(5)
+    assert threads[0][0] == 'flagged' and threads[0][1] is not threading.current_thread()
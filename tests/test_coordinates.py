@@ -0,0 +1,64 @@
+import types
+
+import chess
+import pytest
+
+import callbacks
+
+
+@pytest.fixture
+def taps(chessbot, monkeypatch):
+    answers = []
+    moves = []
+    monkeypatch.setattr(chessbot.bot, 'answer_callback_query', lambda *args, **kwargs: answers.append(args))
+    monkeypatch.setattr(chessbot, 'handle_move', lambda call, game_id, row, col: moves.append((call.from_user.id, row, col)))
+    chessbot.active_games['coords'] = {
+        'chat_id': 1, 'mode': 'pvp', 'players': ['white', 'black'], 'player_ids': [1, 2],
+        'board': chess.Board(), 'current': chess.WHITE, 'selected': None, 'message_id': 10,
+        'last_update': 0, 'snapshot': (0, chess.STARTING_FEN),
+    }
+
+    def tap(user_id, value):
+        call = types.SimpleNamespace(id='1', from_user=types.SimpleNamespace(id=user_id))
+        chessbot.coordinate_tap(call, 'coords', value)
+
+    yield tap, moves, answers
+    chessbot.active_games.pop('coords')
+
+
+def test_onlooker_cannot_overwrite_the_movers_file(taps):
+    tap, moves, _ = taps
+    tap(1, chess.FILE_NAMES.index('e'))
+    tap(99, chess.FILE_NAMES.index('a'))
+    tap(1, 8 + chess.RANK_NAMES.index('2'))
+    assert moves == [(1, 6, 4)]
+
+
+def test_rank_without_file_is_refused(taps):
+    tap, moves, answers = taps
+    tap(99, chess.FILE_NAMES.index('a'))
+    tap(1, 8 + chess.RANK_NAMES.index('2'))
+    assert moves == []
+    assert answers[-1][1] == "❌ اختر العمود أولاً!"
+
+
+def test_cancel_drops_only_own_file(taps):
+    tap, moves, _ = taps
+    tap(1, chess.FILE_NAMES.index('e'))
+    tap(2, chess.FILE_NAMES.index('d'))
+    tap(2, callbacks.COORD_CANCEL)
+    tap(1, 8 + chess.RANK_NAMES.index('2'))
+    assert moves == [(1, 6, 4)]
+
+
+def test_notices_edit_the_caption_of_photo_boards(chessbot, monkeypatch):
+    edits = []
+    monkeypatch.setattr(chessbot.bot, 'edit_message_caption', lambda *args, **kwargs: edits.append(('caption',) + args))
+    monkeypatch.setattr(chessbot.bot, 'edit_message_text', lambda *args, **kwargs: edits.append(('text',) + args))
+    monkeypatch.setattr(chessbot.edit_scheduler, 'submit', chessbot.edit_board_message)
+
+    monkeypatch.setattr(chessbot, 'board_images', object())
+    chessbot.edit_board_text(1, 10, 'over')
+    monkeypatch.setattr(chessbot, 'board_images', None)
+    chessbot.edit_board_text(1, 11, 'over')
+    assert edits == [('caption', 'over', 1, 10), ('text', 'over', 1, 11)]
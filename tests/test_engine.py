@@ -0,0 +1,76 @@
+import random
+import time
+
+import chess
+import pytest
+
+import engine
+
+MATE_IN_ONE = [
+    ('r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1', 'f3f7'),
+    ('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1', 'a1a8'),
+    ('4r1k1/8/8/8/8/8/6PP/7K b - - 0 1', 'e8e1'),
+]
+MIDDLEGAME = 'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP1B1PPP/R2QKB1R w KQ - 0 8'
+MATE_IN_TWO = 'k7/8/2K5/8/8/8/8/7R w - - 0 1'
+
+
+def search(fen, tt):
+    return engine.Search(chess.Board(fen), time.perf_counter() + 10, tt=tt)
+
+
+@pytest.mark.parametrize('level', engine.LEVELS)
+@pytest.mark.parametrize('fen, expected', MATE_IN_ONE)
+def test_finds_mate_in_one(level, fen, expected):
+    board = chess.Board(fen)
+    move = engine.choose_move(board, level)
+    assert move.uci() == expected
+    board.push(move)
+    assert board.is_checkmate()
+
+
+def test_returns_a_legal_move():
+    rng = random.Random(1)
+    for _ in range(10):
+        board = chess.Board()
+        for _ in range(rng.randrange(4, 40)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        if board.is_game_over():
+            assert engine.choose_move(board, 'easy') is None
+            continue
+        assert engine.choose_move(board, 'easy') in board.legal_moves
+
+
+@pytest.mark.parametrize('level', engine.LEVELS)
+def test_stays_within_the_levels_time(level):
+    # A depth no level reaches, so only the clock stops the search.
+    seconds = engine.LEVELS[level][1]
+    board = chess.Board(MIDDLEGAME)
+    started = time.perf_counter()
+    move = engine.choose_move(board, level, max_depth=engine.MAX_PLY)
+    assert time.perf_counter() - started < seconds + 0.25
+    assert move in board.legal_moves
+
+
+@pytest.mark.parametrize('score', [engine.MATE_SCORE - 5, -(engine.MATE_SCORE - 5), 250, -250])
+def test_tt_scores_round_trip(score):
+    for ply in (0, 1, 7):
+        assert engine._from_tt(engine._to_tt(score, ply), ply) == score
+
+
+def test_mate_scores_survive_the_tt():
+    # The second search starts one ply in and at depth 1 can only see the mate
+    # through the entries the first one stored; its distance must be counted
+    # from the new root.
+    tt = {}
+    first = search(MATE_IN_TWO, tt)
+    assert first.negamax(3, -engine.INFINITY, engine.INFINITY, 0) == engine.MATE_SCORE - 3
+    board = chess.Board(MATE_IN_TWO)
+    board.push(first.root_move)
+
+    second = search(board.fen(), tt)
+    assert second.negamax(1, -engine.INFINITY, engine.INFINITY, 0) == -(engine.MATE_SCORE - 2)
+    assert abs(search(board.fen(), {}).negamax(1, -engine.INFINITY, engine.INFINITY, 0)) < engine.MATE_BOUND
@@ -0,0 +1,54 @@
+import threading
+
+import chess
+
+import metrics
+from engine_pool import EnginePool
+
+
+def test_search_runs_in_spawned_worker():
+    pool = EnginePool(workers=1)
+    try:
+        assert pool._executor._mp_context.get_start_method() == 'spawn'
+        board = chess.Board()
+        board.push_san('e4')
+        done = threading.Event()
+        replies = []
+
+        def on_done(uci):
+            replies.append(uci)
+            done.set()
+
+        assert pool.submit('game', board, 'easy', on_done)
+        assert done.wait(60)
+        assert chess.Move.from_uci(replies[0]) in board.legal_moves
+        assert pool.stats()['completed'] == 1
+    finally:
+        pool.close()
+
+
+def test_newer_search_replaces_older_one():
+    pool = EnginePool(workers=1)
+    try:
+        board = chess.Board()
+        replies = []
+        done = threading.Event()
+        pool.submit('game', board, 'easy', replies.append)
+        board.push_san('d4')
+        pool.submit('game', board, 'easy', lambda uci: (replies.append(uci), done.set()))
+        assert done.wait(60)
+        assert len(replies) == 1
+        assert chess.Move.from_uci(replies[0]) in board.legal_moves
+    finally:
+        pool.close()
+
+
+def test_oracle_counters_are_exported(chessbot, monkeypatch):
+    monkeypatch.setattr(metrics, '_gauges', {})
+    monkeypatch.setattr(chessbot.oracle, 'book_misses', 7)
+    monkeypatch.setattr(chessbot.oracle, 'tablebase_hits', 2)
+    chessbot.register_metrics()
+    lines = metrics.render().splitlines()
+    for name, value in chessbot.oracle.stats().items():
+        assert f'chess_{name} {float(value)}' in lines
+    assert 'chess_book_misses 7.0' in lines and 'chess_tablebase_hits 2.0' in lines
@@ -0,0 +1,54 @@
+import random
+
+import chess
+import pytest
+
+import history
+
+
+def all_moves():
+    for seed in range(5):
+        rng = random.Random(seed)
+        board = chess.Board()
+        while not board.is_game_over() and board.ply() < 200:
+            moves = list(board.legal_moves)
+            yield from moves
+            board.push(rng.choice(moves))
+
+
+def test_moves_fit_in_16_bits_and_round_trip():
+    for move in all_moves():
+        code = history.encode_move(move)
+        assert 0 <= code < 1 << 16
+        assert history.decode_move(code) == move
+
+
+@pytest.mark.parametrize('piece', [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN])
+def test_promotions(piece):
+    move = chess.Move(chess.G7, chess.H8, piece)
+    assert history.decode_move(history.encode_move(move)) == move
+
+
+def test_replay_from_snapshot():
+    board = chess.Board()
+    for san in ('e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'):
+        board.push_san(san)
+    snapshot = board.fen()
+    codes = []
+    for san in ('Ba4', 'Nf6', 'O-O'):
+        codes.append(history.encode_move(board.push_san(san)))
+    replayed = history.replay(snapshot, codes)
+    assert replayed.fen() == board.fen()
+    assert replayed.ply() == board.ply()
+
+
+def test_snapshots_only_on_zeroing_moves():
+    board = chess.Board()
+    game = {'board': board, 'snapshot': (0, chess.STARTING_FEN)}
+    for san in ('Nf3', 'Nf6', 'Ng1', 'Ng8') * 5:
+        assert not history.needs_snapshot(game, board.parse_san(san))
+        board.push_san(san)
+    assert board.ply() >= history.SNAPSHOT_EVERY
+    assert history.needs_snapshot(game, board.parse_san('e4'))
+    game['snapshot'] = (board.ply() - 1, board.fen())
+    assert not history.needs_snapshot(game, board.parse_san('e4'))
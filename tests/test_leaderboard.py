@@ -0,0 +1,46 @@
+import random
+
+from leaderboard import Leaderboard, PointCounts
+
+
+def test_point_counts_match_a_plain_count():
+    rng = random.Random(1)
+    counts = PointCounts(size=8)
+    scores = []
+    for _ in range(500):
+        points = rng.randrange(3000)
+        counts.add(points)
+        scores.append(points)
+    for points in (0, 1, 7, 8, 999, 2999, 5000):
+        assert counts.at_most(points) == sum(score <= points for score in scores)
+        assert counts.above(points) == sum(score > points for score in scores)
+    assert counts.at_most(-1) == 0
+
+
+def test_removing_a_score():
+    counts = PointCounts()
+    counts.add(10)
+    counts.add(20)
+    counts.add(10, -1)
+    assert counts.total == 1
+    assert counts.above(5) == 1
+
+
+def test_ranks_and_top(storage):
+    board = Leaderboard(top_n=3)
+    board.load()
+    base = 10 ** 9
+    board.record(-1, [(base + 1, 'a', 10**6), (base + 2, 'b', 10**6 + 5)])
+    board.record(-1, [(base + 3, 'c', 10**6 + 1)])
+    board.record(-2, [(base + 1, 'a', 20)])
+    assert board.top(3) == [('a', 10**6 + 20), ('b', 10**6 + 5), ('c', 10**6 + 1)]
+    assert board.rank(base + 1) == (10**6 + 20, 1)
+    assert board.rank(base + 3) == (10**6 + 1, 3)
+    assert board.rank(base + 4) is None
+    assert board.chat_top(-1) == [('b', 10**6 + 5), ('c', 10**6 + 1), ('a', 10**6)]
+    assert board.chat_top(-2) == [('a', 20)]
+
+    reloaded = Leaderboard(top_n=3)
+    reloaded.load()
+    assert reloaded.top(3) == board.top(3)
+    assert reloaded.rank(base + 3) == board.rank(base + 3)
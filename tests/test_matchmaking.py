@@ -0,0 +1,68 @@
+import pytest
+
+from matchmaking import Matchmaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def expired():
+    return []
+
+
+@pytest.fixture
+def matchmaker(clock, expired):
+    return Matchmaker(expired.append, bucket_width=100, max_gap=2, ttl=60, clock=clock)
+
+
+def test_pairs_the_closest_bucket(matchmaker):
+    assert matchmaker.seek(1, 'far', -1, 1300) is None
+    assert matchmaker.seek(2, 'near', -2, 1750) is None
+    assert matchmaker.seek(3, 'new', -3, 1620)['user_id'] == 2
+    assert len(matchmaker) == 1 and matchmaker.waiting(1)
+    assert matchmaker.matched == 1
+
+
+def test_too_far_apart_waits(matchmaker):
+    assert matchmaker.seek(1, 'low', -1, 1200) is None
+    assert matchmaker.seek(2, 'high', -2, 1500) is None
+    assert len(matchmaker) == 2
+    assert matchmaker.seek(3, 'edge', -3, 1450)['user_id'] == 2
+    assert matchmaker.seek(4, 'edge', -4, 1399)['user_id'] == 1
+
+
+def test_equal_distance_prefers_the_older_seeker(matchmaker, clock):
+    assert matchmaker.seek(1, 'above', -1, 1700) is None
+    clock.now += 1
+    assert matchmaker.seek(2, 'below', -2, 1300) is None
+    assert matchmaker.seek(3, 'middle', -3, 1500)['user_id'] == 1
+
+
+def test_cancel(matchmaker):
+    matchmaker.seek(1, 'a', -1, 1500)
+    assert matchmaker.cancel(1)
+    assert not matchmaker.cancel(1)
+    assert matchmaker.seek(2, 'b', -2, 1500) is None
+
+
+def test_sweep_drops_old_seekers(matchmaker, clock, expired):
+    matchmaker.seek(1, 'old', -1, 1500)
+    clock.now += 30
+    matchmaker.seek(2, 'young', -2, 2500)
+    clock.now += 31
+    assert matchmaker.sweep() == 1
+    assert [seeker['user_id'] for seeker in expired] == [1]
+    assert matchmaker.waiting(2) and not matchmaker.waiting(1)
+    assert matchmaker.seek(3, 'c', -3, 1500) is None
+    assert matchmaker.timed_out == 1
@@ -0,0 +1,76 @@
+import random
+
+import chess
+import pytest
+
+from positions import PositionCache, analyse, position_key
+
+
+def random_positions(count, seed):
+    rng = random.Random(seed)
+    board = chess.Board()
+    for _ in range(count):
+        if board.is_game_over():
+            board = chess.Board()
+        yield board.copy()
+        board.push(rng.choice(list(board.legal_moves)))
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_analysis_matches_python_chess(seed):
+    cache = PositionCache()
+    for board in random_positions(300, seed):
+        analysis = cache.get(board)
+        targets = {}
+        for move in board.legal_moves:
+            targets[move.from_square] = targets.get(move.from_square, 0) | chess.BB_SQUARES[move.to_square]
+        assert analysis.targets == targets
+        assert analysis.check == board.is_check()
+        assert analysis.checkmate == board.is_checkmate()
+        assert analysis.stalemate == board.is_stalemate()
+        outcome = board.outcome()
+        assert cache.game_over_reason(board) == (outcome.termination if outcome else None)
+
+
+def test_terminations():
+    mate = chess.Board('rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3')
+    stalemate = chess.Board('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1')
+    bare_kings = chess.Board('8/8/4k3/8/8/3K4/8/8 w - - 0 1')
+    assert analyse(mate).reason == chess.Termination.CHECKMATE
+    assert analyse(stalemate).reason == chess.Termination.STALEMATE
+    assert analyse(bare_kings).reason == chess.Termination.INSUFFICIENT_MATERIAL
+    assert analyse(chess.Board()).reason is None
+
+
+def test_castling_tapped_as_king_then_rook():
+    board = chess.Board('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    cache = PositionCache()
+    for uci in ('e1g1', 'e1h1', 'e1c1', 'e1a1'):
+        assert cache.is_legal(board, chess.Move.from_uci(uci))
+    assert not cache.is_legal(board, chess.Move.from_uci('e1e3'))
+
+
+def test_queen_promotion_is_legal():
+    board = chess.Board('8/4P3/8/8/8/8/k7/7K w - - 0 1')
+    assert PositionCache().is_legal(board, chess.Move.from_uci('e7e8q'))
+
+
+def test_positions_shared_across_move_orders():
+    cache = PositionCache()
+    first = chess.Board()
+    for san in ('Nf3', 'Nf6', 'Nc3', 'Nc6'):
+        first.push_san(san)
+    second = chess.Board()
+    for san in ('Nc3', 'Nc6', 'Nf3', 'Nf6'):
+        second.push_san(san)
+    assert position_key(first) == position_key(second)
+    cache.get(first)
+    cache.get(second)
+    assert cache.stats()['hits'] == 1
+
+
+def test_bounded():
+    cache = PositionCache(maxsize=10)
+    for board in random_positions(50, 3):
+        cache.get(board)
+    assert len(cache) == 10
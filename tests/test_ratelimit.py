@@ -0,0 +1,168 @@
+import asyncio
+import time
+import types
+
+import pytest
+from telebot import asyncio_helper
+from telebot.apihelper import ApiTelegramException
+
+from ratelimit import ApiErrors, EditScheduler
+
+
+def failing(error_code, description='Bad Request', exception=ApiTelegramException):
+    def request(*args, **kwargs):
+        raise exception('sendMessage', None, {'error_code': error_code, 'description': description})
+    return request
+
+
+def test_counts_failures_of_any_call():
+    api_errors = ApiErrors()
+    for request in (failing(429, 'Too Many Requests'), failing(403, 'Forbidden'), failing(400)):
+        with pytest.raises(ApiTelegramException):
+            api_errors.wrap(request)('token', 'sendMessage')
+
+    def timeout(*args, **kwargs):
+        raise TimeoutError
+    with pytest.raises(TimeoutError):
+        api_errors.wrap(timeout)('token', 'getChatMember')
+    assert (api_errors.rate_limited, api_errors.errors) == (1, 3)
+
+
+def test_not_modified_is_not_an_error():
+    api_errors = ApiErrors()
+    with pytest.raises(ApiTelegramException):
+        api_errors.wrap(failing(400, 'Bad Request: message is not modified'))()
+    assert (api_errors.rate_limited, api_errors.errors) == (0, 0)
+
+
+def test_results_pass_through():
+    api_errors = ApiErrors()
+    assert api_errors.wrap(lambda *args, **kwargs: {'ok': True})('token', 'sendMessage') == {'ok': True}
+    assert api_errors.errors == 0
+
+
+def test_async_requests():
+    api_errors = ApiErrors()
+
+    async def limited(*args, **kwargs):
+        failing(429, 'Too Many Requests', asyncio_helper.ApiTelegramException)()
+
+    async def ok(*args, **kwargs):
+        return True
+
+    with pytest.raises(asyncio_helper.ApiTelegramException):
+        asyncio.run(api_errors.wrap_async(limited)('token', 'answerCallbackQuery'))
+    assert asyncio.run(api_errors.wrap_async(ok)('token', 'deleteMessage'))
+    assert (api_errors.rate_limited, api_errors.errors) == (1, 0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def edits():
+    # An EditScheduler on a clock the test moves. Every send is recorded with
+    # the time it was made, in `sent` or, when fail(error) queued an error for
+    # it, in `failed`.
+    clock = Clock()
+    sent = []
+    failed = []
+    errors = []
+
+    def send(chat_id, message_id, text, reply_markup):
+        if errors:
+            failed.append(clock.now)
+            raise errors.pop(0)
+        sent.append((clock.now, chat_id, message_id, text))
+
+    scheduler = EditScheduler(send, chat_interval=1, global_rate=2, workers=1, clock=clock)
+
+    def wait_for(count):
+        # Waits until `count` sends were made, then lets the scheduler settle.
+        deadline = time.monotonic() + 5
+        while len(sent) + len(failed) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        time.sleep(0.02)
+        return sent
+
+    def advance(seconds):
+        clock.now += seconds
+        with scheduler._cond:
+            scheduler._cond.notify_all()
+        time.sleep(0.02)
+
+    yield types.SimpleNamespace(scheduler=scheduler, advance=advance, wait_for=wait_for, sent=sent, failed=failed,
+                                fail=errors.append)
+    scheduler.close()
+
+
+def rate_limited(retry_after=None):
+    result = {'error_code': 429, 'description': 'Too Many Requests'}
+    if retry_after is not None:
+        result['parameters'] = {'retry_after': retry_after}
+    return ApiTelegramException('editMessageText', None, result)
+
+
+def test_burst_on_one_board_is_coalesced(edits):
+    edits.scheduler.submit(1, 10, 'first')
+    assert edits.wait_for(1) == [(0.0, 1, 10, 'first')]
+    for text in ('second', 'third', 'fourth'):
+        edits.scheduler.submit(1, 10, text)
+    edits.advance(1)
+    assert edits.wait_for(2)[1:] == [(1.0, 1, 10, 'fourth')]
+    assert edits.scheduler.coalesced == 2 and edits.scheduler.pending() == 0
+
+
+def test_one_edit_per_chat_interval(edits):
+    for message_id in (10, 11, 12):
+        edits.scheduler.submit(1, message_id, 'board')
+    edits.scheduler.submit(2, 20, 'other chat')
+    edits.wait_for(2)
+    for _ in range(4):
+        edits.advance(0.5)
+    sent = edits.wait_for(4)
+    assert [(at, chat_id) for at, chat_id, _, _ in sent] == [(0.0, 1), (0.0, 2), (1.0, 1), (2.0, 1)]
+
+
+def test_global_rate_is_shared_by_all_chats(edits):
+    for chat_id in range(1, 6):
+        edits.scheduler.submit(chat_id, 10, 'board')
+    assert len(edits.wait_for(2)) == 2
+    for _ in range(6):
+        edits.advance(0.25)
+    sent = edits.wait_for(5)
+    assert [at for at, *_ in sent] == [0.0, 0.0, 0.5, 1.0, 1.5]
+
+
+def test_rate_limited_edit_waits_for_retry_after(edits):
+    edits.fail(rate_limited(retry_after=3))
+    edits.scheduler.submit(1, 10, 'board')
+    edits.wait_for(1)
+    edits.advance(2.5)
+    edits.scheduler.submit(1, 10, 'newer board')
+    edits.advance(0.25)
+    assert edits.sent == []
+    edits.advance(0.25)
+    assert edits.wait_for(2) == [(3.0, 1, 10, 'newer board')]
+    assert edits.failed == [0.0] and edits.scheduler.rate_limited == 1
+
+
+def test_backoff_doubles_without_retry_after(edits):
+    edits.fail(rate_limited())
+    edits.fail(rate_limited())
+    edits.scheduler.submit(1, 10, 'board')
+    for count in (1, 2):
+        edits.wait_for(count)
+        for _ in range(10):
+            edits.advance(0.5)
+            if len(edits.sent) + len(edits.failed) > count:
+                break
+    # Retried 2s after the first 429 and 4s after the second.
+    assert edits.failed == [0.0, 2.0]
+    assert edits.sent == [(6.0, 1, 10, 'board')]
+    assert edits.scheduler.rate_limited == 2
@@ -0,0 +1,54 @@
+import pytest
+
+import ratings
+
+
+def test_expected_score():
+    assert ratings.expected_score(1500, 1500) == 0.5
+    assert ratings.expected_score(1900, 1500) == pytest.approx(10 / 11)
+    assert ratings.expected_score(1500, 1900) + ratings.expected_score(1900, 1500) == pytest.approx(1)
+
+
+def test_k_factor():
+    assert ratings.k_factor(0) == ratings.K_PROVISIONAL
+    assert ratings.k_factor(ratings.PROVISIONAL_GAMES - 1) == ratings.K_PROVISIONAL
+    assert ratings.k_factor(ratings.PROVISIONAL_GAMES) == ratings.K_ESTABLISHED
+
+
+@pytest.mark.parametrize('score', [1, 0.5, 0])
+def test_rate_is_zero_sum_with_equal_k(score):
+    a, b = ratings.rate((1600, 5), (1450, 12), score)
+    assert a[0] + b[0] == pytest.approx(1600 + 1450)
+    assert (a[1], b[1]) == (6, 13)
+
+
+def test_rate():
+    assert ratings.rate((1500, 0), (1500, 0), 1) == ((1520, 1), (1480, 1))
+    a, b = ratings.rate((1500, 100), (1500, 0), 0)
+    assert (a[0], b[0]) == (1490, 1520)
+
+
+def test_batches_match_recompute(storage):
+    service = ratings.RatingService(interval=3600)
+    players = [(2 * 10 ** 9 + i, f'player{i}') for i in range(4)]
+    results = [(0, 1, 1), (2, 3, 0.5), (0, 2, 0), (1, 3, 1), (0, 1, 0.5)]
+    try:
+        for a, b, score in results[:3]:
+            service.submit(players[a], players[b], score)
+        service.flush()
+        for a, b, score in results[3:]:
+            service.submit(players[a], players[b], score, chat_id=-5)
+    finally:
+        service.close()
+    assert service.applied == len(results)
+
+    expected = {user_id: (ratings.INITIAL_RATING, 0) for user_id, _ in players}
+    for a, b, score in results:
+        a_id, b_id = players[a][0], players[b][0]
+        expected[a_id], expected[b_id] = ratings.rate(expected[a_id], expected[b_id], score)
+    for user_id, (rating, games) in expected.items():
+        assert ratings.get_rating(user_id) == pytest.approx((rating, games))
+
+    ratings.recompute()
+    for user_id, (rating, games) in expected.items():
+        assert ratings.get_rating(user_id) == pytest.approx((rating, games))
@@ -0,0 +1,79 @@
+import threading
+
+import chess
+
+from actors import GameActors
+from cache import LoadingLRU
+from reaper import Reaper
+
+# Rows older than any other test's, so the sweeps only see these.
+STALE = -1000
+
+
+def save_row(storage, game_id, last_update):
+    storage.save_game((game_id, 1, 'pvp', '["a", "b"]', chess.STARTING_FEN, 1, None, 10, last_update, 0, None, None,
+                       '[1, 2]'))
+
+
+def stored(storage, game_id):
+    storage.flush()
+    return bool(storage.query('SELECT 1 FROM games WHERE game_id = ?', (game_id,)))
+
+
+def make_reaper(storage, **kwargs):
+    expired = []
+    active_games = LoadingLRU(lambda game_id: None)
+    actors = GameActors(workers=1)
+    reaper = Reaper({}, active_games, actors, lambda *args: expired.append(args + (threading.current_thread(),)),
+                    game_ttl=500, clock=lambda: 0, **kwargs)
+    return reaper, active_games, actors, expired
+
+
+def test_stale_games_are_deleted_in_their_actor(storage):
+    reaper, active_games, actors, expired = make_reaper(storage, batch_size=2)
+    ids = [f'reap-{i}' for i in range(5)]
+    for game_id in ids:
+        save_row(storage, game_id, STALE)
+    save_row(storage, 'reap-fresh', 0)
+
+    assert reaper.sweep() == {'challenges': 0, 'games': 5}
+    actors.close()
+    assert sorted(args[1] for args in expired) == ids
+    assert all(args[0] == 'game' and args[4] is not threading.current_thread() for args in expired)
+    assert reaper.games_reaped == 5
+    assert not any(stored(storage, game_id) for game_id in ids)
+    assert stored(storage, 'reap-fresh')
+
+
+def test_a_move_before_the_expiry_keeps_the_game(storage):
+    reaper, active_games, actors, expired = make_reaper(storage)
+    game = active_games['reap-moved'] = {'last_update': STALE}
+    save_row(storage, 'reap-moved', STALE)
+    release = threading.Event()
+    # A tap is being handled when the sweep runs; the move it makes lands
+    # before the expiry task gets the actor.
+    actors.post('reap-moved', lambda: (release.wait(5), game.update(last_update=0)))
+
+    assert reaper.sweep()['games'] == 1
+    release.set()
+    actors.close()
+    assert expired == []
+    assert active_games.resident('reap-moved') is game
+    assert stored(storage, 'reap-moved')
+    storage.delete_game('reap-moved')
+
+
+def test_a_save_queued_after_the_sweep_cannot_bring_the_game_back(storage):
+    reaper, active_games, actors, expired = make_reaper(storage)
+    active_games['reap-saved'] = {'last_update': STALE}
+    save_row(storage, 'reap-saved', STALE)
+    release = threading.Event()
+    actors.post('reap-saved', release.wait, 5)
+
+    reaper.sweep()
+    save_row(storage, 'reap-saved', STALE)
+    release.set()
+    actors.close()
+    assert [args[1] for args in expired] == ['reap-saved']
+    assert active_games.resident('reap-saved') is None
+    assert not stored(storage, 'reap-saved')
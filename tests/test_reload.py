@@ -0,0 +1,117 @@
+import random
+
+import chess
+import pytest
+
+import history
+
+
+def new_game(chessbot, game_id, clock=None):
+    chessbot.active_games[game_id] = {
+        'chat_id': 1, 'mode': 'pvp', 'players': ['white', 'black'], 'player_ids': [1, 2],
+        'board': chess.Board(), 'current': chess.WHITE, 'selected': None, 'message_id': 10,
+        'last_update': 0, 'snapshot': (0, chess.STARTING_FEN), 'clock': clock,
+    }
+    chessbot.save_game(game_id)
+    return chessbot.active_games[game_id]
+
+
+def play(chessbot, game_id, plies, seed):
+    rng = random.Random(seed)
+    game = chessbot.active_games[game_id]
+    for _ in range(plies):
+        moves = list(game['board'].legal_moves)
+        if not moves:
+            break
+        chessbot.record_move(game_id, rng.choice(moves))
+        game['current'] = game['board'].turn
+    return game
+
+
+def reload(chessbot, storage, game_id):
+    storage.flush()
+    chessbot.active_games.pop(game_id)
+    return chessbot.active_games[game_id]
+
+
+@pytest.mark.parametrize('plies', [5, 37, 40, 83])
+def test_reload_after_snapshots(chessbot, storage, plies):
+    game_id = f'reload-{plies}'
+    new_game(chessbot, game_id)
+    game = play(chessbot, game_id, plies, seed=plies)
+    fen, ply, snapshot = game['board'].fen(), history.game_ply(game), game['snapshot']
+
+    loaded = reload(chessbot, storage, game_id)
+    assert loaded['board'].fen() == fen
+    assert loaded['snapshot'] == snapshot
+    assert history.game_ply(loaded) == ply
+    assert storage.load_moves(game_id) == [history.encode_move(move) for move in game['board'].move_stack]
+
+
+def test_snapshot_spacing(chessbot):
+    game_id = 'reload-spacing'
+    new_game(chessbot, game_id)
+    snapshots = set()
+    rng = random.Random(7)
+    game = chessbot.active_games[game_id]
+    for _ in range(120):
+        moves = list(game['board'].legal_moves)
+        if not moves:
+            break
+        chessbot.record_move(game_id, rng.choice(moves))
+        snapshots.add(game['snapshot'][0])
+    plies = sorted(snapshots)
+    assert plies == sorted(set(plies))
+    assert all(later - earlier >= history.SNAPSHOT_EVERY for earlier, later in zip(plies, plies[1:]))
+
+
+def test_reload_keeps_clock_and_moves(chessbot, storage):
+    game_id = 'reload-clock'
+    new_game(chessbot, game_id, clock={'control': 'blitz', 'remaining': [170.5, 180], 'started': 1000.0})
+    game = play(chessbot, game_id, 45, seed=3)
+    game['clock']['remaining'][0] = 150.25
+    chessbot.save_game(game_id)
+    play(chessbot, game_id, 3, seed=4)
+    fen = game['board'].fen()
+
+    loaded = reload(chessbot, storage, game_id)
+    assert loaded['board'].fen() == fen
+    assert loaded['clock'] == game['clock']
+
+
+def test_stored_turn_is_the_side_to_move(chessbot, storage):
+    game_id = 'reload-turn'
+    new_game(chessbot, game_id)
+    game = chessbot.active_games[game_id]
+    rng = random.Random(11)
+    checked = 0
+    while checked < 3 and not game['board'].is_game_over():
+        snapshot = game['snapshot']
+        chessbot.record_move(game_id, rng.choice(list(game['board'].legal_moves)))
+        game['current'] = game['board'].turn
+        if game['snapshot'] != snapshot:
+            storage.flush()
+            rows = storage.query('SELECT current_turn FROM games WHERE game_id = ?', (game_id,))
+            assert rows == [(int(game['board'].turn),)]
+            checked += 1
+    assert checked == 3
+
+
+def test_reload_keeps_player_ids(chessbot, storage):
+    game_id = 'reload-ids'
+    game = new_game(chessbot, game_id)
+    game['player_ids'] = [111, 222]
+    play(chessbot, game_id, 30, seed=5)
+
+    loaded = reload(chessbot, storage, game_id)
+    assert loaded['player_ids'] == [111, 222]
+    assert loaded['players'] == ['white', 'black']
+
+
+def test_reload_bot_game_keeps_the_human(chessbot, storage):
+    game_id = 'reload-bot-ids'
+    game = new_game(chessbot, game_id)
+    game.update(mode='bot', players=['alice', 'bot'], player_ids=[333, None])
+    chessbot.save_game(game_id)
+
+    assert reload(chessbot, storage, game_id)['player_ids'] == [333, None]
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from timer_wheel import TimerWheel
+
+
+class Wheel(TimerWheel):
+    # A 3 x 4 slot wheel with one-second ticks, advanced by hand; records the
+    # tick each key fired on.
+
+    def __init__(self):
+        super().__init__(lambda key: self.fired_keys.append((key, self._current)), tick=1, slots=4, levels=3,
+                         clock=lambda: 0)
+        self.fired_keys = []
+
+
+@pytest.fixture
+def wheel():
+    return Wheel()
+
+
+def advance_to(wheel, until):
+    for now in range(wheel._current + 1, until + 1):
+        wheel.advance(now)
+
+
+def test_fires_at_the_deadline(wheel):
+    for key, deadline in (('a', 1), ('b', 3), ('c', 4), ('d', 17), ('e', 63)):
+        wheel.schedule(key, deadline)
+    advance_to(wheel, 70)
+    assert wheel.fired_keys == [('a', 1), ('b', 3), ('c', 4), ('d', 17), ('e', 63)]
+    assert len(wheel) == 0
+
+
+def test_beyond_the_span_still_fires_on_time(wheel):
+    wheel.schedule('late', 150)
+    advance_to(wheel, 200)
+    assert wheel.fired_keys == [('late', 150)]
+
+
+def test_reschedule_and_cancel(wheel):
+    wheel.schedule('moved', 5)
+    wheel.schedule('moved', 20)
+    wheel.schedule('cancelled', 7)
+    wheel.cancel('cancelled')
+    advance_to(wheel, 30)
+    assert wheel.fired_keys == [('moved', 20)]
+
+
+def test_past_deadlines_fire_on_the_next_tick(wheel):
+    advance_to(wheel, 10)
+    wheel.schedule('overdue', 2)
+    advance_to(wheel, 11)
+    assert wheel.fired_keys == [('overdue', 11)]
+
+
+def test_random_deadlines():
+    rng = random.Random(7)
+    fired = {}
+    now = [0]
+    wheel = TimerWheel(lambda key: fired.setdefault(key, now[0]), tick=1, slots=8, levels=3, clock=lambda: 0)
+    deadlines = {}
+    for step in range(2000):
+        now[0] = step
+        for _ in range(rng.randrange(3)):
+            key = rng.randrange(300)
+            deadline = step + rng.randrange(1, 1000)
+            if key in fired:
+                del fired[key]
+            deadlines[key] = deadline
+            wheel.schedule(key, deadline)
+        if rng.random() < 0.05 and deadlines:
+            key = rng.choice(list(deadlines))
+            wheel.cancel(key)
+            del deadlines[key]
+            fired.pop(key, None)
+        wheel.advance(step)
+    for key, deadline in deadlines.items():
+        if deadline <= 1999:
+            assert fired[key] == deadline
+        else:
+            assert key not in fired
@@ -0,0 +1,118 @@
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import time
+
+import callbacks
+import webhook
+
+
+def callback_update(chat_id, data, chat_type='private'):
+    return {'update_id': 1, 'callback_query': {
+        'id': '1', 'from': {'id': 5}, 'data': data,
+        'message': {'message_id': 1, 'chat': {'id': chat_id, 'type': chat_type}}}}
+
+
+def message_update(chat_id, text, chat_type='private'):
+    return {'update_id': 1, 'message': {'message_id': 1, 'text': text, 'chat': {'id': chat_id, 'type': chat_type}}}
+
+
+def route(ring, update):
+    return webhook.shard_for(ring, update, webhook.routing_key(update))
+
+
+def test_private_chats_are_spread_over_the_ring():
+    ring = webhook.HashRing(4)
+    shards = {route(ring, message_update(chat_id, 'تحدي شطرنج')) for chat_id in range(1, 200)}
+    assert shards == {0, 1, 2, 3}
+    for chat_id in range(1, 200):
+        assert route(ring, callback_update(chat_id, f'mode_bot_{chat_id}')) == ring.shard_for(chat_id)
+
+
+def test_matchmaking_commands_go_to_the_matchmaking_shard():
+    ring = webhook.HashRing(4)
+    for chat_id in range(1, 50):
+        for text in webhook.MATCHMAKING_COMMANDS:
+            assert route(ring, message_update(chat_id, text)) == webhook.MATCHMAKING_SHARD
+    group = -100123
+    assert route(ring, message_update(group, webhook.MATCHMAKING_COMMANDS[0], 'supergroup')) == ring.shard_for(group)
+
+
+def test_taps_go_to_the_shard_owning_the_game():
+    ring = webhook.HashRing(4)
+    for shard in range(4):
+        handle = ((shard + 1) << callbacks.HANDLE_BITS) | 77
+        for chat_id in (11, 12, -100):
+            assert route(ring, callback_update(chat_id, callbacks.encode(callbacks.MOVE, 12, handle))) == shard
+    old = callbacks.encode(callbacks.MOVE, 12, 77)
+    assert route(ring, callback_update(-100, old)) == ring.shard_for(-100)
+
+
+def test_handles_name_their_shard(storage):
+    registry = callbacks.HandleRegistry(shard=2)
+    handle = registry.handle_for('sharded-game')
+    assert callbacks.handle_shard(handle) == 2
+    assert callbacks.HandleRegistry(shard=2).game_for(handle) == 'sharded-game'
+    assert callbacks.HandleRegistry(shard=1).game_for(handle) is None
+    assert callbacks.handle_shard(callbacks.HandleRegistry().handle_for('unsharded-game')) is None
+
+
+def test_ring_assignment_is_stable_across_processes(tmp_path):
+    # Another process with another hash seed. The repository goes on its path
+    # after python-chess, which its chess.py would otherwise shadow.
+    keys = list(range(-50, 50)) + [-1001234567890]
+    script = (f'import sys; sys.path.append({os.path.dirname(webhook.__file__)!r}); '
+              'import webhook; ring = webhook.HashRing(8); '
+              f'print([ring.shard_for(key) for key in {keys!r}])')
+    env = dict(os.environ, PYTHONHASHSEED='123')
+    output = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp_path, capture_output=True, text=True,
+                            check=True).stdout
+    ring = webhook.HashRing(8)
+    assert output.strip() == str([ring.shard_for(key) for key in keys])
+    assert [ring.shard_for(key) for key in keys] == [webhook.HashRing(8).shard_for(key) for key in keys]
+
+
+def test_adding_a_shard_moves_about_one_nth_of_the_chats():
+    before, after = webhook.HashRing(4), webhook.HashRing(5)
+    keys = range(-10000, 10000)
+    moved = [key for key in keys if before.shard_for(key) != after.shard_for(key)]
+    assert 0.1 < len(moved) / len(keys) < 0.3
+    assert {after.shard_for(key) for key in moved} == {4}
+
+
+def test_routing_key_of_each_update_type():
+    chat = {'id': -100, 'type': 'supergroup'}
+    assert webhook.routing_key(callback_update(-100, 'x')) == -100
+    assert webhook.routing_key({'update_id': 3, 'callback_query': {'id': '1', 'from': {'id': 5}, 'data': 'x'}}) == 5
+    for kind in ('message', 'edited_message', 'my_chat_member', 'chat_member'):
+        assert webhook.routing_key({'update_id': 3, kind: {'chat': chat}}) == -100
+    assert webhook.routing_key({'update_id': 3, 'inline_query': {'id': '1', 'from': {'id': 5}}}) == 3
+
+
+def test_consume_keeps_each_chats_order():
+    handled = []
+    rng = random.Random(2)
+
+    class Bot:
+        threaded = True
+
+        def process_new_updates(self, updates):
+            time.sleep(rng.random() / 1000)
+            handled.extend((update.message.chat.id, update.update_id) for update in updates)
+
+    updates = queue.Queue()
+    for update_id in range(300):
+        chat_id = update_id % 7
+        body = {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': 'x',
+                                                   'chat': {'id': chat_id, 'type': 'private'}}}
+        updates.put((chat_id, json.dumps(body).encode()))
+    updates.put(None)
+    bot = Bot()
+    webhook.consume(bot, updates, lanes=3)
+
+    assert not bot.threaded and len(handled) == 300
+    for chat_id in range(7):
+        assert [update_id for chat, update_id in handled if chat == chat_id] == list(range(chat_id, 300, 7))
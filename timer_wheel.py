@@ -0,0 +1,111 @@
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TICK = 0.1      # seconds per tick
+SLOTS = 64      # slots per level, a power of two
+LEVELS = 4      # 64**4 ticks of 0.1s cover about 19 days
+
+
+class TimerWheel:
+    # Hierarchical timing wheel: LEVELS wheels of SLOTS slots, a slot of level
+    # n spanning SLOTS**n ticks. Scheduling and cancelling are O(1); a timer
+    # moves down a level at most LEVELS - 1 times before it fires. One thread
+    # advances the wheel every tick and calls on_expire(key) for the keys that
+    # are due. Scheduling a key again replaces its timer. Deadlines are in
+    # clock() seconds.
+
+    def __init__(self, on_expire, tick=TICK, slots=SLOTS, levels=LEVELS, clock=time.time):
+        self.on_expire = on_expire
+        self.tick = tick
+        self.levels = levels
+        self.clock = clock
+        self.fired = 0
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._span = 1 << (self._bits * levels)
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._timers = {}   # key -> (tick, slot holding the key)
+        self._current = int(clock() / tick)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def _insert(self, key, tick, soonest=1):
+        # Keys already due go in the next slot to be processed: the next tick's
+        # when scheduled, the current one's when cascaded from advance(), which
+        # has yet to empty it. Keys beyond the wheel's span sit in its last
+        # slot and are re-placed when cascaded.
+        delta = max(tick - self._current, soonest)
+        if delta >= self._span:
+            delta = self._span - 1
+        level = 0
+        while delta >= 1 << (self._bits * (level + 1)):
+            level += 1
+        slot = self._wheels[level][((self._current + delta) >> (self._bits * level)) & self._mask]
+        slot.add(key)
+        self._timers[key] = (tick, slot)
+
+    def schedule(self, key, deadline):
+        with self._lock:
+            self._cancel(key)
+            self._insert(key, math.ceil(deadline / self.tick))
+
+    def _cancel(self, key):
+        entry = self._timers.pop(key, None)
+        if entry is not None:
+            entry[1].discard(key)
+
+    def cancel(self, key):
+        with self._lock:
+            self._cancel(key)
+
+    def advance(self, now=None):
+        target = int((self.clock() if now is None else now) / self.tick)
+        expired = []
+        with self._lock:
+            while self._current < target:
+                self._current += 1
+                tick = self._current
+                # When the lower levels wrap, the current slot of each level
+                # above is redistributed, highest level first.
+                level = 1
+                while level < self.levels and tick & ((1 << (self._bits * level)) - 1) == 0:
+                    level += 1
+                for upper in range(level - 1, 0, -1):
+                    slot = self._wheels[upper][(tick >> (self._bits * upper)) & self._mask]
+                    keys = list(slot)
+                    slot.clear()
+                    for key in keys:
+                        self._insert(key, self._timers[key][0], 0)
+                slot = self._wheels[0][tick & self._mask]
+                for key in slot:
+                    del self._timers[key]
+                    expired.append(key)
+                slot.clear()
+        self.fired += len(expired)
+        for key in expired:
+            try:
+                self.on_expire(key)
+            except Exception:
+                logger.exception('timer %s failed', key)
+        return len(expired)
+
+    def _run(self):
+        while not self._stopped.wait(self.tick):
+            self.advance()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='timer-wheel', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,167 @@
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+import callbacks
+import matchmaking
+from lanes import LANES, Lanes
+
+logger = logging.getLogger(__name__)
+
+SHARD_ENV = 'CHESS_SHARD'
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+REPLICAS = 64        # points per shard on the hash ring
+QUEUE_SIZE = 10000   # updates buffered per shard before the front answers 503
+MATCHMAKING_SHARD = 0  # runs the global matchmaking queue, see shard_for()
+MATCHMAKING_COMMANDS = (matchmaking.SEEK_COMMAND, matchmaking.CANCEL_COMMAND)
+
+
+def _hash(value):
+    # Stable across processes and restarts, unlike hash() on strings.
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    # Consistent hashing: every shard owns REPLICAS points on a 64-bit ring and
+    # a key belongs to the first point at or after its hash. Adding or removing
+    # a shard only moves the keys next to its points, about 1/N of the chats.
+
+    def __init__(self, shards, replicas=REPLICAS):
+        points = sorted((_hash(f'{shard}:{replica}'), shard) for shard in range(shards) for replica in range(replicas))
+        self.shards = shards
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        i = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[i % len(self._owners)]
+
+
+def routing_key(update):
+    # A game never leaves the chat it was started in, so routing on the chat
+    # keeps every game, its challenge and its leaderboard on one shard.
+    callback = update.get('callback_query')
+    if callback is not None:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+    for kind in ('message', 'edited_message', 'my_chat_member', 'chat_member'):
+        if kind in update:
+            return update[kind]['chat']['id']
+    return update['update_id']
+
+
+def shard_for(ring, update, key):
+    # Chats are spread over the ring by their routing key, private ones too.
+    # Two exceptions keep matchmaking in one process: its commands go to
+    # MATCHMAKING_SHARD, which owns the global queue and so every matchmade
+    # game, and a board tap goes to the shard named in its game handle, since
+    # a matchmade game is played across two private chats.
+    callback = update.get('callback_query')
+    if callback is not None:
+        payload = callbacks.decode(callback.get('data') or '')
+        shard = callbacks.handle_shard(payload[2]) if payload is not None else None
+        if shard is not None and shard < ring.shards:
+            return shard
+    message = update.get('message')
+    if message is not None and message['chat'].get('type') == 'private' and \
+            (message.get('text') or '').lower() in MATCHMAKING_COMMANDS:
+        return MATCHMAKING_SHARD
+    return ring.shard_for(key)
+
+
+def _request_handler(ring, queues, path, secret):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_error(404)
+                return
+            if secret and self.headers.get(SECRET_HEADER) != secret:
+                self.send_error(403)
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                update = json.loads(body)
+                key = routing_key(update)
+                shard = shard_for(ring, update, key)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.send_error(400)
+                return
+            try:
+                queues[shard].put((key, body), timeout=1)
+            except queue.Full:
+                # Telegram redelivers updates that weren't acknowledged.
+                self.send_error(503)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return WebhookHandler
+
+
+def _process(bot, body):
+    try:
+        bot.process_new_updates([types.Update.de_json(body.decode('utf-8'))])
+    except Exception:
+        logger.exception('handling update failed')
+
+
+def consume(bot, updates, lanes=LANES):
+    # Runs in a worker process. All updates of a chat go to the same lane, a
+    # single thread, so they are handled in the order Telegram sent them while
+    # other chats proceed on the other lanes.
+    bot.threaded = False  # handlers run on the lane thread, not telebot's pool
+    chat_lanes = Lanes(lanes)
+    try:
+        while True:
+            item = updates.get()
+            if item is None:
+                break
+            key, body = item
+            chat_lanes.put(key, _process, bot, body)
+    finally:
+        chat_lanes.close()
+
+
+def run(target, shards, host='0.0.0.0', port=8443, path='/', secret=None):
+    # Receives webhook updates and forwards each to the worker process owning its
+    # chat. target(updates) is the worker's entry point; workers are spawned
+    # fresh, so it must be a module-level function, and they learn their shard
+    # number from SHARD_ENV before the bot module is imported.
+    ring = HashRing(shards)
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(QUEUE_SIZE) for _ in range(shards)]
+    workers = []
+    previous = os.environ.get(SHARD_ENV)
+    try:
+        for shard in range(shards):
+            os.environ[SHARD_ENV] = str(shard)
+            worker = context.Process(target=target, args=(queues[shard],), name=f'shard-{shard}')
+            worker.start()
+            workers.append(worker)
+    finally:
+        if previous is None:
+            os.environ.pop(SHARD_ENV, None)
+        else:
+            os.environ[SHARD_ENV] = previous
+
+    server = ThreadingHTTPServer((host, port), _request_handler(ring, queues, path, secret))
+    logger.info('webhook listening on %s:%d%s with %d shards', host, port, path, shards)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        for updates in queues:
+            updates.put(None)
+        for worker in workers:
+            worker.join()